@@ -0,0 +1,119 @@
+# fleet.py
+# 多进程模拟器：把 config.json 的盒子按 md5(serial) 分片到 N 个进程，
+# 每个进程一个事件循环、一个 httpx 客户端、一个时间轮（simulation.run_boxes），
+# 统计通过 Queue 汇总到父进程，每个周期打印一次全体合计。
+#
+#   python fleet.py --workers 8
+#   python fleet.py --workers 8 --replicate 2000   # 每个盒子复制 2000 份（serial 加后缀），做容量测试
+#   python fleet.py --workers 8 --inflight-per-worker 10   # 每个进程的在途请求上限（默认用 config 的 max_inflight）
+
+import argparse, asyncio, copy, hashlib, json, multiprocessing as mp, os, queue, time
+
+import simulation as sim
+
+
+def shard_of(box: dict, workers: int) -> int:
+    # 确定性分配：同一个盒子每次都落在同一个 worker 上（配置同步 / 相位都稳定）
+    key = str(box.get("serial_number") or box["name"])
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16) % workers
+
+
+def replicate(boxes: list[dict], n: int) -> list[dict]:
+    if n <= 1:
+        return boxes
+    out = []
+    for box in boxes:
+        for k in range(n):
+            b = copy.deepcopy(box)
+            b["serial_number"] = f"{box.get('serial_number') or box['name']}-{k:05d}"
+            b["name"] = f"{box['name']}-{k:05d}"
+            out.append(b)
+    return out
+
+
+async def _worker_async(idx: int, config: dict, boxes: list[dict], stats_q):
+    sim.apply_config(config)
+    stats_q.put((idx, "provisioning", {"boxes": len(boxes)}))
+    ready = [b for b in await asyncio.gather(*(sim.prepare_box(b) for b in boxes)) if b]
+    stats_q.put((idx, "ready", {"boxes": len(ready), "sensors": sum(len(b["sensors"]) for b in ready)}))
+    await sim.run_boxes(ready, emit=lambda snap: stats_q.put((idx, "stats", snap)))
+
+
+def _worker_main(idx: int, config: dict, boxes: list[dict], stats_q):
+    try:
+        asyncio.run(_worker_async(idx, config, boxes, stats_q))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-process fleet simulator")
+    ap.add_argument("--config", default="config.json")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--replicate", type=int, default=1, help="clone every box N times")
+    ap.add_argument("--inflight-per-worker", type=int, default=None,
+                    help="in-flight request cap for each worker (default: max_inflight from the config)")
+    args = ap.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    boxes = replicate(config["boxes"], args.replicate)
+    workers = max(1, min(args.workers, len(boxes)))
+
+    shards: list[list[dict]] = [[] for _ in range(workers)]
+    for box in boxes:
+        shards[shard_of(box, workers)].append(box)
+
+    # 在途请求上限是每个进程各自的：加进程就加并发，全体上限 = workers × inflight
+    per_worker = dict(config, boxes=None)
+    inflight = args.inflight_per_worker or int(config.get("max_inflight", sim.MAX_INFLIGHT))
+    per_worker["max_inflight"] = max(1, inflight)
+    period = float(config.get("period_seconds", sim.PERIOD_SEC))
+
+    stats_q = mp.Queue()
+    procs = [
+        mp.Process(target=_worker_main, args=(i, per_worker, shards[i], stats_q), daemon=True)
+        for i in range(workers) if shards[i]
+    ]
+    for p in procs:
+        p.start()
+    print(f"Started {len(procs)} workers for {len(boxes)} boxes: {[len(s) for s in shards]} "
+          f"(max_inflight {per_worker['max_inflight']}/worker, {per_worker['max_inflight'] * len(procs)} total)")
+
+    totals = {"sent": 0, "failed": 0, "batches": 0}
+    window: dict[int, dict] = {}
+    last_print = time.time()
+    try:
+        while any(p.is_alive() for p in procs):
+            try:
+                idx, kind, data = stats_q.get(timeout=1.0)
+            except queue.Empty:
+                idx, kind = None, None
+            if kind == "stats":
+                window[idx] = data
+                for k in totals:
+                    totals[k] += data[k]
+            elif kind is not None:
+                print(f"[worker {idx}] {kind} {data}")
+
+            if window and (len(window) >= len(procs) or time.time() - last_print >= period * 1.5):
+                agg = {k: sum(w[k] for w in window.values()) for k in ("sent", "failed", "batches", "inflight")}
+                lag = max(w["lag_ms_max"] for w in window.values())
+                print(time.strftime("[%Y-%m-%d %H:%M:%S]"),
+                      f"workers={len(window)} batches={agg['batches']} sent={agg['sent']} failed={agg['failed']} "
+                      f"inflight={agg['inflight']} max_lag={lag:.0f}ms | total sent={totals['sent']} "
+                      f"failed={totals['failed']} ({agg['sent'] / period:.0f} readings/s)")
+                window.clear()
+                last_print = time.time()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(timeout=5)
+        print(f"Stopped. total sent={totals['sent']} failed={totals['failed']} batches={totals['batches']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
-import asyncio, random, json, httpx, time, math, hashlib
+import asyncio, random, json, httpx, time, math, hashlib, uuid
+from datetime import datetime, timezone
 from urllib.parse import quote_plus
 
 SERVER = "http://localhost:8000"
 
 _httpx_client: httpx.AsyncClient | None = None
-_cfg_cache: dict[str, tuple[dict, float]] = {}
-CFG_TTL_SEC = 30.0
+_cfg_cache: dict[str, dict] = {}   # sensor_id -> 生效配置（开通时的 meta，叠加 /api/configs 推送的变更）
+CFG_SYNC_WAIT_SEC = 25.0           # 长轮询挂起时长
 
 # ====== 调度与限流参数（可在 config.json 覆盖）======
 PERIOD_SEC = 60.0         # 对齐周期：默认每整分
@@ -62,53 +63,59 @@ async def resolve_house_id(box: dict) -> str:
             return hid
     raise RuntimeError("house_id or householder is required in box definition")
 
-# -------------------- 传感器创建 --------------------
-async def create_sensor(box: dict, sensor: dict, house_id: str) -> dict:
+# -------------------- 整盒批量开通 --------------------
+async def provision_box(box: dict, house_id: str) -> list[dict]:
+    """一次请求开通整个盒子；服务端按 (serial, type) 幂等，重复运行不会重复建传感器。"""
     client = await get_client()
-    url = f"{SERVER}/sensors/?house_id={quote_plus(house_id)}"
-    serial = sensor.get("serial") or sensor.get("serial_number") or box.get("serial_number")
-
-    # 冗余写一些元信息，便于排查
-    meta = (sensor.get("meta") or {}) | {"house_id": house_id, "box": box.get("name")}
+    serial = box.get("serial_number")
+    if not serial:
+        raise RuntimeError("serial_number is required in box definition for bulk provisioning")
     payload = {
-        "name": f"{box['name']}_{sensor['name']}",
-        "type": sensor["type"],
+        "house_id": house_id,
+        "serial_number": serial,
         "location": box.get("location"),
-        "metadata": meta,
+        "sensors": [
+            {
+                "name": f"{box['name']}_{s['name']}",
+                "type": s["type"],
+                "metadata": (s.get("meta") or {}) | {"house_id": house_id, "box": box.get("name")},
+            }
+            for s in (box.get("sensors") or [])
+        ],
     }
-    if serial:
-        payload["serial_number"] = serial
-
-    print("POST", url, "payload.serial_number=", payload.get("serial_number"))
-    r = await client.post(url, json=payload)
+    r = await client.post(f"{SERVER}/sensors/provision", json=payload)
     r.raise_for_status()
-    return r.json()
-
-# -------------------- 配置读取（带缓存） --------------------
-async def fetch_config_raw(sensor_id: str, retries: int = 4, delay: float = 0.25) -> dict:
+    data = r.json()
+    print(f"Provisioned {box['name']} serial={serial}: created={data['created']} existing={data['existing']}")
+    return data["sensors"]
+
+# -------------------- 配置同步 --------------------
+async def config_sync_loop(sensor_ids: list[str]):
+    """
+    长轮询 /api/configs/sync：没有变更时一个请求挂 25s，有变更 1s 内送达。
+    cursor 每个循环各管各的：服务端会把过滤外的变更也算作扫过，共用一个 cursor 会让别组的变更被跳过。
+    """
+    cursor = 0  # 本组已同步到的配置 cursor
     client = await get_client()
-    for i in range(retries):
+    while True:
         try:
-            r = await client.get(f"{SERVER}/sensors/{sensor_id}")
+            r = await client.post(
+                f"{SERVER}/api/configs/sync",
+                json={"since": cursor, "sensor_ids": sensor_ids, "wait": CFG_SYNC_WAIT_SEC},
+                timeout=CFG_SYNC_WAIT_SEC + 10,
+            )
             if r.status_code == 200:
                 data = r.json()
-                cfg = data.get("meta") or data.get("metadata") or {}
-                return cfg or {}
-            return {}
-        except (httpx.RemoteProtocolError, httpx.ReadError, httpx.ConnectError, httpx.ReadTimeout):
-            await asyncio.sleep(delay * (2 ** i))
-    return {}
-
-async def fetch_config_with_cache(sensor_id: str) -> dict:
-    now = time.monotonic()
-    hit = _cfg_cache.get(sensor_id)
-    if hit and hit[1] > now:
-        return hit[0]
-    cfg = await fetch_config_raw(sensor_id)
-    if not isinstance(cfg, dict):
-        cfg = {}
-    _cfg_cache[sensor_id] = (cfg, now + CFG_TTL_SEC)
-    return cfg
+                for c in data.get("configs") or []:
+                    sid = str(c["sensor_id"])
+                    _cfg_cache[sid] = (_cfg_cache.get(sid) or {}) | (c.get("data") or {})
+                cursor = max(cursor, int(data.get("cursor") or 0))
+                continue
+            print(f"[WARN] config sync HTTP {r.status_code}")
+        except (httpx.HTTPError, ValueError) as e:
+            # 任何传输错误 / 坏 JSON 都只退避重试，不能冒泡到 run_boxes 的 gather 把整个进程带走
+            print(f"[WARN] config sync error: {e!r}")
+        await asyncio.sleep(1.0 + random.uniform(0, 1.0))
 
 # -------------------- 对齐调度（整分 + 稳定相位） --------------------
 def _next_tick(anchor: float, period: float) -> float:
@@ -116,38 +123,37 @@ def _next_tick(anchor: float, period: float) -> float:
     k = math.floor((now - anchor) / period) + 1
     return anchor + k * period
 
-async def _sleep_until(ts_epoch: float):
-    delay = ts_epoch - time.time()
-    if delay > 0:
-        await asyncio.sleep(delay)
-
 def _stable_phase_seconds(sensor_id: str, max_ms: int) -> float:
     h = hashlib.md5(sensor_id.encode("utf-8")).hexdigest()
     ms = int(h, 16) % max_ms
     return ms / 1000.0
 
-# -------------------- 写入读数（带重试 + 并发限流） --------------------
+# -------------------- 写入读数（整盒批量 + 重试 + 并发限流） --------------------
 def _should_retry_status(status: int) -> bool:
     return status == 429 or 500 <= status <= 599
 
-async def send_reading_with_retry(sensor_id: str, value: float, attributes: dict | None = None, max_retries: int = 3) -> bool:
+def _retry_delay(r: httpx.Response, attempt: int) -> float:
+    # 服务端过载时（429/503）会给 Retry-After；加抖动避免同一时刻一起重试
+    try:
+        base = float(r.headers.get("Retry-After", ""))
+    except ValueError:
+        base = 0.25 * (2 ** attempt)
+    return base + random.uniform(0, 0.25 + base / 2)
+
+async def send_batch_with_retry(readings: list[dict], max_retries: int = 3) -> bool:
+    """一个盒子一个周期的全部读数一次 POST；Idempotency-Key 在重试间保持不变。"""
     client = await get_client()
     sem = _get_sema()
-
-    # 组装 payload（保障可序列化）
-    payload = {"sensor_id": str(sensor_id), "value": float(value), "attributes": {}}
-    if attributes:
-        for k, v in attributes.items():
-            payload["attributes"][k] = v if isinstance(v, (str, int, float, bool)) or v is None else str(v)
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
 
     for attempt in range(max_retries + 1):
         try:
             async with sem:
-                r = await client.post(f"{SERVER}/ingest", json=payload)
+                r = await client.post(f"{SERVER}/ingest", json=readings, headers=headers)
             if r.status_code < 300:
                 return True
             if _should_retry_status(r.status_code) and attempt < max_retries:
-                await asyncio.sleep((0.25 * (2 ** attempt)) + random.uniform(0, 0.25))
+                await asyncio.sleep(_retry_delay(r, attempt))
                 continue
             else:
                 print(f"[WARN] ingest HTTP {r.status_code}: {r.text[:200]}")
@@ -162,85 +168,170 @@ async def send_reading_with_retry(sensor_id: str, value: float, attributes: dict
             print(f"[WARN] ingest unexpected error: {e!r}")
             return False
 
-# -------------------- 传感器循环（每周期一次，失败不退出） --------------------
-async def sensor_worker(box_def: dict, s: dict, server_obj: dict):
-    sid = server_obj["id"]                          # 服务器返回的传感器 UUID
-    phase = _stable_phase_seconds(sid, PHASE_MAX_MS)  # 0~PHASE_MAX_MS 毫秒稳定相位
-    anchor = 0.0                                    # 与 Unix 纪元对齐 → 整分/整5分等
-
-    # 首次对齐到 “整周期 + 固定相位”
-    first_tick = _next_tick(anchor, PERIOD_SEC) + phase
-    await _sleep_until(first_tick)
-
-    while True:
-        try:
-            # 若禁用则跳过本周期
-            if not s.get("enabled", True):
-                next_tick = _next_tick(anchor, PERIOD_SEC) + phase
-                await _sleep_until(next_tick)
-                continue
-
-            # 生成值：先读缓存配置，再从定义中兜底
-            cfg = await fetch_config_with_cache(sid)
-            base = s.get("meta") or {}
-            lo = float(cfg.get("min", base.get("min", 0)))
-            hi = float(cfg.get("max", base.get("max", 1)))
-            if hi < lo:
-                lo, hi = hi, lo
-            value = random.uniform(lo, hi)
-        except Exception as e:
-            print(f"[WARN] gen value failed for {sid}: {e}")
-            value = 0.0
-
-        serial_attr = s.get("serial") or s.get("serial_number") or box_def.get("serial_number")
-        ok = await send_reading_with_retry(
-            sid,
-            value,
-            {
+# -------------------- 时间轮调度 --------------------
+class TimerWheel:
+    """
+    哈希时间轮：一个驱动任务每 tick 推进一格，这一格里到期的条目一起交给 fire()。
+    条目按 ceil(到期时刻 / tick) 落到 slot；离现在超过一圈的记 rounds，每转过一次减一。
+    10 万个传感器也只有一个 sleep，不再是每个传感器各自一个任务 + 定时器。
+    """
+
+    def __init__(self, tick: float = 0.05, slots: int = 4096):
+        self.tick = tick
+        self.slots: list[list[list]] = [[] for _ in range(slots)]
+        self.cursor = math.floor(time.time() / tick)   # 下一个要处理的绝对 tick 序号
+        self.size = 0
+
+    def schedule(self, when: float, item):
+        t = max(math.ceil(when / self.tick), self.cursor)  # 已经过期的放到下一格
+        rounds = (t - self.cursor) // len(self.slots)
+        self.slots[t % len(self.slots)].append([rounds, when, item])
+        self.size += 1
+
+    def _advance(self) -> list[tuple[float, object]]:
+        bucket = self.slots[self.cursor % len(self.slots)]
+        due, keep = [], []
+        for entry in bucket:
+            if entry[0] == 0:
+                due.append((entry[1], entry[2]))
+            else:
+                entry[0] -= 1
+                keep.append(entry)
+        self.slots[self.cursor % len(self.slots)] = keep
+        self.cursor += 1
+        self.size -= len(due)
+        return due
+
+    async def run(self, fire):
+        while True:
+            delay = self.cursor * self.tick - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            due = self._advance()
+            if due:
+                fire(due)
+
+# -------------------- 盒子：开通 + 每周期一次批量上报 --------------------
+_stats = {"sent": 0, "failed": 0, "batches": 0, "lag_ms_max": 0.0}
+_inflight: set[asyncio.Task] = set()
+
+def _gen_value(s: dict, sid: str) -> float:
+    # 先读推送维护的配置缓存，再从定义中兜底（不在热路径上发请求）
+    try:
+        cfg = _cfg_cache.get(sid) or {}
+        base = s.get("meta") or {}
+        lo = float(cfg.get("min", base.get("min", 0)))
+        hi = float(cfg.get("max", base.get("max", 1)))
+        if hi < lo:
+            lo, hi = hi, lo
+        return random.uniform(lo, hi)
+    except Exception as e:
+        print(f"[WARN] gen value failed for {sid}: {e}")
+        return 0.0
+
+def _box_readings(box: dict, when: float) -> list[dict]:
+    box_def = box["def"]
+    # ts 用计划时刻（整周期 + 相位），重试 / 重放都是同一个 (sensor_id, ts)
+    ts = datetime.fromtimestamp(when, tz=timezone.utc).isoformat()
+    out = []
+    for s, resp in box["sensors"]:
+        if not s.get("enabled", True):
+            continue
+        sid = str(resp["id"])
+        out.append({
+            "sensor_id": sid,
+            "ts": ts,
+            "value": _gen_value(s, sid),
+            "attributes": {
                 "unit": s["type"],
                 "box": box_def["name"],
-                "serial_number": serial_attr,
+                "serial_number": s.get("serial") or s.get("serial_number") or box_def.get("serial_number"),
             },
-        )
-        print(time.strftime("[%Y-%m-%d %H:%M:%S]"),
-              f"{box_def['name']} {s['name']} -> {value:.2f} (phase {phase*1000:.0f}ms) ok={ok}")
-
-        # 睡到下一“整周期 + 固定相位”
-        next_tick = _next_tick(anchor, PERIOD_SEC) + phase
-        await _sleep_until(next_tick)
-
-# -------------------- Box 主流程 --------------------
-async def simulate_box(box_def: dict):
-    await get_client()  # 初始化 HTTP 客户端
-    house_id = await resolve_house_id(box_def)
-
-    # 1) 创建所有传感器
+        })
+    return out
+
+async def _send_box(readings: list[dict]):
+    ok = await send_batch_with_retry(readings)
+    _stats["batches"] += 1
+    _stats["sent" if ok else "failed"] += len(readings)
+
+async def prepare_box(box_def: dict) -> dict | None:
+    try:
+        async with _get_sema():
+            house_id = await resolve_house_id(box_def)
+            # 一次请求开通所有传感器（按 type 对回本地定义）
+            by_type = {x["type"]: x for x in await provision_box(box_def, house_id)}
+    except Exception as e:
+        print(f"[WARN] provisioning {box_def.get('name')} failed: {e!r}")
+        return None
     sensors = []
     for s in (box_def.get("sensors") or []):
-        resp = await create_sensor(box_def, s, house_id)
-        sensors.append({"def": s, "server": resp})
-        print(f"Created {resp['name']} id={resp['id']} enabled={s.get('enabled', True)}")
+        resp = by_type.get(s["type"])
+        if resp is None:
+            continue
+        sensors.append((s, resp))
+        _cfg_cache.setdefault(str(resp["id"]), resp.get("meta") or {})
+    # 整个盒子共用一个稳定相位：同一盒子的读数在同一时刻产生、一次上报
+    key = str(box_def.get("serial_number") or box_def["name"])
+    return {"def": box_def, "sensors": sensors, "phase": _stable_phase_seconds(key, PHASE_MAX_MS)}
 
-    # 2) 每个传感器一个独立任务：整分对齐 + 稳定相位 + 限流 + 重试
-    tasks = [asyncio.create_task(sensor_worker(box_def, s["def"], s["server"])) for s in sensors]
+async def stats_reporter(period: float, emit=None):
+    while True:
+        await asyncio.sleep(period)
+        snap = dict(_stats, inflight=len(_inflight))
+        _stats.update(sent=0, failed=0, batches=0, lag_ms_max=0.0)
+        if emit is not None:
+            emit(snap)
+        else:
+            print(time.strftime("[%Y-%m-%d %H:%M:%S]"),
+                  f"batches={snap['batches']} sent={snap['sent']} failed={snap['failed']} "
+                  f"inflight={snap['inflight']} max_lag={snap['lag_ms_max']:.0f}ms")
+
+async def run_boxes(boxes: list[dict], emit=None):
+    """所有盒子挂到一个时间轮上：整周期 + 盒子相位触发，每个盒子一次 list POST。"""
+    await get_client()
+    anchor = 0.0  # 与 Unix 纪元对齐 → 整分/整5分等
+    wheel = TimerWheel(tick=min(0.05, PERIOD_SEC / 20))
+    for box in boxes:
+        wheel.schedule(_next_tick(anchor, PERIOD_SEC) + box["phase"], box)
+
+    def fire(due):
+        now = time.time()
+        for when, box in due:
+            wheel.schedule(when + PERIOD_SEC, box)
+            _stats["lag_ms_max"] = max(_stats["lag_ms_max"], (now - when) * 1000.0)
+            readings = _box_readings(box, when)
+            if not readings:
+                continue
+            t = asyncio.create_task(_send_box(readings))
+            _inflight.add(t)
+            t.add_done_callback(_inflight.discard)
+
+    sensor_ids = [str(resp["id"]) for box in boxes for _, resp in box["sensors"]]
+    tasks = [asyncio.create_task(wheel.run(fire)), asyncio.create_task(stats_reporter(PERIOD_SEC, emit))]
+    # 配置同步按 5000 个传感器一组长轮询（服务端单次 limit 上限）
+    for k in range(0, len(sensor_ids), 5000):
+        tasks.append(asyncio.create_task(config_sync_loop(sensor_ids[k:k + 5000])))
+    print(f"Scheduled {len(boxes)} boxes / {len(sensor_ids)} sensors, period {PERIOD_SEC:.0f}s")
     await asyncio.gather(*tasks)
 
-# -------------------- 入口 --------------------
-async def main():
-    with open("config.json", "r", encoding="utf-8") as f:
-        config = json.load(f)
-
+def apply_config(config: dict):
     global SERVER, PERIOD_SEC, PHASE_MAX_MS, MAX_INFLIGHT, _sema
     SERVER = config.get("server_url", SERVER)
     PERIOD_SEC = float(config.get("period_seconds", PERIOD_SEC))          # 例如 60 或 300
     PHASE_MAX_MS = int(config.get("phase_max_ms", PHASE_MAX_MS))          # 例如 10000/15000/20000
     MAX_INFLIGHT = int(config.get("max_inflight", MAX_INFLIGHT))          # 例如 20/30/40
-
     # 以最新值重建限流信号量
     _sema = asyncio.Semaphore(MAX_INFLIGHT)
 
-    tasks = [simulate_box(box) for box in config["boxes"]]
-    await asyncio.gather(*tasks)
+# -------------------- 入口 --------------------
+async def main():
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+    apply_config(config)
+
+    ready = await asyncio.gather(*(prepare_box(box) for box in config["boxes"]))
+    await run_boxes([b for b in ready if b])
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,151 @@
+# app/admission.py
+# 准入控制：在取数据库连接之前限流，过载时尽早返回 429 + Retry-After，
+# 而不是让请求在连接池里排满 pool_timeout 再一起失败。
+#   - 每个预算（ingest / read）有独立的在途上限和排队上限，互不抢占
+#   - 队列满、或服务耗时（EWMA）已超过目标且开始排队、或预计等待超过排队超时 -> 直接拒绝
+# 预算按 worker 进程各自计算；默认在途上限 = 对应连接池的 pool_size + max_overflow。
+# 长连接（NDJSON 流、WebSocket）不走上面的控制器：一条流活几分钟，算进 EWMA 会让普通请求被误拒；
+# 它们只受 StreamBudget 的连接数上限约束。
+
+import asyncio
+import math
+import os
+import time
+from fastapi import HTTPException, status
+from .db import POOL_DEFAULTS, _pool_setting
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_LATENCY, ADMISSION_WAIT, ADMISSION_SHED
+
+EWMA_ALPHA = 0.2
+
+
+def _setting(name: str, key: str, default: float) -> float:
+    v = os.getenv(f"ADMISSION_{name.upper()}_{key}")
+    return type(default)(v) if v else default
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float, target_ms: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_ms = target_ms
+        self.in_flight = 0
+        self.queued = 0
+        self.ewma_ms = 0.0
+        self._sem = asyncio.Semaphore(max_in_flight)
+
+    @classmethod
+    def for_pool(cls, role: str) -> "AdmissionController":
+        size, overflow, _ = POOL_DEFAULTS[role]
+        limit = int(_pool_setting(role, "SIZE", size)) + int(_pool_setting(role, "OVERFLOW", overflow))
+        return cls(
+            role,
+            max_in_flight=int(_setting(role, "IN_FLIGHT", limit)),
+            max_queue=int(_setting(role, "QUEUE", limit * 4)),
+            queue_timeout=float(_setting(role, "QUEUE_TIMEOUT", 2.0)),
+            target_ms=float(_setting(role, "TARGET_MS", 250.0)),
+        )
+
+    def expected_wait(self) -> float:
+        # 前面排着的请求按当前服务耗时、以 max_in_flight 的并行度消化
+        return (self.queued + 1) / self.max_in_flight * self.ewma_ms / 1000.0
+
+    def _shed(self, reason: str):
+        ADMISSION_SHED.inc(1, self.name, reason)
+        retry = min(30, max(1, math.ceil(self.expected_wait())))
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"{self.name} overloaded ({reason}), retry later",
+            headers={"Retry-After": str(retry)},
+        )
+
+    def _gauges(self):
+        ADMISSION_IN_FLIGHT.set(self.in_flight, self.name)
+        ADMISSION_QUEUED.set(self.queued, self.name)
+
+    async def __call__(self):
+        """FastAPI 依赖：放在取连接的依赖之前（路由的 dependencies=[...]）。"""
+        if self.in_flight >= self.max_in_flight:
+            if self.queued >= self.max_queue:
+                self._shed("queue_full")
+            if self.ewma_ms > self.target_ms:
+                self._shed("latency")
+            if self.expected_wait() > self.queue_timeout:
+                self._shed("expected_wait")
+
+        t0 = time.perf_counter()
+        self.queued += 1
+        self._gauges()
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._shed("queue_timeout")
+        finally:
+            self.queued -= 1
+        ADMISSION_WAIT.observe(time.perf_counter() - t0, self.name)
+
+        self.in_flight += 1
+        self._gauges()
+        t1 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - t1) * 1000.0
+            self.ewma_ms = ms if self.ewma_ms == 0.0 else self.ewma_ms + EWMA_ALPHA * (ms - self.ewma_ms)
+            ADMISSION_LATENCY.set(self.ewma_ms / 1000.0, self.name)
+            self.in_flight -= 1
+            self._sem.release()
+            self._gauges()
+
+    def status(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "ewma_ms": round(self.ewma_ms, 2),
+            "target_ms": self.target_ms,
+        }
+
+
+class StreamBudget:
+    """长连接的并发上限：只数连接数，不排队、不参与服务耗时统计。"""
+
+    def __init__(self, name: str, max_streams: int):
+        self.name = name
+        self.max_streams = max_streams
+        self.active = 0
+
+    def try_acquire(self) -> bool:
+        if self.active >= self.max_streams:
+            ADMISSION_SHED.inc(1, self.name, "streams")
+            return False
+        self.active += 1
+        ADMISSION_IN_FLIGHT.set(self.active, self.name)
+        return True
+
+    def release(self):
+        self.active -= 1
+        ADMISSION_IN_FLIGHT.set(self.active, self.name)
+
+    async def __call__(self):
+        """FastAPI 依赖（HTTP 流式入口）；WebSocket 直接用 try_acquire / release。"""
+        if not self.try_acquire():
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"too many {self.name} connections, retry later",
+                headers={"Retry-After": "5"},
+            )
+        try:
+            yield
+        finally:
+            self.release()
+
+    def status(self) -> dict:
+        return {"active": self.active, "max_streams": self.max_streams}
+
+
+ingest_admission = AdmissionController.for_pool("ingest")
+ingest_streams = StreamBudget("ingest_stream", int(os.getenv("ADMISSION_INGEST_STREAMS", "64")))
+read_admission = AdmissionController.for_pool("read")
@@ -0,0 +1,115 @@
+# app/attr_sets.py
+# 读数属性拆分：
+#   静态部分（同一传感器每条都一样的 unit/box/serial_number）→ reading_attr_sets，一行只存 4 字节 id
+#   其余真正逐条变化的键 → 仍放在 sensor_readings.attributes
+# 读取时按 attr_set_id 合并回原来的 attributes 形状。
+
+import hashlib
+import json
+import os
+from typing import Any
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import ReadingAttrSet
+
+NORMALIZE_ATTRIBUTES = os.getenv("NORMALIZE_ATTRIBUTES", "1") == "1"
+STATIC_ATTR_KEYS = ("unit", "box", "serial_number")
+_CACHE_MAX = 100_000
+
+
+def _digest(data: dict) -> str:
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def split_attributes(attrs: dict[str, Any] | None) -> tuple[dict[str, Any], dict[str, Any] | None]:
+    """返回 (静态部分, 逐条部分)；逐条部分为空时返回 None（不存空 JSONB）。"""
+    if not attrs:
+        return {}, None
+    static = {k: attrs[k] for k in STATIC_ATTR_KEYS if k in attrs}
+    if not static:
+        return {}, attrs
+    extras = {k: v for k, v in attrs.items() if k not in static}
+    return static, extras or None
+
+
+def merge_attributes(static: dict | None, extras: dict | None) -> dict:
+    if not static:
+        return extras or {}
+    if not extras:
+        return dict(static)
+    return {**static, **extras}
+
+
+class AttrSetCache:
+    def __init__(self):
+        self._ids: dict[str, int] = {}     # digest -> id
+        self._data: dict[int, dict] = {}   # id -> data
+
+    def data_of(self, set_id: int | None) -> dict | None:
+        return self._data.get(set_id) if set_id is not None else None
+
+    async def resolve_many(self, db: AsyncSession, sets: list[dict]) -> tuple[list[int | None], dict]:
+        """
+        把一批静态属性映射成 id；未见过的一条 INSERT ... ON CONFLICT 补齐。
+        新 id 与调用方同一事务，返回的 pending 要在提交成功后 confirm() 才进缓存。
+        """
+        digests = [(_digest(d) if d else None) for d in sets]
+        missing: dict[str, dict] = {}
+        for d, data in zip(digests, sets):
+            if d is not None and d not in self._ids:
+                missing[d] = data
+        pending: dict[str, tuple[int, dict]] = {}
+        if missing:
+            stmt = (
+                pg_insert(ReadingAttrSet)
+                .values([{"digest": d, "data": data} for d, data in missing.items()])
+                .on_conflict_do_nothing(index_elements=[ReadingAttrSet.digest])
+            )
+            await db.execute(stmt)
+            q = select(ReadingAttrSet.digest, ReadingAttrSet.id).where(ReadingAttrSet.digest.in_(list(missing)))
+            for d, set_id in (await db.execute(q)).all():
+                pending[d] = (set_id, missing[d])
+        ids = []
+        for d in digests:
+            if d is None:
+                ids.append(None)
+            elif d in self._ids:
+                ids.append(self._ids[d])
+            else:
+                ids.append(pending[d][0] if d in pending else None)
+        return ids, pending
+
+    def confirm(self, pending: dict[str, tuple[int, dict]]):
+        if not pending:
+            return
+        if len(self._ids) + len(pending) > _CACHE_MAX:
+            self._ids.clear()
+            self._data.clear()
+        for d, (set_id, data) in pending.items():
+            self._ids[d] = set_id
+            self._data[set_id] = data
+
+
+attr_sets = AttrSetCache()
+
+
+async def normalize_rows(db: AsyncSession, rows: list[dict[str, Any]]) -> dict:
+    """
+    就地改写 ingest 的行：attributes 只保留逐条部分，并填好 attr_set_id。
+    返回值交给 attr_sets.confirm()（在 commit 之后调用）。
+    """
+    if not NORMALIZE_ATTRIBUTES:
+        for r in rows:
+            r["attr_set_id"] = None
+        return {}
+    statics = []
+    for r in rows:
+        static, extras = split_attributes(r.get("attributes"))
+        statics.append(static)
+        r["attributes"] = extras
+    ids, pending = await attr_sets.resolve_many(db, statics)
+    for r, set_id in zip(rows, ids):
+        r["attr_set_id"] = set_id
+    return pending
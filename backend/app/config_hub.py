@@ -0,0 +1,63 @@
+# app/config_hub.py
+# 传感器配置变更通知：进程内用 asyncio.Event 唤醒长轮询 / WebSocket，
+# 跨 worker 用 Postgres LISTEN/NOTIFY（频道 sensor_configs，payload 为最新 cursor）。
+
+import asyncio
+import os
+
+NOTIFY_CHANNEL = "sensor_configs"
+CONFIG_NOTIFY = os.getenv("CONFIG_NOTIFY", "1") == "1"
+
+
+class ConfigHub:
+    def __init__(self):
+        self.latest = 0            # 已知最大的 sensor_configs.id
+        self._event = asyncio.Event()
+        self._listen_conn = None
+
+    def publish(self, cursor: int):
+        if cursor <= self.latest:
+            return
+        self.latest = cursor
+        ev, self._event = self._event, asyncio.Event()
+        ev.set()
+
+    async def wait(self, since: int, timeout: float) -> bool:
+        """等到有比 since 新的变更（返回 True）或超时（False）。"""
+        if self.latest > since:
+            return True
+        ev = self._event
+        try:
+            await asyncio.wait_for(ev.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.latest > since
+
+    # -------------------- 跨进程：LISTEN/NOTIFY --------------------
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            self.publish(int(payload))
+        except ValueError:
+            pass
+
+    async def start(self, url):
+        # 独立的 asyncpg 连接（不占用连接池），整个进程生命周期内一直 LISTEN
+        if not CONFIG_NOTIFY or self._listen_conn is not None:
+            return
+        try:
+            import asyncpg
+            dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+            self._listen_conn = conn
+        except Exception as e:
+            print(f"[WARN] config LISTEN unavailable, falling back to in-process notify: {e!r}")
+
+    async def stop(self):
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is not None:
+            await conn.close()
+
+
+config_hub = ConfigHub()
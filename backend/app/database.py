@@ -1,16 +1,4 @@
-import os
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import declarative_base
-from dotenv import load_dotenv
-
-
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-Base = declarative_base()
-
-
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+# 兼容旧导入：所有引擎 / 会话统一由 app.db 的注册表提供
+from .db import DATABASE_URL, engine, registry, AsyncSessionLocal  # noqa
+from .deps import get_db  # noqa
+from .models import Base  # noqa
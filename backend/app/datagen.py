@@ -0,0 +1,529 @@
+# app/datagen.py
+# 压测数据集生成器：不经过 API，直接用 HomeEnvSim 生成住户 / 传感器 / 读数文件，再 COPY 进本地 Postgres。
+#
+#   python -m app.datagen generate --homes 5000 --start 2023-01-01 --days 730 --period 5 \
+#          --out /data/bench --workers 16 --format binary
+#   python -m app.datagen load /data/bench --jobs 8 --drop-indexes
+#
+# generate：
+#   - 住户 / 传感器是确定性的（id、serial、house_id、传感器 UUID 只取决于序号），写成 CSV；
+#   - 读数按 (一组住户, 一段时间) 切成任务，在进程池里并行生成，每个任务一个分片文件；
+#     每块都用 HomeEnvSim.seek()（计数器 RNG）起步：输出与 worker 数无关，同样参数 + 同样 TZ 逐字节可复现；
+#     （--chunk-days 不同的两次生成只在分块边界附近有预热残差，见 seek()）
+#   - 格式：csv / binary（PostgreSQL COPY 二进制，装载最快）/ parquet（需要 pyarrow，给离线分析用，load 不读）。
+# load：住户、传感器、读数依次 COPY；--drop-indexes 先删掉二级索引，装完再重建（十亿行级别快一个数量级）。
+# 目标是空库：住户 id 从 1 开始，和已有数据冲突时 COPY 会直接失败。
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import math
+import os
+import random
+import struct
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from .simulation.home_env_sim import HomeEnvSim, FIELDS, IDX
+from .utils import build_house_id
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except ImportError:  # pragma: no cover
+    HAVE_PYARROW = False
+
+# 传感器 type -> 模拟器字段（与 Simulation/config.json 的 type 一致）
+SENSOR_TYPES: dict[str, str] = {
+    "temperature": "temp_c",
+    "humidity": "rh_pct",
+    "co2": "co2_ppm",
+    "o2": "o2_pct",
+    "co": "co_ppm",
+    "pm2_5": "pm25_ugm3",
+    "sound_level": "noise_dba",
+    "no2": "no2_ppb",
+    "light": "lux",
+}
+PROFILE_MIX = "healthy=0.5,intermittent=0.3,chronic=0.2"
+FORMATS = ("csv", "binary", "parquet")
+EXT = {"csv": "csv", "binary": "pgcopy", "parquet": "parquet"}
+
+ZONES = ["N", "S", "W", "E", "C"]
+FIRST_NAMES = [
+    "Aroha", "Ben", "Chloe", "Daniel", "Emma", "Finn", "Grace", "Hemi", "Isla", "Jack", "Kiri", "Liam", "Mia",
+    "Noah", "Olivia", "Priya", "Quinn", "Ruby", "Sam", "Tama", "Uma", "Vera", "Wiremu", "Xavier", "Yuki", "Zoe",
+]
+# 前三个字母互不相同：house_id 只用姓的前三个字母
+LAST_NAMES = [
+    "Anderson", "Brown", "Chen", "Davies", "Edwards", "Fraser", "Gill", "Harris", "Ito", "Jones", "King", "Li",
+    "Martin", "Nguyen", "Olsen", "Patel", "Quinlan", "Robinson", "Singh", "Taylor", "Underwood", "Vaughan",
+    "Walker", "Xu", "Young", "Zhang", "Campbell", "Mitchell", "Thompson", "Wilson", "Parata", "Ngata",
+    "Kaur", "Lee", "Scott", "Hughes", "Bell", "Reid", "Murray", "Stewart",
+]
+STREETS = ["Queen St", "Victoria Rd", "Great North Rd", "Dominion Rd", "Kings Ave", "Beach Rd", "Hill St", "Park Tce"]
+
+HOUSEHOLD_COLUMNS = ["id", "serial_number", "householder", "phone", "email", "address", "zone", "house_id"]
+SENSOR_COLUMNS = ["id", "name", "type", "location", "serial_number", "owner_id", "meta"]
+READING_COLUMNS = ["sensor_id", "ts", "value"]
+FRAME_COLUMNS = ["serial_number", "ts"] + [f.name for f in FIELDS if f.name != "serial"]
+
+_NS = uuid.UUID("6f1c3c1e-5b7a-4d33-9b1e-2f1d0c6a8e42")  # 传感器 UUID 的命名空间（uuid5），勿改
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+# 按设备精度取整（FieldSpec.scale = 10^小数位）
+_DIGITS = {f.name: max(0, round(math.log10(f.scale))) for f in FIELDS}
+
+
+def _home_rng(seed: int, home: int, what: str) -> random.Random:
+    h = hashlib.blake2b(repr((seed, home, what)).encode("utf-8"), digest_size=8).digest()
+    return random.Random(int.from_bytes(h, "big"))
+
+
+def parse_mix(spec: str) -> list[tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        mix.append((name.strip(), float(w)))
+    total = sum(w for _, w in mix)
+    if total <= 0:
+        raise ValueError("profile mix weights must sum to > 0")
+    return [(name, w / total) for name, w in mix]
+
+
+# -------------------- 维表 --------------------
+
+def household_row(i: int) -> dict:
+    """第 i 户（0 起）。house_id = zone + 名首字母 + 姓前三位 + serial 末三位，按序号展开保证不重复。"""
+    combo, tail = divmod(i, 1000)
+    combo, z = divmod(combo, len(ZONES))
+    combo, f = divmod(combo, len(FIRST_NAMES))
+    if combo >= len(LAST_NAMES):
+        raise ValueError(f"at most {1000 * len(ZONES) * len(FIRST_NAMES) * len(LAST_NAMES)} households")
+    first, last = FIRST_NAMES[f], LAST_NAMES[combo]
+    serial = f"DG{i:07d}"
+    householder = f"{first} {last}"
+    return {
+        "id": i + 1,
+        "serial_number": serial,
+        "householder": householder,
+        "phone": f"021{i:07d}",
+        "email": f"{first}.{last}.{i}@example.com".lower(),
+        "address": f"{1 + i % 400} {STREETS[i % len(STREETS)]}",
+        "zone": ZONES[z],
+        "house_id": build_house_id(ZONES[z], householder, serial),
+    }
+
+
+def sensor_id(serial: str, sensor_type: str) -> uuid.UUID:
+    return uuid.uuid5(_NS, f"{serial}/{sensor_type}")
+
+
+def sensor_rows(home: dict, types: list[str]) -> list[dict]:
+    out = []
+    for t in types:
+        spec = FIELDS[IDX[SENSOR_TYPES[t]]]
+        out.append({
+            "id": sensor_id(home["serial_number"], t),
+            "name": t,
+            "type": t,
+            "location": "home",
+            "serial_number": home["serial_number"],
+            "owner_id": home["id"],
+            "meta": {"min": spec.lo, "max": spec.hi, "unit": spec.unit},
+        })
+    return out
+
+
+def home_profile(seed: int, i: int, mix: list[tuple[str, float]]) -> str:
+    x = _home_rng(seed, i, "profile").random()
+    for name, w in mix:
+        if x < w:
+            return name
+        x -= w
+    return mix[-1][0]
+
+
+# -------------------- 输出格式 --------------------
+
+class _CsvSink:
+    def __init__(self, path: str, columns: list[str]):
+        self.f = open(path, "w", encoding="utf-8", newline="", buffering=1 << 20)
+        self.f.write(",".join(columns) + "\n")
+
+    def add(self, row: tuple):
+        self.f.write(",".join(map(str, row)) + "\n")
+
+    def close(self):
+        self.f.close()
+
+
+class _BinarySink:
+    """PostgreSQL COPY BINARY：uuid / timestamptz / float8 / float4 / text。"""
+    _HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+
+    def __init__(self, path: str, columns: list[str], kinds: str):
+        self.f = open(path, "wb", buffering=1 << 20)
+        self.f.write(self._HEADER)
+        self.kinds = kinds
+        self._readings = struct.Struct(">hi16siqid")  # 3 列：uuid, timestamptz, float8
+        self._frame_tail = struct.Struct(">iq" + "if" * (len(columns) - 2))
+
+    def add(self, row: tuple):
+        if self.kinds == "readings":
+            sid, ts_us, value = row
+            self.f.write(self._readings.pack(3, 16, sid, 8, ts_us, 8, value))
+        else:
+            serial, ts_us, *vals = row
+            b = serial.encode("utf-8")
+            parts = [8, ts_us]
+            for v in vals:
+                parts += (4, v)
+            self.f.write(struct.pack(">hi", len(vals) + 2, len(b)) + b + self._frame_tail.pack(*parts))
+
+    def close(self):
+        self.f.write(struct.pack(">h", -1))
+        self.f.close()
+
+
+class _ParquetSink:
+    ROW_GROUP = 1_000_000
+
+    def __init__(self, path: str, columns: list[str], kinds: str):
+        if kinds == "readings":
+            fields = [("sensor_id", pa.string()), ("ts", pa.timestamp("us", tz="UTC")), ("value", pa.float64())]
+        else:
+            fields = [("serial_number", pa.string()), ("ts", pa.timestamp("us", tz="UTC"))]
+            fields += [(c, pa.float32()) for c in columns[2:]]
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.cols: list[list] = [[] for _ in fields]
+
+    def add(self, row: tuple):
+        for col, v in zip(self.cols, row):
+            col.append(v)
+        if len(self.cols[0]) >= self.ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self.cols[0]:
+            self.writer.write_table(pa.table(dict(zip(self.schema.names, self.cols)), schema=self.schema))
+            self.cols = [[] for _ in self.cols]
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def _open_sinks(base: str, kinds: str, columns: list[str], formats: list[str]) -> list[tuple[str, object]]:
+    sinks = []
+    for fmt in formats:
+        path = f"{base}.{EXT[fmt]}"
+        if fmt == "csv":
+            sinks.append((fmt, _CsvSink(path, columns)))
+        elif fmt == "binary":
+            sinks.append((fmt, _BinarySink(path, columns, kinds)))
+        else:
+            sinks.append((fmt, _ParquetSink(path, columns, kinds)))
+    return sinks
+
+
+# -------------------- 读数生成（进程池任务） --------------------
+
+def _gen_task(task: dict) -> dict:
+    """一组住户 × 一段时间 -> 每种格式一个分片文件。模块级函数，供进程池 pickle。"""
+    period = timedelta(minutes=task["period"])
+    span_start = datetime.fromisoformat(task["span_start"])
+    t_start = datetime.fromisoformat(task["start"])
+    t_end = datetime.fromisoformat(task["end"])
+    types = task["types"]
+    fields = [SENSOR_TYPES[t] for t in types]
+    digits = [_DIGITS[f] for f in fields]
+    frame_fields = FRAME_COLUMNS[2:]
+    formats = task["formats"]
+    base = os.path.join(task["out"], "readings", f"part-{task['index']:05d}")
+    readings = _open_sinks(base, "readings", READING_COLUMNS, formats)
+    frames = []
+    if task["frames"]:
+        frames = _open_sinks(os.path.join(task["out"], "frames", f"part-{task['index']:05d}"), "frames", FRAME_COLUMNS, formats)
+
+    n_readings = n_frames = 0
+    for i, profile in task["homes"]:
+        home = household_row(i)
+        serial = home["serial_number"]
+        sids = [sensor_id(serial, t) for t in types]
+        sid_out = {"csv": [str(s) for s in sids], "binary": [s.bytes for s in sids], "parquet": [str(s) for s in sids]}
+        sim = HomeEnvSim(
+            profile=profile, period_minutes=task["period"], serial=i & 0xFFFF, seed=task["seed"], home=i,
+            start_bat_mv=_home_rng(task["seed"], i, "battery").uniform(3900.0, 4300.0),
+            battery_origin=span_start,
+        )
+        # 第一块也 seek：所有分块都接在同一条已预热的时间线上，不会出现冷启动段
+        sim.seek(t_start)
+        t = t_start
+        while t < t_end:
+            esp = sim.next_read(t)
+            ts_us = (t - _PG_EPOCH) // timedelta(microseconds=1)
+            ts_iso = t.isoformat()
+            values = [round(esp[f], d) for f, d in zip(fields, digits)]
+            for fmt, sink in readings:
+                ts = ts_iso if fmt == "csv" else (ts_us if fmt == "binary" else t)
+                ids = sid_out[fmt]
+                for k, v in enumerate(values):
+                    sink.add((ids[k], ts, v))
+            if frames:
+                fvals = [round(esp[f], _DIGITS[f]) for f in frame_fields]
+                for fmt, sink in frames:
+                    ts = ts_iso if fmt == "csv" else (ts_us if fmt == "binary" else t)
+                    sink.add((serial, ts, *fvals))
+                n_frames += 1
+            n_readings += len(values)
+            t += period
+
+    files = {"readings": {}, "frames": {}}
+    for kind, sinks in (("readings", readings), ("frames", frames)):
+        for fmt, sink in sinks:
+            sink.close()
+            name = os.path.join(kind, f"part-{task['index']:05d}.{EXT[fmt]}")
+            files[kind][fmt] = name
+    return {"index": task["index"], "readings": n_readings, "frames": n_frames, "files": files}
+
+
+def plan_tasks(
+    homes: list[tuple[int, str]], start: datetime, end: datetime, chunk_days: float, homes_per_task: int
+) -> list[tuple[list, datetime, datetime]]:
+    spans = []
+    if chunk_days > 0:
+        t = start
+        while t < end:
+            spans.append((t, min(end, t + timedelta(days=chunk_days))))
+            t = spans[-1][1]
+    else:
+        spans.append((start, end))
+    return [
+        (homes[k:k + homes_per_task], a, b)
+        for k in range(0, len(homes), homes_per_task)
+        for a, b in spans
+    ]
+
+
+def generate(args) -> dict:
+    formats = [f.strip() for f in args.format.split(",") if f.strip()]
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise SystemExit(f"unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+    if "parquet" in formats and not HAVE_PYARROW:
+        raise SystemExit("parquet output needs pyarrow (pip install pyarrow)")
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    for t in types:
+        if t not in SENSOR_TYPES:
+            raise SystemExit(f"unknown sensor type {t!r}; choose from {', '.join(SENSOR_TYPES)}")
+    mix = parse_mix(args.profile_mix)
+
+    start = datetime.fromisoformat(args.start)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    period = timedelta(minutes=args.period)
+    start -= (start - _PG_EPOCH) % period  # 对齐采样周期，分块边界与连续运行一致
+    end = start + timedelta(days=args.days)
+
+    os.makedirs(os.path.join(args.out, "readings"), exist_ok=True)
+    if args.frames:
+        os.makedirs(os.path.join(args.out, "frames"), exist_ok=True)
+
+    # 维表（小，单进程写 CSV）
+    homes = []
+    n_sensors = 0
+    with open(os.path.join(args.out, "households.csv"), "w", encoding="utf-8", newline="") as fh, \
+         open(os.path.join(args.out, "sensors.csv"), "w", encoding="utf-8", newline="") as fs:
+        wh = csv.DictWriter(fh, HOUSEHOLD_COLUMNS)
+        ws = csv.DictWriter(fs, SENSOR_COLUMNS)
+        wh.writeheader()
+        ws.writeheader()
+        for i in range(args.homes):
+            home = household_row(i)
+            wh.writerow(home)
+            for s in sensor_rows(home, types):
+                ws.writerow({**s, "meta": json.dumps(s["meta"])})
+                n_sensors += 1
+            homes.append((i, home_profile(args.seed, i, mix)))
+
+    workers = max(1, args.workers)
+    per_task = args.homes_per_task or max(1, math.ceil(args.homes / (workers * 4)))
+    plan = plan_tasks(homes, start, end, args.chunk_days, per_task)
+    tasks = [
+        {
+            "index": k, "homes": h, "start": a.isoformat(), "end": b.isoformat(), "span_start": start.isoformat(),
+            "period": args.period, "seed": args.seed, "types": types, "formats": formats,
+            "frames": args.frames, "out": args.out,
+        }
+        for k, (h, a, b) in enumerate(plan)
+    ]
+    expected = args.homes * len(types) * int((end - start) / period)
+    print(f"[datagen] {args.homes} homes, {n_sensors} sensors, ~{expected:,} readings in {len(tasks)} tasks "
+          f"on {workers} workers -> {args.out}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futs = [pool.submit(_gen_task, t) for t in tasks]
+        done_rows = 0
+        for fut in as_completed(futs):
+            res = fut.result()
+            results.append(res)
+            done_rows += res["readings"]
+            el = time.perf_counter() - t0
+            print(f"[datagen] {len(results)}/{len(tasks)} tasks, {done_rows:,} readings, "
+                  f"{done_rows / max(el, 1e-9):,.0f} rows/s", file=sys.stderr)
+    results.sort(key=lambda r: r["index"])
+
+    manifest = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "tz": time.strftime("%z"),  # HomeEnvSim 按本地时区算昼夜，复现时需要同一个 TZ
+        "params": {
+            "homes": args.homes, "start": start.isoformat(), "days": args.days, "period": args.period,
+            "seed": args.seed, "types": types, "profile_mix": args.profile_mix, "chunk_days": args.chunk_days,
+            "formats": formats, "frames": args.frames,
+        },
+        "households": args.homes,
+        "sensors": n_sensors,
+        "readings": sum(r["readings"] for r in results),
+        "frames": sum(r["frames"] for r in results),
+        "seconds": round(time.perf_counter() - t0, 1),
+        "files": {
+            "households": "households.csv",
+            "sensors": "sensors.csv",
+            "readings": {fmt: [r["files"]["readings"][fmt] for r in results] for fmt in formats},
+            "frames": {fmt: [r["files"]["frames"][fmt] for r in results] for fmt in formats} if args.frames else {},
+        },
+    }
+    with open(os.path.join(args.out, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# -------------------- 装载 --------------------
+
+async def _secondary_indexes(conn, table: str) -> list[tuple[str, str]]:
+    from sqlalchemy import text
+    rows = await conn.execute(text(
+        "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+        "WHERE i.schemaname = current_schema() AND i.tablename = :t "
+        "AND i.indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = CAST(:t AS regclass))"
+    ), {"t": table})
+    return [(r.indexname, r.indexdef) for r in rows]
+
+
+async def load(out_dir: str, jobs: int, drop_indexes: bool, fmt: str | None) -> dict:
+    from sqlalchemy import text
+    from .db import registry
+
+    with open(os.path.join(out_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    files = manifest["files"]
+    fmt = fmt or ("binary" if "binary" in files["readings"] else "csv")
+    if fmt not in files["readings"]:
+        raise SystemExit(f"dataset has no {fmt} files (have: {', '.join(files['readings'])})")
+    engine = registry.engine("jobs")
+    t0 = time.perf_counter()
+
+    async with engine.begin() as conn:
+        driver = (await conn.get_raw_connection()).driver_connection
+        await driver.copy_to_table(
+            "households", source=os.path.join(out_dir, files["households"]),
+            columns=HOUSEHOLD_COLUMNS, format="csv", header=True,
+        )
+        await driver.copy_to_table(
+            "sensors", source=os.path.join(out_dir, files["sensors"]),
+            columns=SENSOR_COLUMNS, format="csv", header=True,
+        )
+        await conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('households', 'id'), (SELECT max(id) FROM households))"
+        ))
+    print(f"[load] {manifest['households']} households, {manifest['sensors']} sensors", file=sys.stderr)
+
+    targets = [("sensor_readings", READING_COLUMNS, files["readings"][fmt])]
+    if files.get("frames"):
+        targets.append(("box_frames", FRAME_COLUMNS, files["frames"][fmt]))
+
+    for table, columns, parts in targets:
+        dropped: list[tuple[str, str]] = []
+        if drop_indexes:
+            async with engine.begin() as conn:
+                dropped = await _secondary_indexes(conn, table)
+                for name, _ in dropped:
+                    await conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+            print(f"[load] dropped {len(dropped)} indexes on {table}", file=sys.stderr)
+
+        sem = asyncio.Semaphore(max(1, jobs))
+        done = [0]
+
+        async def _one(part: str):
+            async with sem, engine.begin() as conn:
+                await conn.execute(text("SET LOCAL synchronous_commit = off"))
+                driver = (await conn.get_raw_connection()).driver_connection
+                await driver.copy_to_table(
+                    table, source=os.path.join(out_dir, part), columns=columns,
+                    format=fmt, **({"header": True} if fmt == "csv" else {}),
+                )
+            done[0] += 1
+            print(f"[load] {table}: {done[0]}/{len(parts)} files", file=sys.stderr)
+
+        await asyncio.gather(*(_one(p) for p in parts))
+
+        # 重建索引：一次建一个，给足 maintenance_work_mem；唯一索引失败说明库里原本就有重叠数据
+        for name, ddl in dropped:
+            async with engine.begin() as conn:
+                await conn.execute(text("SET LOCAL maintenance_work_mem = '1GB'"))
+                await conn.execute(text(ddl))
+            print(f"[load] rebuilt {name}", file=sys.stderr)
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"ANALYZE {table}"))
+
+    await registry.dispose()
+    return {"format": fmt, "readings": manifest["readings"], "frames": manifest["frames"],
+            "seconds": round(time.perf_counter() - t0, 1)}
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="Synthetic dataset generator for load tests")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    g = sub.add_parser("generate", help="generate households, sensors and readings files")
+    g.add_argument("--homes", type=int, default=1000)
+    g.add_argument("--start", default="2024-01-01T00:00:00+00:00")
+    g.add_argument("--days", type=float, default=30)
+    g.add_argument("--period", type=int, default=5, help="minutes between readings")
+    g.add_argument("--seed", type=int, default=1)
+    g.add_argument("--types", default=",".join(SENSOR_TYPES), help="sensor types per home")
+    g.add_argument("--profile-mix", default=PROFILE_MIX)
+    g.add_argument("--format", default="binary", help=f"comma-separated: {', '.join(FORMATS)}")
+    g.add_argument("--frames", action="store_true", help="also write box_frames files")
+    g.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    g.add_argument("--homes-per-task", type=int, default=0, help="0 = spread homes over ~4 tasks per worker")
+    g.add_argument("--chunk-days", type=float, default=0,
+                   help="also split time into chunks of N days (uses seek(); useful for few homes x long spans)")
+    g.add_argument("--out", required=True)
+
+    l = sub.add_parser("load", help="COPY a generated dataset into DATABASE_URL")
+    l.add_argument("out")
+    l.add_argument("--jobs", type=int, default=4, help="files loaded concurrently")
+    l.add_argument("--format", choices=["csv", "binary"], help="default: binary if present")
+    l.add_argument("--drop-indexes", action="store_true", help="drop secondary indexes during the load, rebuild after")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "generate":
+        out = generate(args)
+        out = {k: out[k] for k in ("households", "sensors", "readings", "frames", "seconds")}
+    else:
+        out = asyncio.run(load(args.out, args.jobs, args.drop_indexes, args.format))
+    print(json.dumps(out))
+
+
+if __name__ == "__main__":
+    main()
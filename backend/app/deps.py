@@ -1,7 +1,37 @@
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Callable
+from fastapi import HTTPException, status
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession
-from .db import AsyncSessionLocal
+from .db import registry
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSessionLocal() as session:
-        yield session
+
+def _session_dependency(role: str) -> Callable[[], AsyncGenerator[AsyncSession, None]]:
+    maker = registry.sessionmaker(role)
+    stats = registry.stats(role)
+
+    async def _get_db() -> AsyncGenerator[AsyncSession, None]:
+        async with maker() as session:
+            # 立即取连接，顺便记录排队等待时间与超时次数
+            t0 = time.perf_counter()
+            try:
+                await session.connection()
+            except PoolTimeoutError:
+                stats.timeouts += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"database pool '{role}' exhausted",
+                    headers={"Retry-After": "1"},
+                )
+            stats.record_wait(time.perf_counter() - t0)
+            yield session
+
+    return _get_db
+
+
+# 交互式读（默认）
+get_db = _session_dependency("read")
+# /ingest 写入
+get_ingest_db = _session_dependency("ingest")
+# 后台任务 / 批量导入
+get_job_db = _session_dependency("jobs")
@@ -0,0 +1,121 @@
+# app/downsample.py
+# 图表降采样：把聚合后的序列压到 max_points 个点以内（前端 SVG 只有几百像素宽）。
+#   lttb   —— Largest-Triangle-Three-Buckets：保留视觉形状；每个桶里若有越过 THRESHOLDS 线的点，
+#             选中的点一定是越线最严重的那个，超标的尖峰不会被平滑掉
+#   minmax —— 按时间等分成 (max_points-2)/2 个像素列，每列保留最小值和最大值（包络线），尖峰天然保留；
+#             max_points=3 时只有一列，min / max 里留离首尾连线更远的那个
+# 用 numpy 向量化；没有 numpy 时退回纯 Python 的 minmax。
+
+from datetime import datetime
+from typing import Sequence
+
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except ImportError:  # pragma: no cover
+    HAVE_NUMPY = False
+
+METHODS = ("lttb", "minmax")
+MIN_POINTS = 3
+
+
+def _severity(y, lines: Sequence[dict]):
+    """每个点越过阈值线的程度（>0 表示超标）；没有阈值线时返回 None。"""
+    sev = None
+    for ln in lines or ():
+        v = float(ln["value"])
+        s = (y - v) if ln.get("kind") == "upper" else (v - y)
+        sev = s if sev is None else np.maximum(sev, s)
+    return sev
+
+
+def lttb_indices(x, y, n_out: int, severity=None):
+    n = len(x)
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.arange(n)
+    # 首尾固定，中间 n_out-2 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], edges[i + 2]
+        else:
+            nlo, nhi = n - 1, n
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        k = int(area.argmax())
+        if severity is not None:
+            s = severity[lo:hi]
+            worst = int(s.argmax())
+            if s[worst] > 0:
+                k = worst
+        a = lo + k
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(x, y, n_out: int):
+    n = len(x)
+    cols = max(1, (n_out - 2) // 2)  # 每列 2 个点 + 首尾
+    if n <= n_out:
+        return np.arange(n)
+    # 按时间等分像素列（数据有缺口时列里可能没有点）
+    col = np.minimum(((x - x[0]) / max(x[-1] - x[0], 1e-9) * cols).astype(np.int64), cols - 1)
+    order = np.lexsort((y, col))           # 先按列，列内按值
+    col_sorted = col[order]
+    starts = np.flatnonzero(np.r_[True, col_sorted[1:] != col_sorted[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    keep = np.unique(np.concatenate([order[starts], order[ends], [0, n - 1]]))
+    if len(keep) > n_out:
+        inner = keep[1:-1]
+        dev = np.abs(y[inner] - (y[0] + (y[-1] - y[0]) * (x[inner] - x[0]) / max(x[-1] - x[0], 1e-9)))
+        keep = np.sort(np.r_[0, inner[np.argsort(-dev, kind="stable")[:n_out - 2]], n - 1])
+    return keep
+
+
+def _minmax_py(labels: list, data: list, n_out: int) -> tuple[list, list]:
+    cols = max(1, (n_out - 2) // 2)
+    t0, t1 = labels[0].timestamp(), labels[-1].timestamp()
+    span = max(t1 - t0, 1e-9)
+    best: dict[int, list[int]] = {}
+    for i, (t, v) in enumerate(zip(labels, data)):
+        c = min(int((t.timestamp() - t0) / span * cols), cols - 1)
+        b = best.get(c)
+        if b is None:
+            best[c] = [i, i]
+        else:
+            if v < data[b[0]]: b[0] = i
+            if v > data[b[1]]: b[1] = i
+    keep = sorted({0, len(data) - 1, *(i for b in best.values() for i in b)})
+    if len(keep) > n_out:
+        y0, y1 = data[0], data[-1]
+
+        def dev(i):
+            return abs(data[i] - (y0 + (y1 - y0) * (labels[i].timestamp() - t0) / span))
+        inner = sorted(keep[1:-1], key=dev, reverse=True)[:n_out - 2]
+        keep = [0, *sorted(inner), len(data) - 1]
+    return [labels[i] for i in keep], [data[i] for i in keep]
+
+
+def downsample(
+    labels: list[datetime], data: list[float], max_points: int, method: str = "lttb", lines: Sequence[dict] = (),
+) -> tuple[list[datetime], list[float]]:
+    """labels 升序、data 无 None（_aggregate 的输出）。点数不超过 max_points 时原样返回。"""
+    if method not in METHODS:
+        raise ValueError(f"downsample must be one of {', '.join(METHODS)}")
+    max_points = max(MIN_POINTS, int(max_points))
+    if len(data) <= max_points:
+        return labels, data
+    if not HAVE_NUMPY:
+        return _minmax_py(labels, data, max_points)
+
+    x = np.fromiter((d.timestamp() for d in labels), dtype=np.float64, count=len(labels))
+    y = np.asarray(data, dtype=np.float64)
+    if method == "minmax":
+        idx = minmax_indices(x, y, max_points)
+    else:
+        idx = lttb_indices(x, y, max_points, _severity(y, lines))
+    return [labels[i] for i in idx.tolist()], y[idx].tolist()
@@ -0,0 +1,91 @@
+# app/executors.py
+# 把 CPU 密集 / 阻塞的工作挪出事件循环：
+#   run_cpu() —— 进程池（模拟器生成窗口、批量解码帧），绕开 GIL
+#   run_io()  —— 线程池（阻塞的文件 / 第三方同步库调用）
+# 每个池有独立的排队上限（信号量），满了直接抛 ExecutorBusy，由路由转成 503 + Retry-After；
+# 超时 / 客户端断开时取消还没开始的任务（进程池里已在跑的任务无法中断，只能等它结束）。
+# 池在第一次使用时创建，lifespan 结束时 shutdown()。
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from .metrics import EXECUTOR_TASKS, EXECUTOR_SECONDS, EXECUTOR_QUEUED
+
+CPU_WORKERS = int(os.getenv("EXEC_CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+IO_THREADS = int(os.getenv("EXEC_IO_THREADS", "8"))
+# 同时提交（在跑 + 排队）的任务上限
+CPU_MAX_PENDING = int(os.getenv("EXEC_CPU_MAX_PENDING", str(CPU_WORKERS * 4)))
+IO_MAX_PENDING = int(os.getenv("EXEC_IO_MAX_PENDING", str(IO_THREADS * 8)))
+DEFAULT_TIMEOUT = float(os.getenv("EXEC_TIMEOUT_SEC", "60"))
+
+
+class ExecutorBusy(RuntimeError):
+    pass
+
+
+class _Pool:
+    def __init__(self, name: str, factory, max_pending: int):
+        self.name = name
+        self._factory = factory
+        self._pool: Executor | None = None
+        self._slots = asyncio.Semaphore(max_pending)
+        self.pending = 0
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            self._pool = self._factory()
+        return self._pool
+
+    async def run(self, fn, *args, timeout: float | None = DEFAULT_TIMEOUT, label: str | None = None):
+        label = label or getattr(fn, "__name__", "task")
+        if self._slots.locked():
+            EXECUTOR_TASKS.inc(1, self.name, label, "rejected")
+            raise ExecutorBusy(f"{self.name} executor is saturated")
+        async with self._slots:
+            self.pending += 1
+            EXECUTOR_QUEUED.set(self.pending, self.name)
+            t0 = time.perf_counter()
+            fut = asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+            outcome = "ok"
+            try:
+                return await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                # wait_for 超时 / 取消时已经对 fut 调了 cancel()：还在排队的任务不会再执行
+                self.pending -= 1
+                EXECUTOR_QUEUED.set(self.pending, self.name)
+                EXECUTOR_TASKS.inc(1, self.name, label, outcome)
+                EXECUTOR_SECONDS.observe(time.perf_counter() - t0, self.name, label)
+
+    def shutdown(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+cpu_pool = _Pool("cpu", lambda: ProcessPoolExecutor(max_workers=CPU_WORKERS), CPU_MAX_PENDING)
+io_pool = _Pool("io", lambda: ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io"), IO_MAX_PENDING)
+
+
+async def run_cpu(fn, *args, timeout: float | None = DEFAULT_TIMEOUT, label: str | None = None):
+    """fn 和参数必须可 pickle（模块级函数 + 普通数据）。"""
+    return await cpu_pool.run(fn, *args, timeout=timeout, label=label)
+
+
+async def run_io(fn, *args, timeout: float | None = DEFAULT_TIMEOUT, label: str | None = None):
+    return await io_pool.run(fn, *args, timeout=timeout, label=label)
+
+
+def shutdown_executors():
+    cpu_pool.shutdown()
+    io_pool.shutdown()
@@ -0,0 +1,152 @@
+# app/frames.py
+# 整帧存储（box_frames）的写入与查询适配：
+#   - frame_row()：把解码后的帧（或 22 字节原始 payload）变成一行 box_frames
+#   - frame_series() / frame_readings()：让 metric_timeseries / query_readings 从宽表读
+#   - frames_to_readings()：把帧拆成逐传感器的读数（LoRa UDP 走 sensor_readings 的路径）
+# FRAME_STORAGE=1 时读路径优先使用 box_frames（没有数据时回退到 sensor_readings）。
+
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any
+from uuid import UUID
+from sqlalchemy import select, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import BoxFrame, Sensor
+from .simulation.lorawan_decode import FIELDS, decode_lorawan
+
+FRAME_STORAGE = os.getenv("FRAME_STORAGE", "0") == "1"
+# LoRa 设备 -> 盒子 serial 的映射文件（JSON：{"<DevAddr 十六进制或帧里的 u16 serial>": "<serial_number>"}）；
+# 不在文件里的按 sensors.meta->>'lora_id' 找盒子
+LORA_DEVICE_MAP_PATH = os.getenv("LORA_DEVICE_MAP", "")
+
+
+def _load_device_map(path: str) -> dict[str, str]:
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {str(k).upper(): str(v) for k, v in json.load(f).items()}
+
+
+LORA_DEVICE_MAP = _load_device_map(LORA_DEVICE_MAP_PATH)
+
+FRAME_FIELDS = [f.name for f in FIELDS if f.name != "serial"]
+FRAME_BYTES = 2 * len(FIELDS)  # 22 字节
+
+# metric key（/api/charts/metrics）或传感器 type -> box_frames 列
+FRAME_COLUMNS: dict[str, str] = {
+    "temp": "temp_c", "temperature": "temp_c", "temp_c": "temp_c",
+    "rh": "rh_pct", "humidity": "rh_pct", "rh_pct": "rh_pct",
+    "co2": "co2_ppm", "co2_ppm": "co2_ppm",
+    "o2": "o2_pct", "o2_pct": "o2_pct",
+    "co": "co_ppm", "co_ppm": "co_ppm",
+    "pm25": "pm25_ugm3", "pm2_5": "pm25_ugm3", "pm2.5": "pm25_ugm3", "pm25_ugm3": "pm25_ugm3",
+    "noise_night": "noise_dba", "noise": "noise_dba", "sound_level": "noise_dba", "noise_dba": "noise_dba",
+    "no2": "no2_ppb", "no2_ppb": "no2_ppb",
+    "light_night": "lux", "light": "lux", "lux": "lux",
+    "battery": "bat_mv", "bat_mv": "bat_mv",
+}
+
+
+def frame_column(metric_or_type: str):
+    name = FRAME_COLUMNS.get((metric_or_type or "").lower())
+    return getattr(BoxFrame, name) if name else None
+
+
+def frame_row(decoded: dict[str, Any], ts: datetime, serial_number: str | None = None) -> dict[str, Any]:
+    row = {"serial_number": serial_number or str(decoded.get("serial")), "ts": ts}
+    for name in FRAME_FIELDS:
+        v = decoded.get(name)
+        row[name] = float(v) if v is not None else None
+    return row
+
+
+def decode_frame(payload: bytes, ts: datetime | None = None, serial_number: str | None = None) -> dict[str, Any]:
+    return frame_row(decode_lorawan(payload), ts or datetime.now(timezone.utc), serial_number)
+
+
+async def insert_frames(db: AsyncSession, rows: list[dict[str, Any]]) -> int:
+    """批量写入；(serial_number, ts) 主键冲突的重复帧直接丢弃。返回实际写入行数。"""
+    if not rows:
+        return 0
+    stmt = pg_insert(BoxFrame).values(rows).on_conflict_do_nothing().returning(BoxFrame.ts)
+    return len((await db.execute(stmt)).all())
+
+
+async def frame_series(
+    db: AsyncSession, serial: str, columns: list[str], start: datetime, end: datetime
+) -> list[tuple]:
+    """一次 (serial_number, ts) 主键范围扫描取出多个字段：[(ts, v1, v2, ...), ...]"""
+    cols = [getattr(BoxFrame, c) for c in columns]
+    stmt = (
+        select(BoxFrame.ts, *cols)
+        .where(BoxFrame.serial_number == serial, BoxFrame.ts >= start, BoxFrame.ts <= end)
+        .order_by(BoxFrame.ts.asc())
+    )
+    return (await db.execute(stmt)).all()
+
+
+async def frame_readings(
+    db: AsyncSession, sensor_id: UUID, start: datetime | None, end: datetime | None, limit: int
+) -> list[dict] | None:
+    """
+    按 sensor_readings 的返回形状读宽表：传感器的 (serial_number, type) 决定取哪一行哪一列。
+    传感器没有 serial 或 type 不对应任何字段时返回 None（调用方回退到 sensor_readings）。
+    """
+    s = (await db.execute(select(Sensor.serial_number, Sensor.type).where(Sensor.id == sensor_id))).first()
+    if s is None or not s.serial_number:
+        return None
+    col = frame_column(s.type)
+    if col is None:
+        return None
+    stmt = select(BoxFrame.ts, col).where(BoxFrame.serial_number == s.serial_number, col.is_not(None))
+    if start:
+        stmt = stmt.where(BoxFrame.ts >= start)
+    if end:
+        stmt = stmt.where(BoxFrame.ts <= end)
+    rows = (await db.execute(stmt.order_by(BoxFrame.ts.desc()).limit(limit))).all()
+    if not rows:
+        return None
+    return [
+        {"id": None, "sensor_id": sensor_id, "ts": ts, "value": v, "attributes": {"source": "frame"}}
+        for ts, v in rows[::-1]
+    ]
+
+
+async def frames_to_readings(
+    db: AsyncSession, frames: list[dict[str, Any]], source: str,
+) -> tuple[list[dict], list[dict], int]:
+    """
+    frames 的 serial_number 是设备标识（DevAddr 或 u16 serial）。解析成盒子后按盒子里每个传感器的 type
+    取对应字段，生成 write_readings 的行。返回 (读数, serial 换成盒子后的帧, 找不到盒子的帧数)。
+    """
+    keys = {str(f["serial_number"]).upper() for f in frames}
+    mapped = {k: LORA_DEVICE_MAP.get(k, k) for k in keys}
+    lora_id = Sensor.meta.op("->>")("lora_id")
+    rows = (await db.execute(
+        select(Sensor.id, Sensor.type, Sensor.serial_number, lora_id)
+        .where(or_(Sensor.serial_number.in_(set(mapped.values())), lora_id.in_(keys)))
+    )).all()
+    sensors: dict[str, list[tuple[UUID, str]]] = {}
+    for sid, typ, serial, lid in rows:
+        col = FRAME_COLUMNS.get((typ or "").lower())
+        if col and serial:
+            sensors.setdefault(serial, []).append((sid, col))
+        # 优先级：映射文件 > meta.lora_id > 设备标识本身就是 serial_number
+        if lid and serial and str(lid).upper() in keys and str(lid).upper() not in LORA_DEVICE_MAP:
+            mapped[str(lid).upper()] = serial
+
+    readings, boxed, unmatched = [], [], 0
+    for f in frames:
+        serial = mapped.get(str(f["serial_number"]).upper())
+        targets = sensors.get(serial) if serial else None
+        if not targets:
+            unmatched += 1
+            continue
+        boxed.append({**f, "serial_number": serial})
+        for sid, col in targets:
+            v = f.get(col)
+            if v is not None:
+                readings.append({"sensor_id": sid, "ts": f["ts"], "value": v, "attributes": {"source": source}})
+    return readings, boxed, unmatched
@@ -0,0 +1,135 @@
+# app/household_import.py
+# 批量导入住户：一次性计算 house_id，集合式检测批内 / 库内冲突，
+# INSERT ... ON CONFLICT DO NOTHING RETURNING 兜底并发注册，逐行返回结果。
+#
+# CLI:  python -m app.household_import households.csv [--chunk 1000]
+# CSV 表头需包含 serial_number,householder,phone,email,address,zone
+
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from typing import Any
+from pydantic import ValidationError
+from sqlalchemy import select, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Household
+from .schemas import RegisterIn
+from .utils import build_house_id
+
+CHUNK_SIZE = 1000  # 每条 INSERT 的行数（7 列 × 1000 远低于 asyncpg 的参数上限）
+
+
+async def import_households(db: AsyncSession, rows: list[dict[str, Any]], chunk_size: int = CHUNK_SIZE) -> list[dict]:
+    results: list[dict] = [{"row": i, "status": "pending"} for i in range(len(rows))]
+    pending: list[tuple[int, RegisterIn, str]] = []
+
+    # 1) 逐行校验 + 预先算好 house_id
+    for i, raw in enumerate(rows):
+        try:
+            data = RegisterIn.model_validate(raw)
+        except ValidationError as e:
+            results[i].update(status="invalid", error=e.errors(include_url=False, include_context=False))
+            continue
+        hid = build_house_id(data.zone, data.householder, data.serial_number)
+        results[i].update(serial_number=data.serial_number, house_id=hid)
+        pending.append((i, data, hid))
+
+    # 2) 批内冲突：先到先得
+    seen_serial: set[str] = set()
+    seen_hid: set[str] = set()
+    batch_ok = []
+    for i, data, hid in pending:
+        if data.serial_number in seen_serial:
+            results[i].update(status="duplicate_in_batch", error="Serial number repeated in batch")
+        elif hid in seen_hid:
+            results[i].update(status="duplicate_in_batch", error="House ID repeated in batch")
+        else:
+            seen_serial.add(data.serial_number)
+            seen_hid.add(hid)
+            batch_ok.append((i, data, hid))
+
+    # 3) 库内冲突：一条集合查询
+    existing_serial: set[str] = set()
+    existing_hid: set[str] = set()
+    for k in range(0, len(batch_ok), chunk_size):
+        part = batch_ok[k:k + chunk_size]
+        q = select(Household.serial_number, Household.house_id).where(or_(
+            Household.serial_number.in_([d.serial_number for _, d, _ in part]),
+            Household.house_id.in_([h for _, _, h in part]),
+        ))
+        for sn, hid in (await db.execute(q)).all():
+            existing_serial.add(sn)
+            existing_hid.add(hid)
+
+    to_insert = []
+    for i, data, hid in batch_ok:
+        if data.serial_number in existing_serial:
+            results[i].update(status="conflict", error="Serial number already exists")
+        elif hid in existing_hid:
+            results[i].update(status="conflict", error="House ID conflict")
+        else:
+            to_insert.append((i, data, hid))
+
+    # 4) 插入；查询之后才落库的并发注册由 ON CONFLICT DO NOTHING 接住
+    for k in range(0, len(to_insert), chunk_size):
+        part = to_insert[k:k + chunk_size]
+        values = [
+            {
+                "serial_number": d.serial_number,
+                "householder": d.householder,
+                "phone": d.phone,
+                "email": d.email,
+                "address": d.address,
+                "zone": d.zone,
+                "house_id": hid,
+            }
+            for _, d, hid in part
+        ]
+        stmt = pg_insert(Household).values(values).on_conflict_do_nothing().returning(Household.serial_number)
+        inserted = set((await db.execute(stmt)).scalars().all())
+        for i, d, _ in part:
+            if d.serial_number in inserted:
+                results[i]["status"] = "created"
+            else:
+                results[i].update(status="conflict", error="Registered concurrently")
+    await db.commit()
+    return results
+
+
+def summarize(results: list[dict]) -> dict:
+    counts: dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return counts
+
+
+async def _main(path: str, chunk_size: int, out: str | None):
+    from .db import registry
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = [dict(r) for r in csv.DictReader(f)]
+
+    async with registry.sessionmaker("jobs")() as db:
+        results = await import_households(db, rows, chunk_size)
+    await registry.dispose()
+
+    print(json.dumps(summarize(results)))
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    else:
+        for r in results:
+            if r["status"] != "created":
+                print(json.dumps(r, ensure_ascii=False, default=str), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Bulk-import households from a CSV file")
+    ap.add_argument("csv_path")
+    ap.add_argument("--chunk", type=int, default=CHUNK_SIZE)
+    ap.add_argument("--out", help="write per-row results as JSON to this file")
+    args = ap.parse_args()
+    asyncio.run(_main(args.csv_path, args.chunk, args.out))
@@ -0,0 +1,448 @@
+# app/ingest_pipeline.py
+# 读数 / 整帧的校验与写库，供 /ingest 各入口（HTTP、流式、LoRa UDP）共用：
+#   coerce_row() / coerce_frame()  —— 单条校验，失败抛 BadReading
+#   write_readings() / backfill_readings() / write_frames() —— 一个批次一个事务
+#   write_frame_readings() —— 按设备标识找到盒子，把帧拆成读数再 write_readings()
+#   IngestBatcher —— 把连续到达的读数攒成批次写库，并维护已提交的 offset
+
+import asyncio
+import base64
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import UUID
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import SensorReading
+from .metrics import INGEST_ROWS, INGEST_DUPLICATES, FRAMES_DECODED, FRAMES_UNMATCHED
+from .live_cache import last_values, RecentKeys
+from .frames import decode_frame, frame_row, insert_frames, frames_to_readings, FRAME_STORAGE
+from .attr_sets import attr_sets, normalize_rows
+from .serialization import dumps_json
+from .rollups import add_readings as add_to_rollups, rollup_ctes, ROLLUPS_ENABLED
+
+# 设备时间戳的时钟偏差策略：超前服务端超过 INGEST_MAX_FUTURE_SEC 的读数
+#   clamp  -> 改成服务端当前时间（默认）
+#   reject -> 整批 400
+#   server -> 忽略设备时间，全部用服务端时间
+INGEST_SKEW_POLICY = os.getenv("INGEST_SKEW_POLICY", "clamp")
+INGEST_MAX_FUTURE_SEC = float(os.getenv("INGEST_MAX_FUTURE_SEC", "300"))
+BACKFILL_CHUNK = int(os.getenv("BACKFILL_CHUNK", "5000"))
+# 流式入口的攒批：满 BATCH_MAX_ROWS 条或距上次写库 BATCH_MAX_DELAY_MS 就提交一次
+BATCH_MAX_ROWS = int(os.getenv("INGEST_BATCH_MAX_ROWS", "2000"))
+BATCH_MAX_DELAY_MS = float(os.getenv("INGEST_BATCH_MAX_DELAY_MS", "200"))
+
+# 幂等：(sensor_id, ts) 唯一索引是最终保证；进程内 LRU 只负责在进库前挡掉明显的重发
+_recent_keys = RecentKeys(int(os.getenv("INGEST_RECENT_KEYS", "200000")))
+
+
+class BadReading(ValueError):
+    pass
+
+
+class _ServerClock:
+    """
+    服务端打的时间戳：进程内严格递增（同一微秒内的依次 +1µs）。
+    没带 ts、被 clamp 或 INGEST_SKEW_POLICY=server 的读数都用它，否则同一批里同一传感器的多条
+    会落在同一个 (sensor_id, ts) 上，被唯一索引当成重复丢掉。
+    """
+
+    def __init__(self):
+        self._last: datetime | None = None
+
+    def stamp(self, now: datetime) -> datetime:
+        if self._last is not None and now <= self._last:
+            now = self._last + timedelta(microseconds=1)
+        self._last = now
+        return now
+
+
+server_clock = _ServerClock()
+
+
+def parse_ts(raw: Any, now: datetime) -> datetime:
+    """ISO 字符串或 epoch（秒 / 毫秒自动识别）-> 带时区的 UTC 时间；缺省为服务端时间（server_clock）。"""
+    if raw is None or raw == "" or INGEST_SKEW_POLICY == "server":
+        return server_clock.stamp(now)
+    if isinstance(raw, datetime):
+        ts = raw
+    elif isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        ts = datetime.fromtimestamp(raw / 1000.0 if raw > 1e11 else raw, tz=timezone.utc)
+    else:
+        s = str(raw).strip()
+        try:
+            num = float(s)
+        except ValueError:
+            ts = datetime.fromisoformat(s.replace("Z", "+00:00"))
+        else:
+            return parse_ts(num, now)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    if (ts - now).total_seconds() > INGEST_MAX_FUTURE_SEC:
+        if INGEST_SKEW_POLICY == "reject":
+            raise ValueError(f"timestamp {ts.isoformat()} is in the future")
+        return server_clock.stamp(now)
+    return ts
+
+
+def coerce_row(row: dict[str, Any], now: datetime | None = None) -> dict[str, Any]:
+    now = now or datetime.now(timezone.utc)
+    try:
+        sid = UUID(str(row["sensor_id"]))
+        val = float(row["value"])
+    except Exception:
+        raise BadReading("bad sensor_id or value")
+    attrs = row.get("attributes") or {}
+    if not isinstance(attrs, dict):
+        attrs = {}
+    # 老的模拟器把时间放在 attributes.ts 里
+    try:
+        ts = parse_ts(row.get("ts") if row.get("ts") is not None else attrs.get("ts"), now)
+    except (ValueError, TypeError, OverflowError, OSError) as e:
+        raise BadReading(f"bad ts: {e}")
+    return {"sensor_id": sid, "ts": ts, "value": val, "attributes": attrs}
+
+
+def _frame_of(row: dict[str, Any]) -> tuple[dict[str, Any], bool]:
+    """-> (box_frames 行, 是否从原始 payload 解码)"""
+    serial = row.get("serial_number") or row.get("serial")
+    try:
+        ts = parse_ts(row.get("ts"), datetime.now(timezone.utc))
+        if row.get("payload_hex"):
+            return decode_frame(bytes.fromhex(row["payload_hex"]), ts, serial and str(serial)), True
+        if row.get("payload_b64"):
+            return decode_frame(base64.b64decode(row["payload_b64"]), ts, serial and str(serial)), True
+        out = frame_row(row, ts, serial and str(serial))
+    except (ValueError, TypeError) as e:
+        raise BadReading(f"bad frame: {e}")
+    if not out["serial_number"] or out["serial_number"] == "None":
+        raise BadReading("serial_number is required")
+    return out, False
+
+
+def coerce_frame(row: dict[str, Any], source: str = "http") -> dict[str, Any]:
+    out, decoded = _frame_of(row)
+    if decoded:
+        FRAMES_DECODED.inc(1, source)
+    return out
+
+
+def coerce_frames(rows: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], int]:
+    """批量版：不碰进程内指标，可以丢进进程池（executors.run_cpu）。返回 (行, 解码的帧数)。"""
+    out, decoded = [], 0
+    for r in rows:
+        frame, d = _frame_of(r)
+        out.append(frame)
+        decoded += d
+    return out, decoded
+
+
+def _drop_seen(data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """去掉批内重复和最近已提交过的 (sensor_id, ts)。"""
+    out, seen = [], set()
+    for r in data:
+        key = (r["sensor_id"], r["ts"])
+        if key in seen or key in _recent_keys:
+            continue
+        seen.add(key)
+        out.append(r)
+    return out
+
+
+async def write_readings(db: AsyncSession, data: list[dict[str, Any]]) -> dict:
+    """实时写入一个批次：去重 -> 属性规范化 -> INSERT ... ON CONFLICT DO NOTHING -> 更新缓存。"""
+    total = len(data)
+    fresh = _drop_seen(data)
+    if len(fresh) < total:
+        INGEST_DUPLICATES.inc(total - len(fresh), "memory")
+    if not fresh:
+        return {"ok": True, "n": 0, "accepted": 0, "dropped": total}
+
+    # 写入只做一件事：插入。不要在这里查 sensor、做逐行逻辑
+    # （唯一的例外是 metric_rollups：插入后一条集合语句，按真正插入的行累加，见 rollups.py）
+    # 可选：降低持久化延迟（掉电可能丢最近几条）——提升吞吐
+    await db.execute(text("SET LOCAL synchronous_commit = OFF"))
+
+    # 缓存里保留完整 attributes；入库前把 unit/box/serial_number 抽到 reading_attr_sets
+    full_attrs = [r["attributes"] for r in fresh]
+    pending = await normalize_rows(db, fresh)
+
+    stmt = (
+        pg_insert(SensorReading)
+        .values(fresh)
+        .on_conflict_do_nothing(index_elements=[SensorReading.sensor_id, SensorReading.ts])
+        .returning(SensorReading.sensor_id, SensorReading.ts)
+    )
+    inserted = set((await db.execute(stmt)).all())
+    await add_to_rollups(db, [
+        (r["sensor_id"], r["ts"], r["value"]) for r in fresh if (r["sensor_id"], r["ts"]) in inserted
+    ])
+    await db.commit()
+    attr_sets.confirm(pending)
+    INGEST_ROWS.inc(len(inserted))
+    if len(inserted) < len(fresh):
+        INGEST_DUPLICATES.inc(len(fresh) - len(inserted), "db")
+
+    # 提交成功后再更新最新值缓存（乱序到达的旧读数不会覆盖更新的值）
+    for r, attrs in zip(fresh, full_attrs):
+        key = (r["sensor_id"], r["ts"])
+        _recent_keys.add(key)
+        if key in inserted:
+            last_values.update(r["sensor_id"], r["ts"], r["value"], attrs)
+    return {"ok": True, "n": len(inserted), "accepted": len(inserted), "dropped": total - len(inserted)}
+
+
+# -------------------- 历史回填 --------------------
+
+_COPY_COLUMNS = ["sensor_id", "ts", "value", "attributes", "attr_set_id"]
+_COLS_SQL = ", ".join(_COPY_COLUMNS)
+
+
+async def _copy_readings(db: AsyncSession, rows: list[dict[str, Any]]) -> int:
+    """
+    asyncpg 下先 COPY 进临时表（二进制协议，一次往返一个分块），再一条
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING 合并；其他驱动退回分块 INSERT。
+    真正插入的行同时累加进 metric_rollups（同一事务）。返回实际写入的行数。
+    """
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    driver = getattr(raw, "driver_connection", None)
+    if not hasattr(driver, "copy_records_to_table"):
+        n = 0
+        for k in range(0, len(rows), BACKFILL_CHUNK):
+            stmt = (
+                pg_insert(SensorReading)
+                .values(rows[k:k + BACKFILL_CHUNK])
+                .on_conflict_do_nothing(index_elements=[SensorReading.sensor_id, SensorReading.ts])
+                .returning(SensorReading.sensor_id, SensorReading.ts, SensorReading.value)
+            )
+            ins = (await db.execute(stmt)).all()
+            await add_to_rollups(db, [tuple(r) for r in ins])
+            n += len(ins)
+        return n
+
+    await db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS _backfill_readings "
+        "(sensor_id UUID, ts TIMESTAMPTZ, value DOUBLE PRECISION, attributes JSONB, attr_set_id INTEGER) "
+        "ON COMMIT DELETE ROWS"
+    ))
+    for k in range(0, len(rows), BACKFILL_CHUNK):
+        records = [
+            (
+                r["sensor_id"], r["ts"], r["value"],
+                dumps_json(r["attributes"]).decode("utf-8") if r["attributes"] is not None else None,
+                r["attr_set_id"],
+            )
+            for r in rows[k:k + BACKFILL_CHUNK]
+        ]
+        await driver.copy_records_to_table("_backfill_readings", records=records, columns=_COPY_COLUMNS)
+    merge = (
+        f"INSERT INTO sensor_readings ({_COLS_SQL}) "
+        f"SELECT DISTINCT ON (sensor_id, ts) {_COLS_SQL} FROM _backfill_readings ORDER BY sensor_id, ts "
+        "ON CONFLICT (sensor_id, ts) DO NOTHING"
+    )
+    if not ROLLUPS_ENABLED:
+        return (await db.execute(text(merge))).rowcount
+    # 合并与累加放在一条语句里：RETURNING 的就是真正插入的行，不用回传到客户端
+    res = await db.execute(text(
+        f"WITH ins AS ({merge} RETURNING sensor_id, ts, value), {rollup_ctes('ins r')} "
+        "SELECT count(*) FROM ins"
+    ))
+    return res.scalar()
+
+
+async def backfill_readings(db: AsyncSession, data: list[dict[str, Any]]) -> dict:
+    """
+    大批量历史读数：不做逐行的实时缓存更新，整批写入后每个传感器只取最新一条
+    去更新最新值缓存（比缓存里旧才覆盖）。
+    """
+    if not data:
+        return {"ok": True, "n": 0, "accepted": 0, "dropped": 0}
+
+    newest: dict[UUID, tuple[datetime, float, dict]] = {}
+    for r in data:
+        cur = newest.get(r["sensor_id"])
+        if cur is None or r["ts"] > cur[0]:
+            newest[r["sensor_id"]] = (r["ts"], r["value"], r["attributes"])
+
+    await db.execute(text("SET LOCAL synchronous_commit = OFF"))
+    pending = await normalize_rows(db, data)
+    accepted = await _copy_readings(db, data)
+    await db.commit()
+    attr_sets.confirm(pending)
+    INGEST_ROWS.inc(accepted)
+    if accepted < len(data):
+        INGEST_DUPLICATES.inc(len(data) - accepted, "db")
+
+    for sid, (ts, value, attrs) in newest.items():
+        last_values.update(sid, ts, value, attrs)
+    return {
+        "ok": True,
+        "n": accepted,
+        "accepted": accepted,
+        "dropped": len(data) - accepted,
+        "sensors": len(newest),
+        "start_ts": min(r["ts"] for r in data),
+        "end_ts": max(r["ts"] for r in data),
+    }
+
+
+async def write_frames(db: AsyncSession, frames: list[dict[str, Any]]) -> dict:
+    if not frames:
+        return {"ok": True, "n": 0, "dropped": 0}
+    await db.execute(text("SET LOCAL synchronous_commit = OFF"))
+    n = await insert_frames(db, frames)
+    await db.commit()
+    return {"ok": True, "n": n, "dropped": len(frames) - n}
+
+
+async def write_frame_readings(db: AsyncSession, frames: list[dict[str, Any]], source: str) -> dict:
+    """帧 -> 逐传感器读数 -> write_readings；FRAME_STORAGE=1 时整帧也写一份（serial 换成盒子的）。"""
+    readings, boxed, unmatched = await frames_to_readings(db, frames, source)
+    if unmatched:
+        FRAMES_UNMATCHED.inc(unmatched, source)
+    out = await write_readings(db, readings) if readings else {"ok": True, "n": 0, "dropped": 0}
+    if FRAME_STORAGE and boxed:
+        await write_frames(db, boxed)
+    return {"ok": True, "n": out["n"], "dropped": out["dropped"], "unmatched": unmatched}
+
+
+# -------------------- 流式攒批 --------------------
+
+class IngestBatcher:
+    """
+    连续到达的读数 / 整帧在内存里攒批，由一个后台任务按条数或时间触发写库。
+    offset 为累计收到的条数；committed 为已经提交（或判定为重复丢弃）的 offset，
+    客户端断线重连后从 committed 之后重发即可（重复的 (sensor_id, ts) 会被丢掉）。
+    写库失败时 error 被置上、后台任务退出，由调用方决定断开还是重建。
+    frames_as_readings 不为空时整帧按 write_frame_readings 拆成读数写入（值为来源标签），
+    此时 accepted / dropped 按读数条数计。
+    """
+
+    def __init__(
+        self, sessionmaker, max_rows: int = BATCH_MAX_ROWS, max_delay_ms: float = BATCH_MAX_DELAY_MS,
+        keep_going: bool = False, frames_as_readings: str | None = None,
+    ):
+        self._maker = sessionmaker
+        self.keep_going = keep_going  # True：写库失败只记日志、丢掉该批，继续处理后面的（UDP 这类无法重发的来源）
+        self.frames_as_readings = frames_as_readings
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000.0
+        self.readings: list[dict] = []
+        self.frames: list[dict] = []
+        self.offset = 0
+        self.committed = 0
+        self.accepted = 0
+        self.dropped = 0
+        self.invalid = 0
+        self.failed = 0
+        self.error: Exception | None = None
+        self._closing = False
+        self._wake = asyncio.Event()
+        self._committed_ev = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def add_reading(self, row: dict[str, Any]):
+        self.readings.append(row)
+        self._added()
+
+    def add_frame(self, row: dict[str, Any]):
+        self.frames.append(row)
+        self._added()
+
+    def skip(self, n: int = 1):
+        # 校验失败的条目也占 offset，方便客户端对齐
+        self.offset += n
+        self.invalid += n
+
+    def _added(self):
+        self.offset += 1
+        if len(self.readings) + len(self.frames) >= self.max_rows:
+            self._wake.set()
+
+    @property
+    def backlog(self) -> int:
+        return len(self.readings) + len(self.frames)
+
+    async def flush(self):
+        readings, self.readings = self.readings, []
+        frames, self.frames = self.frames, []
+        upto = self.offset
+        if readings or frames:
+            if self.frames_as_readings:
+                source = self.frames_as_readings
+                write_f = lambda db, rows: write_frame_readings(db, rows, source)  # noqa: E731
+            else:
+                write_f = write_frames
+            async with self._maker() as db:
+                for rows, write in ((readings, write_readings), (frames, write_f)):
+                    if not rows:
+                        continue
+                    try:
+                        out = await write(db, rows)
+                    except Exception:
+                        self.failed += len(rows)
+                        raise
+                    self.accepted += out["n"]
+                    self.dropped += out["dropped"]
+        self.committed = upto
+        ev, self._committed_ev = self._committed_ev, asyncio.Event()
+        ev.set()
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                closing = self._closing
+                try:
+                    await self.flush()
+                except Exception as e:
+                    if not self.keep_going:
+                        raise
+                    print(f"[WARN] ingest batch failed, dropped: {e!r}")
+                if closing:
+                    return
+        except Exception as e:
+            self.error = e
+            self._committed_ev.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def wait_committed(self, timeout: float) -> int:
+        """等下一次提交（或超时），返回当前 committed。"""
+        try:
+            await asyncio.wait_for(self._committed_ev.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.committed
+
+    async def close(self):
+        """把剩余的条目写完再停掉后台任务（不取消进行中的写库）。"""
+        if self._task is None:
+            if self.error is None:
+                await self.flush()
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    def ack(self) -> dict:
+        out = {
+            "offset": self.offset,
+            "committed": self.committed,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "invalid": self.invalid,
+            "failed": self.failed,
+        }
+        if self.error is not None:
+            out["error"] = repr(self.error)
+        return out
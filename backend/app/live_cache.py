@@ -0,0 +1,144 @@
+# app/live_cache.py
+# 进程内缓存：
+#   SensorDirectory —— sensor_id / house_id 与传感器元信息的映射（启动时一次性加载，增删改时同步）
+#   LastValueCache  —— 每个传感器的最新读数（启动时用 LATERAL 预热，/ingest 提交后更新）
+#   RecentKeys      —— 最近提交过的 (sensor_id, ts) / Idempotency-Key，挡掉明显的重发
+# 注意：缓存按 worker 进程各自维护；多 worker 部署时每个进程只看到自己处理过的 ingest。
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+from sqlalchemy import select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Sensor, SensorReading, Household, ReadingAttrSet
+from .attr_sets import merge_attributes
+
+
+@dataclass(slots=True)
+class SensorInfo:
+    id: UUID
+    name: str
+    type: str
+    serial_number: str | None
+    owner_id: int | None
+    house_id: str | None
+
+
+class SensorDirectory:
+    def __init__(self):
+        self.by_id: dict[UUID, SensorInfo] = {}
+        self.by_house: dict[str, set[UUID]] = {}
+
+    def upsert(self, info: SensorInfo):
+        old = self.by_id.get(info.id)
+        if old is not None and old.house_id and old.house_id != info.house_id:
+            self.by_house.get(old.house_id, set()).discard(info.id)
+        self.by_id[info.id] = info
+        if info.house_id:
+            self.by_house.setdefault(info.house_id, set()).add(info.id)
+
+    def remove(self, sensor_id: UUID):
+        info = self.by_id.pop(sensor_id, None)
+        if info is not None and info.house_id:
+            self.by_house.get(info.house_id, set()).discard(sensor_id)
+
+    def sensors_of(self, house_id: str) -> list[SensorInfo]:
+        return [self.by_id[s] for s in self.by_house.get(house_id, ()) if s in self.by_id]
+
+    @staticmethod
+    def _query():
+        return select(
+            Sensor.id, Sensor.name, Sensor.type, Sensor.serial_number, Sensor.owner_id, Household.house_id
+        ).outerjoin(Household, Household.id == Sensor.owner_id)
+
+    async def load(self, db: AsyncSession):
+        rows = (await db.execute(self._query())).all()
+        self.by_id.clear()
+        self.by_house.clear()
+        for r in rows:
+            self.upsert(SensorInfo(*r))
+
+    async def load_house(self, db: AsyncSession, house_id: str) -> list[SensorInfo]:
+        rows = (await db.execute(self._query().where(Household.house_id == house_id))).all()
+        for r in rows:
+            self.upsert(SensorInfo(*r))
+        return self.sensors_of(house_id)
+
+
+class LastValueCache:
+    def __init__(self):
+        # sensor_id -> (ts, value, attributes)
+        self.values: dict[UUID, tuple[datetime, float, dict | None]] = {}
+
+    def update(self, sensor_id: UUID, ts: datetime, value: float, attributes: dict | None):
+        cur = self.values.get(sensor_id)
+        if cur is None or ts >= cur[0]:
+            self.values[sensor_id] = (ts, value, attributes)
+
+    def get(self, sensor_id: UUID) -> tuple[datetime, float, dict | None] | None:
+        return self.values.get(sensor_id)
+
+    async def warm(self, db: AsyncSession):
+        # 每个传感器一次 LIMIT 1 的索引探测（走 ix_readings_sensor_ts_desc），不扫整张读数表
+        # 静态属性在 reading_attr_sets 里，和 ingest 写进缓存的一样拼成完整的 attributes
+        r = (
+            select(SensorReading.ts, SensorReading.value, SensorReading.attributes, SensorReading.attr_set_id)
+            .where(SensorReading.sensor_id == Sensor.id)
+            .order_by(SensorReading.ts.desc())
+            .limit(1)
+            .lateral("r")
+        )
+        stmt = (
+            select(Sensor.id, r.c.ts, r.c.value, r.c.attributes, ReadingAttrSet.data)
+            .join(r, true())
+            .outerjoin(ReadingAttrSet, ReadingAttrSet.id == r.c.attr_set_id)
+        )
+        for sid, ts, value, attrs, static in (await db.execute(stmt)).all():
+            self.update(sid, ts, value, merge_attributes(static, attrs))
+
+
+class RecentKeys:
+    """固定容量的 LRU；只是数据库唯一约束前的快速过滤，丢了（进程重启 / 淘汰）也不影响正确性。"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._keys: OrderedDict[Any, Any] = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    def get(self, key):
+        return self._keys.get(key)
+
+    def add(self, key, value=None):
+        self._keys[key] = value
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+
+
+sensor_directory = SensorDirectory()
+last_values = LastValueCache()
+
+
+async def warm_caches(db: AsyncSession):
+    await sensor_directory.load(db)
+    await last_values.warm(db)
+
+
+def house_snapshot(house_id: str, sensors: list[SensorInfo]) -> dict[str, Any]:
+    out = []
+    for info in sorted(sensors, key=lambda x: (x.name or "", str(x.id))):
+        hit = last_values.get(info.id)
+        out.append({
+            "sensor_id": info.id,
+            "name": info.name,
+            "type": info.type,
+            "serial_number": info.serial_number,
+            "ts": hit[0] if hit else None,
+            "value": hit[1] if hit else None,
+            "attributes": hit[2] if hit else None,
+        })
+    return {"house_id": house_id, "sensors": out}
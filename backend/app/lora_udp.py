@@ -0,0 +1,125 @@
+# app/lora_udp.py
+# Semtech UDP packet-forwarder 监听：网关直接把上行包发到这里，不再经过 HTTP 桥接。
+#   PUSH_DATA(0x00) -> 立即回 PUSH_ACK(0x01)，解析 rxpk[].data（base64）并送入攒批写库
+#   PULL_DATA(0x02) -> 立即回 PULL_ACK(0x04)（本服务不下发，只维持网关的下行通道心跳）
+#   TX_ACK(0x05)    -> 忽略
+# 设置 LORA_UDP_PORT（通常 1700）才会在启动时监听；多 worker 部署时只应有一个进程绑定该端口。
+# 每个上行解析成盒子（LORA_DEVICE_MAP 或 sensors.meta.lora_id，见 frames.py）后拆成逐传感器读数写入；
+# 找不到盒子的帧计入 frames_unmatched_total 后丢弃。
+#
+# 注意：标准 LoRaWAN 的 FRMPayload 是 AppSKey 加密的，这里按未加密的测试 / 私有网络处理：
+# 长度正好 22 字节视为裸应用数据；更长则按 MHDR|FHDR|FPort|FRMPayload|MIC 剥掉 MAC 头。
+
+import asyncio
+import base64
+import json
+import os
+from datetime import datetime, timezone
+from .db import registry
+from .frames import decode_frame, FRAME_BYTES
+from .ingest_pipeline import IngestBatcher, parse_ts
+from .metrics import FRAMES_DECODED, LORA_UDP_PACKETS
+
+LORA_UDP_HOST = os.getenv("LORA_UDP_HOST", "0.0.0.0")
+LORA_UDP_PORT = int(os.getenv("LORA_UDP_PORT", "0") or 0)
+# UDP 没法反压：写库跟不上、积压超过这个数时新上行直接丢弃并计数
+LORA_UDP_MAX_BACKLOG = int(os.getenv("LORA_UDP_MAX_BACKLOG", "50000"))
+
+PROTOCOL_VERSIONS = (1, 2)
+PUSH_DATA, PUSH_ACK, PULL_DATA, PULL_RESP, PULL_ACK, TX_ACK = 0x00, 0x01, 0x02, 0x03, 0x04, 0x05
+
+
+def app_payload(phy: bytes) -> tuple[str | None, bytes]:
+    """PHYPayload -> (DevAddr 十六进制 / 裸数据时为 None, 22 字节应用数据)。"""
+    if len(phy) == FRAME_BYTES:
+        return None, phy
+    # MHDR(1) DevAddr(4) FCtrl(1) FCnt(2) FOpts(0..15) FPort(1) FRMPayload MIC(4)
+    if len(phy) < 1 + 7 + 1 + 4:
+        raise ValueError(f"PHYPayload too short: {len(phy)} bytes")
+    fopts_len = phy[5] & 0x0F
+    body = phy[1 + 7 + fopts_len + 1:-4]
+    if len(body) != FRAME_BYTES:
+        raise ValueError(f"FRMPayload is {len(body)} bytes, expected {FRAME_BYTES}")
+    return phy[1:5][::-1].hex().upper(), body  # DevAddr 在线上是小端
+
+
+class PacketForwarderProtocol(asyncio.DatagramProtocol):
+    def __init__(self, batcher: IngestBatcher):
+        self.batcher = batcher
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < 4 or data[0] not in PROTOCOL_VERSIONS:
+            LORA_UDP_PACKETS.inc(1, "invalid")
+            return
+        version, token, ident = data[0], data[1:3], data[3]
+        if ident == PUSH_DATA:
+            # 先回 ACK 再解析：网关只关心送达，解析失败也不需要重发
+            self.transport.sendto(bytes([version]) + token + bytes([PUSH_ACK]), addr)
+            LORA_UDP_PACKETS.inc(1, "push_data")
+            self._handle_push(data[12:])
+        elif ident == PULL_DATA:
+            self.transport.sendto(bytes([version]) + token + bytes([PULL_ACK]), addr)
+            LORA_UDP_PACKETS.inc(1, "pull_data")
+        elif ident == TX_ACK:
+            LORA_UDP_PACKETS.inc(1, "tx_ack")
+        else:
+            LORA_UDP_PACKETS.inc(1, "invalid")
+
+    def _handle_push(self, body: bytes):
+        try:
+            doc = json.loads(body)
+        except ValueError:
+            LORA_UDP_PACKETS.inc(1, "bad_json")
+            return
+        now = datetime.now(timezone.utc)
+        for pk in doc.get("rxpk") or ():
+            if self.batcher.backlog >= LORA_UDP_MAX_BACKLOG:
+                LORA_UDP_PACKETS.inc(1, "overflow")
+                self.batcher.skip()
+                continue
+            try:
+                dev_addr, payload = app_payload(base64.b64decode(pk["data"]))
+                ts = parse_ts(pk.get("time"), now)
+                # 设备标识：有 MAC 头用 DevAddr，否则用帧里的 u16 serial；写库时再解析成盒子（frames_to_readings）
+                self.batcher.add_frame(decode_frame(payload, ts, dev_addr))
+            except (KeyError, ValueError, TypeError):
+                LORA_UDP_PACKETS.inc(1, "bad_payload")
+                self.batcher.skip()
+                continue
+            FRAMES_DECODED.inc(1, "udp")
+
+
+class LoraUdpListener:
+    def __init__(self):
+        self.transport: asyncio.DatagramTransport | None = None
+        self.batcher: IngestBatcher | None = None
+
+    async def start(self, host: str = LORA_UDP_HOST, port: int = LORA_UDP_PORT):
+        if not port or self.transport is not None:
+            return
+        # 帧拆成读数走 sensor_readings（最新值缓存、预聚合都在那条路径上）；FRAME_STORAGE=1 时另存一份整帧
+        self.batcher = IngestBatcher(registry.sessionmaker("ingest"), keep_going=True, frames_as_readings="udp")
+        self.batcher.start()
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: PacketForwarderProtocol(self.batcher), local_addr=(host, port)
+        )
+        print(f"[INFO] LoRa packet-forwarder listening on udp://{host}:{port}")
+
+    async def stop(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        if self.batcher is not None:
+            await self.batcher.close()
+            self.batcher = None
+
+    def status(self) -> dict | None:
+        return self.batcher.ack() if self.batcher is not None else None
+
+
+lora_listener = LoraUdpListener()
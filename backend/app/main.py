@@ -1,9 +1,48 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import sensors, ingest, readings, register, auth, analytics, diseases
+from app.routers import sensors, ingest, readings, register, auth, analytics, diseases, admin, configs, houses
 import os
 from starlette.middleware.sessions import SessionMiddleware
-app = FastAPI()
+from app.serialization import FastJSONResponse
+from app.db import registry
+from app import metrics
+from app.profiler import slow_queries
+from app.config_hub import config_hub
+from app.live_cache import warm_caches
+from app.admission import read_admission
+from app.lora_udp import lora_listener
+from app.executors import shutdown_executors
+from app.rollups import zone_refresher, mark_coverage
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await config_hub.start(registry.engine("read").url)
+    try:
+        async with registry.sessionmaker("jobs")() as db:
+            await warm_caches(db)
+    except Exception as e:
+        print(f"[WARN] cache warm-up failed, /api/houses/*/latest will fill from ingest: {e!r}")
+    try:
+        async with registry.sessionmaker("jobs")() as db:
+            await mark_coverage(db)
+    except Exception as e:
+        print(f"[WARN] rollup coverage not recorded, percentile charts will read raw readings: {e!r}")
+    await lora_listener.start()
+    await zone_refresher.start(registry.sessionmaker("jobs"))
+    yield
+    await zone_refresher.stop()
+    await lora_listener.stop()
+    shutdown_executors()
+    await config_hub.stop()
+    await registry.dispose()
+
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+metrics.instrument_registry(registry)
+slow_queries.install(registry)
 origins = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 app.add_middleware(
     CORSMiddleware,
@@ -11,6 +50,7 @@ app.add_middleware(
     allow_credentials=True,  # 关键：允许携带 Cookie
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Estimate", "Retry-After"],
 )
 app.add_middleware(
     SessionMiddleware,
@@ -19,15 +59,23 @@ app.add_middleware(
     same_site="lax",                # 前后端同域/同站推荐 Lax；跨站可用 "none" + HTTPS
     https_only=False,               # 生产环境建议 True（仅 HTTPS 传输）
 )
+app.add_middleware(metrics.MetricsMiddleware)
 app.include_router(sensors.router)
 app.include_router(ingest.router)
-app.include_router(readings.router)
+# 交互式读走独立的准入预算，过载时 429，不影响 ingest
+app.include_router(readings.router, dependencies=[Depends(read_admission)])
 
 app.include_router(diseases.router)
 
 app.include_router(register.router)
 
-app.include_router(analytics.router)
+app.include_router(analytics.router, dependencies=[Depends(read_admission)])
+
+app.include_router(configs.router)
+
+app.include_router(houses.router, dependencies=[Depends(read_admission)])
+
+app.include_router(admin.router)
 
 # app.include_router(auth_router)
 @app.get("/health")
@@ -35,6 +83,11 @@ def health():
     return {"ok": True}
 
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
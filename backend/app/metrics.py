@@ -0,0 +1,264 @@
+# app/metrics.py
+# 进程内的 Prometheus 指标：无第三方依赖，/metrics 以 text exposition 格式输出。
+# 写路径只做 dict 查找 + 加法（单事件循环线程），对 /ingest 热路径的开销可以忽略。
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+ROW_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = labels
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_, labels=()):
+        super().__init__(name, help_, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        out = self.header()
+        for lv, v in self.values.items():
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, lv)} {v}")
+        return out
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = float(value)
+
+    def dec(self, amount: float = 1.0, *labels):
+        self.inc(-amount, *labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [每个桶的计数..., +Inf 计数, sum]
+        self.values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels):
+        slot = self.values.get(labels)
+        if slot is None:
+            slot = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        slot[bisect_left(self.buckets, value)] += 1
+        slot[-1] += value
+
+    def collect(self) -> list[str]:
+        out = self.header()
+        for lv, slot in self.values.items():
+            acc = 0
+            for b, c in zip(self.buckets, slot):
+                acc += c
+                le = 'le="%s"' % b
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, lv, le)} {acc}")
+            acc += slot[len(self.buckets)]
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, lv, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, lv)} {slot[-1]}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, lv)} {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors = []  # 抓取时才计算的指标（如连接池），返回文本行
+
+    def register(self, m):
+        self._metrics.append(m)
+        return m
+
+    def counter(self, name, help_, labels=()) -> Counter:
+        return self.register(Counter(name, help_, labels))
+
+    def gauge(self, name, help_, labels=()) -> Gauge:
+        return self.register(Gauge(name, help_, labels))
+
+    def histogram(self, name, help_, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_, labels, buckets))
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for m in self._metrics:
+            lines.extend(m.collect())
+        for fn in self._collectors:
+            lines.extend(fn())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# -------------------- HTTP --------------------
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served")
+HTTP_REQUEST_SIZE = REGISTRY.histogram("http_request_size_bytes", "Request body size (Content-Length)", ("route",), SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = REGISTRY.histogram("http_response_size_bytes", "Response body size", ("route",), SIZE_BUCKETS)
+
+# -------------------- SQL --------------------
+DB_LATENCY = REGISTRY.histogram("db_statement_duration_seconds", "SQL statement latency by calling route", ("route", "op"))
+DB_ROWS = REGISTRY.histogram("db_statement_rows", "Rows affected/returned per SQL statement", ("route", "op"), ROW_BUCKETS)
+
+# -------------------- 业务 --------------------
+INGEST_ROWS = REGISTRY.counter("ingest_rows_total", "Sensor readings committed by /ingest")
+INGEST_DUPLICATES = REGISTRY.counter("ingest_duplicates_total", "Duplicate readings dropped at ingest", ("stage",))
+FRAMES_DECODED = REGISTRY.counter("frames_decoded_total", "22-byte LoRaWAN frames decoded", ("source",))
+FRAMES_UNMATCHED = REGISTRY.counter("frames_unmatched_total", "Decoded frames whose device maps to no known box", ("source",))
+LORA_UDP_PACKETS = REGISTRY.counter("lora_udp_packets_total", "Semtech packet-forwarder datagrams by kind", ("kind",))
+WS_CLIENTS = REGISTRY.gauge("websocket_clients", "Connected WebSocket clients")
+
+# -------------------- 准入控制 --------------------
+ADMISSION_IN_FLIGHT = REGISTRY.gauge("admission_in_flight", "Admitted requests currently running", ("budget",))
+ADMISSION_QUEUED = REGISTRY.gauge("admission_queued", "Requests waiting for an admission slot", ("budget",))
+ADMISSION_LATENCY = REGISTRY.gauge("admission_latency_ewma_seconds", "EWMA of admitted request service time", ("budget",))
+ADMISSION_WAIT = REGISTRY.histogram("admission_wait_seconds", "Time spent queued before admission", ("budget",))
+ADMISSION_SHED = REGISTRY.counter("admission_shed_total", "Requests rejected with 429 by admission control", ("budget", "reason"))
+
+# -------------------- 线程池 / 进程池 --------------------
+EXECUTOR_TASKS = REGISTRY.counter("executor_tasks_total", "Tasks offloaded from the event loop", ("pool", "task", "outcome"))
+EXECUTOR_SECONDS = REGISTRY.histogram("executor_task_seconds", "Queue + run time of offloaded tasks", ("pool", "task"))
+EXECUTOR_QUEUED = REGISTRY.gauge("executor_pending", "Offloaded tasks submitted and not finished", ("pool",))
+
+# 当前请求的 ASGI scope；SQL 事件里据此取调用方路由
+_current_scope: ContextVar[dict | None] = ContextVar("metrics_scope", default=None)
+
+
+def _route_of(scope: dict | None) -> str:
+    if scope is None:
+        return "<background>"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件（不用 BaseHTTPMiddleware，避免额外的 task / 队列开销）。"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = _current_scope.set(scope)
+        HTTP_IN_FLIGHT.inc(1)
+        t0 = time.perf_counter()
+        status = [500]
+        sent = [0]
+
+        async def _send(message):
+            t = message["type"]
+            if t == "http.response.start":
+                status[0] = message["status"]
+            elif t == "http.response.body":
+                sent[0] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            dt = time.perf_counter() - t0
+            HTTP_IN_FLIGHT.dec(1)
+            _current_scope.reset(token)
+            route = _route_of(scope)
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(1, method, route, status[0])
+            HTTP_LATENCY.observe(dt, method, route)
+            HTTP_RESPONSE_SIZE.observe(sent[0], route)
+            for k, v in scope.get("headers", ()):
+                if k == b"content-length":
+                    HTTP_REQUEST_SIZE.observe(int(v), route)
+                    break
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    t0 = getattr(context, "_metrics_t0", None)
+    if t0 is None:
+        return
+    dt = time.perf_counter() - t0
+    route = _route_of(_current_scope.get())
+    op = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+    DB_LATENCY.observe(dt, route, op)
+    rc = getattr(cursor, "rowcount", -1)
+    if rc is not None and rc >= 0:
+        DB_ROWS.observe(rc, route, op)
+
+
+def instrument_engine(engine: AsyncEngine):
+    sync = engine.sync_engine
+    event.listen(sync, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync, "after_cursor_execute", _after_cursor_execute)
+
+
+def instrument_registry(registry):
+    """给每个角色的引擎挂 SQL 计时，并把连接池状态作为抓取时指标输出。"""
+    for role in registry.roles:
+        instrument_engine(registry.engine(role))
+
+    def _pool_lines() -> list[str]:
+        lines = []
+        fields = (
+            ("checked_out", "db_pool_checked_out", "gauge", "Connections currently checked out"),
+            ("overflow", "db_pool_overflow", "gauge", "Overflow connections currently open"),
+            ("size", "db_pool_size", "gauge", "Configured pool size"),
+            ("acquires_total", "db_pool_acquires_total", "counter", "Connection acquisitions"),
+            ("wait_seconds_total", "db_pool_wait_seconds_total", "counter", "Total time spent waiting for a connection"),
+            ("timeouts_total", "db_pool_timeouts_total", "counter", "Pool checkout timeouts"),
+        )
+        status = registry.pool_status()
+        for key, name, kind, help_ in fields:
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+            for role, st in status.items():
+                lines.append(f'{name}{{role="{role}"}} {st[key]}')
+        return lines
+
+    REGISTRY.add_collector(_pool_lines)
+
+
+def render() -> str:
+    return REGISTRY.render()
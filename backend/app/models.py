@@ -1,11 +1,17 @@
 import uuid
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Boolean, TIMESTAMP, text, ForeignKey, Float, BigInteger, Index, DateTime, func
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import Integer, String, Boolean, TIMESTAMP, text, ForeignKey, Float, BigInteger, Index, DateTime, func, event, DDL, REAL
+from sqlalchemy.dialects.postgresql import JSONB, UUID, ARRAY
+from .sketches import MERGE_FUNCTION_DDL
 
 class Base(DeclarativeBase):
     pass
 
+# 传感器搜索用的 trigram 索引需要 pg_trgm
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+# metric_rollups 的 ON CONFLICT 用它合并分位数草图
+event.listen(Base.metadata, "before_create", DDL(MERGE_FUNCTION_DDL))
+
 class Household(Base):
     __tablename__ = "households"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -39,9 +45,41 @@ class SensorReading(Base):
     ts: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), server_default=text("CURRENT_TIMESTAMP"), index=True)
     value: Mapped[float] = mapped_column(Float)
     attributes: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # 重复的静态属性（unit/box/serial_number）存到 reading_attr_sets，这里只留引用；
+    # 不加外键，避免每行写入都多一次索引探测
+    attr_set_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     sensor = relationship("Sensor", back_populates="readings")
 
-Index("ix_readings_sensor_ts_desc", SensorReading.sensor_id, SensorReading.ts.desc())
+# ingest 幂等键：同一传感器同一时刻只保留一条（重试 / 网关重发的重复读数由 ON CONFLICT 丢弃）；
+# 同一个索引也负责按传感器倒序取最新值（btree 正反都能扫），不再单建一个 (sensor_id, ts)
+Index("ix_readings_sensor_ts_desc", SensorReading.sensor_id, SensorReading.ts.desc(), unique=True)
+# 批量开通的幂等键：同一个盒子（serial）下每种 type 只有一个传感器
+Index("uq_sensors_serial_type", Sensor.serial_number, Sensor.type, unique=True)
+# keyset 分页：ORDER BY name, id
+Index("ix_sensors_name_id", Sensor.name, Sensor.id)
+
+
+def sensor_search_expr():
+    # 必须与下面索引的表达式完全一致，ILIKE 才能走 trigram 索引（|| 与 coalesce 都是 IMMUTABLE）
+    return func.lower(
+        func.coalesce(Sensor.name, "") + " " + func.coalesce(Sensor.type, "") + " "
+        + func.coalesce(Sensor.location, "") + " " + func.coalesce(Sensor.serial_number, "")
+    )
+
+
+Index(
+    "ix_sensors_search_trgm",
+    sensor_search_expr().label("search_text"),
+    postgresql_using="gin",
+    postgresql_ops={"search_text": "gin_trgm_ops"},
+)
+
+class ReadingAttrSet(Base):
+    """读数静态属性字典表：相同内容只存一份，按 digest（规范化 JSON 的 sha1）去重。"""
+    __tablename__ = "reading_attr_sets"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    digest: Mapped[str] = mapped_column(String(40), unique=True, nullable=False)
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False)
 
 class SensorConfig(Base):
     __tablename__ = "sensor_configs"
@@ -51,3 +89,104 @@ class SensorConfig(Base):
     data: Mapped[dict] = mapped_column(JSONB)
     created_at: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), server_default=text("CURRENT_TIMESTAMP"))
     sensor = relationship("Sensor", back_populates="configs")
+
+
+class BoxFrame(Base):
+    """
+    整帧存储（可选）：一个盒子在同一时刻的 10 个字段存成一行，而不是 10 行 sensor_readings。
+    字段与 simulation/lorawan_decode.FIELDS 一致；22 字节帧本身就是 u16 定标值，REAL 精度足够。
+    """
+    __tablename__ = "box_frames"
+    serial_number: Mapped[str] = mapped_column(String(64), primary_key=True)
+    ts: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    temp_c: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    rh_pct: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    co2_ppm: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    o2_pct: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    co_ppm: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    pm25_ugm3: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    noise_dba: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    no2_ppb: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    lux: Mapped[float | None] = mapped_column(REAL, nullable=True)
+    bat_mv: Mapped[float | None] = mapped_column(REAL, nullable=True)
+
+
+class MetricRollup(Base):
+    """
+    每户 × 传感器类型 × 小时的读数汇总，ingest 在写读数的同一事务里增量 upsert（见 rollups.py）。
+    metric 是 lower(sensors.type)；zone 冗余存一份，按 zone 汇总时不用再 JOIN households。
+    """
+    __tablename__ = "metric_rollups"
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("households.id", ondelete="CASCADE"), primary_key=True)
+    metric: Mapped[str] = mapped_column(String(80), primary_key=True)
+    bucket: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    zone: Mapped[str] = mapped_column(String(1), nullable=False)
+    n: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    sum_v: Mapped[float] = mapped_column(Float, nullable=False)
+    min_v: Mapped[float] = mapped_column(Float, nullable=False)
+    max_v: Mapped[float] = mapped_column(Float, nullable=False)
+    sketch: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))  # DDSketch {桶: 计数}
+    updated_at: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+Index("ix_metric_rollups_metric_bucket", MetricRollup.metric, MetricRollup.bucket)
+# updated_at 不建索引：当前小时那一行每批都要更新，被更新的列带索引就走不了 HOT
+
+
+class RollupState(Base):
+    """
+    单行（id = 1）：metric_rollups 从 covered_since 起是完整的，'infinity' 表示不可信。
+    启动时和 rebuild 之后更新（见 rollups.py），analytics 据此决定能不能只读预聚合。
+    """
+    __tablename__ = "rollup_state"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    covered_since: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+
+class RollupDirty(Base):
+    """
+    ingest 写 metric_rollups 时顺手记一笔：第 epoch 分钟（事务开始时间）这个 (类型, 小时) 有写入。
+    同一分钟重复的 DO NOTHING；ZoneRollupRefresher 按 epoch 取出要重算的小时，过了重叠窗口的删掉。
+    """
+    __tablename__ = "rollup_dirty"
+    epoch: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    metric: Mapped[str] = mapped_column(String(80), primary_key=True)
+    bucket: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+
+
+class ZoneRollup(Base):
+    """
+    每个 zone × 指标（THRESHOLDS 的键）× 小时：读数汇总、有数据的户数、每条阈值线越线的户数
+    （按该户该小时的均值判断，顺序与 THRESHOLDS[metric]["lines"] 一致）。由 metric_rollups 重算，幂等。
+    """
+    __tablename__ = "zone_rollups"
+    zone: Mapped[str] = mapped_column(String(1), primary_key=True)
+    metric: Mapped[str] = mapped_column(String(80), primary_key=True)
+    bucket: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    n: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    sum_v: Mapped[float] = mapped_column(Float, nullable=False)
+    min_v: Mapped[float] = mapped_column(Float, nullable=False)
+    max_v: Mapped[float] = mapped_column(Float, nullable=False)
+    homes: Mapped[int] = mapped_column(Integer, nullable=False)
+    homes_over: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    sketch: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    refreshed_at: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+
+Index("ix_zone_rollups_metric_bucket", ZoneRollup.metric, ZoneRollup.bucket)
+
+
+class HomeDailyRollup(Base):
+    """
+    每户 × 指标（THRESHOLDS 的键）× 天（UTC 零点）的读数汇总，zone_distribution 用整天的部分。
+    由 metric_rollups 整天重算，跟 zone_rollups 同一个任务。
+    """
+    __tablename__ = "home_daily_rollups"
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("households.id", ondelete="CASCADE"), primary_key=True)
+    metric: Mapped[str] = mapped_column(String(80), primary_key=True)
+    day: Mapped[str] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    zone: Mapped[str] = mapped_column(String(1), primary_key=True)
+    n: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    sum_v: Mapped[float] = mapped_column(Float, nullable=False)
+    min_v: Mapped[float] = mapped_column(Float, nullable=False)
+    max_v: Mapped[float] = mapped_column(Float, nullable=False)
+
+Index("ix_home_daily_rollups_metric_day", HomeDailyRollup.metric, HomeDailyRollup.day)
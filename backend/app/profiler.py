@@ -0,0 +1,177 @@
+# app/profiler.py
+# 慢查询采集（默认关闭）：SLOW_QUERY_MS>0 时启用。
+#  - 超过阈值的语句连同绑定参数记录到最近列表（环形缓冲）
+#  - 按归一化 SQL 聚合，只保留最慢的 top-N
+#  - 对一部分 SELECT 抽样，在 jobs 池的独立连接上跑 EXPLAIN (ANALYZE, BUFFERS)
+
+import asyncio
+import os
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+from sqlalchemy import event
+from .metrics import _current_scope, _route_of
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))                  # 0 = 关闭
+EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+TOP_N = int(os.getenv("SLOW_QUERY_TOP_N", "50"))
+RECENT_N = int(os.getenv("SLOW_QUERY_RECENT_N", "200"))
+EXPLAIN_MIN_INTERVAL_SEC = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+
+_RE_STR = re.compile(r"'(?:[^']|'')*'")
+_RE_NUM = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PARAM = re.compile(r"\$\d+|%\(\w+\)s|(?<!:):\w+")
+_RE_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_VALUES = re.compile(r"VALUES\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+", re.I)
+_RE_WS = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """把字面量 / 绑定参数替换成 ?，并折叠 IN 列表与多行 VALUES，用作聚合键。"""
+    s = _RE_STR.sub("?", sql)
+    s = _RE_PARAM.sub("?", s)
+    s = _RE_NUM.sub("?", s)
+    s = _RE_WS.sub(" ", s).strip()
+    s = _RE_VALUES.sub(r"VALUES \1, ...", s)
+    s = _RE_IN_LIST.sub("(...)", s)
+    return s
+
+
+def _short_params(params, limit: int = 2000) -> str:
+    r = repr(params)
+    return r if len(r) <= limit else r[:limit] + "...<truncated>"
+
+
+class SlowQueryProfiler:
+    def __init__(self, threshold_ms: float, sample_rate: float, top_n: int, recent_n: int):
+        self.threshold_s = threshold_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+        self.recent: deque[dict] = deque(maxlen=recent_n)
+        self.top: dict[str, dict] = {}
+        self._explain_engine = None
+        self._explaining = False
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_s > 0
+
+    # -------------------- 引擎事件 --------------------
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._slowq_t0 = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        t0 = getattr(context, "_slowq_t0", None)
+        if t0 is None:
+            return
+        dt = time.perf_counter() - t0
+        if dt < self.threshold_s or statement.lstrip()[:7].upper() == "EXPLAIN":
+            return
+        self.record(statement, parameters, dt, executemany)
+
+    def record(self, statement: str, parameters, seconds: float, executemany: bool = False):
+        ms = seconds * 1000.0
+        key = normalize_sql(statement)
+        now = datetime.now(timezone.utc)
+        route = _route_of(_current_scope.get())
+        params = _short_params(parameters)
+        self.recent.append({"at": now, "ms": round(ms, 3), "route": route, "query": key, "params": params})
+
+        e = self.top.get(key)
+        if e is None:
+            if len(self.top) >= self.top_n:
+                # 淘汰 max_ms 最小的一条，保持 top-N
+                victim = min(self.top, key=lambda k: self.top[k]["max_ms"])
+                if self.top[victim]["max_ms"] >= ms:
+                    return
+                del self.top[victim]
+            e = self.top[key] = {
+                "query": key, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0,
+                "last_params": None, "last_route": None, "last_seen": None,
+                "plan": None, "plan_at": None, "plan_error": None,
+            }
+        e["count"] += 1
+        e["total_ms"] += ms
+        e["last_ms"] = ms
+        e["last_seen"] = now
+        e["last_route"] = route
+        e["last_params"] = params
+        if ms >= e["max_ms"]:
+            e["max_ms"] = ms
+
+        if not executemany and self._should_explain(statement, e):
+            self._schedule_explain(e, statement, parameters)
+
+    # -------------------- EXPLAIN 抽样 --------------------
+
+    def _should_explain(self, statement: str, entry: dict) -> bool:
+        if self._explain_engine is None or self._explaining:
+            return False
+        # ANALYZE 会真正执行语句，只对只读 SELECT 做
+        if statement.lstrip()[:6].upper() != "SELECT":
+            return False
+        at = entry["plan_at"]
+        if at is not None and (datetime.now(timezone.utc) - at).total_seconds() < EXPLAIN_MIN_INTERVAL_SEC:
+            return False
+        return random.random() < self.sample_rate
+
+    def _schedule_explain(self, entry: dict, statement: str, parameters):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._explaining = True
+        task = loop.create_task(self._explain(entry, statement, parameters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, entry: dict, statement: str, parameters):
+        try:
+            async with self._explain_engine.connect() as conn:
+                trans = await conn.begin()
+                try:
+                    res = await conn.exec_driver_sql(
+                        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement,
+                        parameters if parameters else (),
+                    )
+                    entry["plan"] = res.scalar()
+                    entry["plan_error"] = None
+                finally:
+                    await trans.rollback()
+        except Exception as e:
+            entry["plan_error"] = repr(e)
+        finally:
+            entry["plan_at"] = datetime.now(timezone.utc)
+            self._explaining = False
+
+    # -------------------- 安装 / 读取 --------------------
+
+    def install(self, registry, explain_role: str = "jobs"):
+        if not self.enabled:
+            return
+        self._explain_engine = registry.engine(explain_role)
+        for role in registry.roles:
+            sync = registry.engine(role).sync_engine
+            event.listen(sync, "before_cursor_execute", self._before)
+            event.listen(sync, "after_cursor_execute", self._after)
+
+    def snapshot(self, limit: int = 50) -> dict:
+        top = sorted(self.top.values(), key=lambda e: e["max_ms"], reverse=True)[:limit]
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_s * 1000.0,
+            "explain_sample_rate": self.sample_rate,
+            "top": [dict(e, mean_ms=e["total_ms"] / e["count"]) for e in top],
+            "recent": list(self.recent)[-limit:][::-1],
+        }
+
+    def reset(self):
+        self.top.clear()
+        self.recent.clear()
+
+
+slow_queries = SlowQueryProfiler(SLOW_QUERY_MS, EXPLAIN_SAMPLE_RATE, TOP_N, RECENT_N)
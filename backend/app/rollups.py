@@ -0,0 +1,402 @@
+# app/rollups.py
+# 预聚合，给 zone / 全网级别的分析用（不用每次扫几十亿行 sensor_readings）：
+#   metric_rollups —— 每户 × 传感器类型 × 小时的 n / sum / min / max + 分位数草图（sketches.py）。ingest 在写读数的同一个事务里
+#                     用一条集合语句增量 upsert，只累加真正插入的行（ON CONFLICT 丢掉的重复不会重复计数）
+#   zone_rollups   —— 每个 zone × 指标 × 小时：读数汇总、户数、各阈值线越线的户数。
+#                     ZoneRollupRefresher 定期把有变动的小时（ingest 记在 rollup_dirty）整桶重算（幂等）；
+#                     不在 ingest 里直接加，是因为同一 zone 的所有写入会抢同一行锁，把 ingest 串行化
+#   home_daily_rollups —— 每户 × 指标 × 天（UTC），同一个重算任务整天重算，给跨很多天的户均值分布用
+# 已有数据 / datagen 灌进来的数据：python -m app.rollups rebuild
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from .thresholds import THRESHOLDS, TYPE_TO_METRIC
+from .sketches import bucket_key_sql
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1") != "0"
+ROLLUP_REFRESH_SEC = float(os.getenv("ROLLUP_REFRESH_SEC", "60"))
+# 重算时往回多看一段：rollup_dirty.epoch 取的是写入事务开始的时间，长事务可能晚于上次重算才提交
+ROLLUP_REFRESH_OVERLAP_SEC = float(os.getenv("ROLLUP_REFRESH_OVERLAP_SEC", "300"))
+
+BUCKET = timedelta(hours=1)
+BUCKET_ORIGIN = "TIMESTAMPTZ '2000-01-01 00:00:00+00'"  # date_bin 的对齐原点（整点）
+_REFRESH_LOCK = 0x5a4f4e45  # advisory lock：多 worker 部署时同一时刻只有一个进程在重算
+# rollup_dirty 按分钟记：同一分钟同一 (类型, 小时) 只插一行
+DIRTY_EPOCH_SEC = 60
+_DIRTY_EPOCH_SQL = f"floor(extract(epoch FROM now()) / {DIRTY_EPOCH_SEC})::bigint"
+
+
+def rollup_ctes(source: str) -> str:
+    """
+    接在 WITH 后面的几个 CTE（都以 _r 开头），调用方在后面接自己的 SELECT；数据修改的 CTE 不被引用也会执行。
+    source 是一个 FROM 项，别名 r，至少有 sensor_id / ts / value 三列（unnest(...)、CTE、子查询都行）。
+    先按 (户, 类型, 小时, 草图桶) 计数，再收成每小时一行（_rh），草图是 {桶: 计数}，冲突时用 ddsketch_merge 相加。
+    按 (owner_id, metric, bucket) 排序后写入，并发批次以相同顺序加行锁，不会互相死锁。
+    没有 owner 的传感器、NaN / ±Infinity 不计入。
+    同时在 rollup_dirty 记一笔 (当前分钟, 类型, 小时)：DO NOTHING，同一分钟里后来的批次不加锁也不写。
+    metric_rollups 上被更新的列都不带索引，当前小时那一行的反复 upsert 可以走 HOT。
+    """
+    return (
+        "_rk AS (SELECT s.owner_id, lower(s.type) AS metric, "
+        f"date_bin('1 hour', r.ts, {BUCKET_ORIGIN}) AS bucket, h.zone, {bucket_key_sql('r.value')} AS k, "
+        "count(*) AS c, sum(r.value) AS s, min(r.value) AS lo, max(r.value) AS hi "
+        f"FROM {source} JOIN sensors s ON s.id = r.sensor_id JOIN households h ON h.id = s.owner_id "
+        "WHERE NOT (r.value = 'NaN' OR abs(r.value) = 'Infinity') "
+        "GROUP BY 1, 2, 3, 4, 5), "
+        "_rh AS (SELECT owner_id, metric, bucket, zone, sum(c) AS n, sum(s) AS sum_v, min(lo) AS min_v, max(hi) AS max_v, "
+        "jsonb_object_agg(k, c) AS sketch FROM _rk GROUP BY 1, 2, 3, 4), "
+        "_rup AS (INSERT INTO metric_rollups (owner_id, metric, bucket, zone, n, sum_v, min_v, max_v, sketch, updated_at) "
+        "SELECT owner_id, metric, bucket, zone, n, sum_v, min_v, max_v, sketch, now() FROM _rh ORDER BY 1, 2, 3 "
+        "ON CONFLICT (owner_id, metric, bucket) DO UPDATE SET "
+        "n = metric_rollups.n + EXCLUDED.n, "
+        "sum_v = metric_rollups.sum_v + EXCLUDED.sum_v, "
+        "min_v = LEAST(metric_rollups.min_v, EXCLUDED.min_v), "
+        "max_v = GREATEST(metric_rollups.max_v, EXCLUDED.max_v), "
+        "sketch = ddsketch_merge(metric_rollups.sketch, EXCLUDED.sketch), "
+        "zone = EXCLUDED.zone, updated_at = EXCLUDED.updated_at), "
+        "_rdirty AS (INSERT INTO rollup_dirty (epoch, metric, bucket) "
+        f"SELECT DISTINCT {_DIRTY_EPOCH_SQL}, metric, bucket FROM _rh ORDER BY 2, 3 "
+        "ON CONFLICT DO NOTHING)"
+    )
+
+
+def dirty_epoch(t: datetime) -> int:
+    return int(t.timestamp() // DIRTY_EPOCH_SEC)
+
+
+_UNNEST_SOURCE = (
+    "unnest(CAST(:sids AS uuid[]), CAST(:ts AS timestamptz[]), CAST(:vals AS float8[])) AS r(sensor_id, ts, value)"
+)
+
+
+async def add_readings(db: AsyncSession, rows: list[tuple[Any, datetime, float]]):
+    """(sensor_id, ts, value) 累加进 metric_rollups；调用方负责提交（与读数同一事务）。"""
+    if not rows or not ROLLUPS_ENABLED:
+        return
+    sids, tss, vals = zip(*rows)
+    await db.execute(text(f"WITH {rollup_ctes(_UNNEST_SOURCE)} SELECT 1"), {"sids": list(sids), "ts": list(tss), "vals": list(vals)})
+
+
+# -------------------- zone 级重算 --------------------
+
+def _refresh_sql(full: bool) -> tuple[list[str], dict]:
+    """
+    类型 -> 指标、指标 -> 阈值线都以 VALUES 传进去，和 THRESHOLDS / ALIASES 保持一致。
+    要重算的小时取自 rollup_dirty（epoch >= :since_epoch）；full=True 时取 metric_rollups 里的全部小时。
+    返回按顺序执行的三条语句：zone_rollups 整小时重算；home_daily_rollups 先删掉涉及的天，再整天重算。
+    """
+    params: dict[str, Any] = {}
+    types = []
+    for i, (t, m) in enumerate(TYPE_TO_METRIC.items()):
+        params[f"t{i}"], params[f"m{i}"] = t, m
+        types.append(f"(:t{i}, :m{i})")
+    lines = []
+    for metric, cfg in THRESHOLDS.items():
+        for idx, ln in enumerate(cfg["lines"]):
+            k = len(lines)
+            params[f"lm{k}"], params[f"lk{k}"], params[f"lv{k}"] = metric, ln["kind"], float(ln["value"])
+            lines.append(f"(:lm{k}, {idx + 1}, :lk{k}, CAST(:lv{k} AS float8))")
+    head = f"""
+WITH type_map(type, metric) AS (VALUES {", ".join(types)}),
+lines(metric, idx, kind, value) AS (VALUES {", ".join(lines)}),
+dirty AS (
+  SELECT DISTINCT coalesce(m.metric, r.metric) AS key, r.bucket
+  FROM {"metric_rollups" if full else "rollup_dirty"} r LEFT JOIN type_map m ON m.type = r.metric
+  {"" if full else "WHERE r.epoch >= :since_epoch"}),
+days AS (
+  SELECT DISTINCT key, date_bin('1 day', bucket, {BUCKET_ORIGIN}) AS day FROM dirty)"""
+    zone_sql = head + f""",
+-- 指标键 -> 它包含的所有传感器类型，按 (metric, bucket) 索引取回这些小时的全部户
+dirty_types AS (
+  SELECT d.key, t.type, d.bucket
+  FROM dirty d CROSS JOIN LATERAL (
+    SELECT d.key AS type UNION SELECT type FROM type_map WHERE metric = d.key) t),
+home AS (
+  SELECT r.zone, d.key, r.bucket, r.owner_id,
+         sum(r.n) AS n, sum(r.sum_v) AS sum_v, min(r.min_v) AS min_v, max(r.max_v) AS max_v
+  FROM dirty_types d JOIN metric_rollups r ON r.metric = d.type AND r.bucket = d.bucket
+  GROUP BY 1, 2, 3, 4),
+-- zone 草图：把各户各类型的 {桶: 计数} 摊平后按桶相加
+zone_sketch AS (
+  SELECT zone, key, bucket, jsonb_object_agg(k, c) AS sketch FROM (
+    SELECT r.zone, d.key, r.bucket, e.key AS k, sum(e.value::bigint) AS c
+    FROM dirty_types d JOIN metric_rollups r ON r.metric = d.type AND r.bucket = d.bucket
+    CROSS JOIN jsonb_each_text(r.sketch) e
+    GROUP BY 1, 2, 3, 4) x
+  GROUP BY 1, 2, 3),
+over AS (
+  SELECT zone, key, bucket, array_agg(cnt ORDER BY idx) AS homes_over FROM (
+    SELECT h.zone, h.key, h.bucket, l.idx,
+           count(*) FILTER (WHERE CASE WHEN l.kind = 'upper' THEN h.sum_v / h.n > l.value
+                                       ELSE h.sum_v / h.n < l.value END)::int AS cnt
+    FROM home h JOIN lines l ON l.metric = h.key
+    GROUP BY 1, 2, 3, 4) x
+  GROUP BY 1, 2, 3)
+INSERT INTO zone_rollups (zone, metric, bucket, n, sum_v, min_v, max_v, homes, homes_over, sketch, refreshed_at)
+SELECT h.zone, h.key, h.bucket, sum(h.n), sum(h.sum_v), min(h.min_v), max(h.max_v), count(*),
+       coalesce(o.homes_over, CAST('{{}}' AS int[])), coalesce(zs.sketch, CAST('{{}}' AS jsonb)), now()
+FROM home h
+LEFT JOIN over o ON o.zone = h.zone AND o.key = h.key AND o.bucket = h.bucket
+LEFT JOIN zone_sketch zs ON zs.zone = h.zone AND zs.key = h.key AND zs.bucket = h.bucket
+GROUP BY h.zone, h.key, h.bucket, o.homes_over, zs.sketch
+ORDER BY 1, 2, 3
+ON CONFLICT (zone, metric, bucket) DO UPDATE SET
+  n = EXCLUDED.n, sum_v = EXCLUDED.sum_v, min_v = EXCLUDED.min_v, max_v = EXCLUDED.max_v,
+  homes = EXCLUDED.homes, homes_over = EXCLUDED.homes_over, sketch = EXCLUDED.sketch,
+  refreshed_at = EXCLUDED.refreshed_at
+"""
+    daily_delete = head + """
+DELETE FROM home_daily_rollups d USING days x WHERE d.metric = x.key AND d.day = x.day
+"""
+    # 两条语句之间新记的脏小时可能带来没删过的天，所以插入也要 ON CONFLICT
+    daily_insert = head + """,
+day_types AS (
+  SELECT x.key, t.type, x.day
+  FROM days x CROSS JOIN LATERAL (
+    SELECT x.key AS type UNION SELECT type FROM type_map WHERE metric = x.key) t)
+INSERT INTO home_daily_rollups (owner_id, metric, day, zone, n, sum_v, min_v, max_v)
+SELECT r.owner_id, d.key, d.day, r.zone, sum(r.n), sum(r.sum_v), min(r.min_v), max(r.max_v)
+FROM day_types d JOIN metric_rollups r
+  ON r.metric = d.type AND r.bucket >= d.day AND r.bucket < d.day + INTERVAL '1 day'
+GROUP BY 1, 2, 3, 4
+ORDER BY 1, 2, 3, 4
+ON CONFLICT (owner_id, metric, day, zone) DO UPDATE SET
+  n = EXCLUDED.n, sum_v = EXCLUDED.sum_v, min_v = EXCLUDED.min_v, max_v = EXCLUDED.max_v
+"""
+    return [zone_sql, daily_delete, daily_insert], params
+
+
+async def refresh_zones(db: AsyncSession, since: datetime | None) -> tuple[int, datetime] | None:
+    """
+    重算 since 之后（按 rollup_dirty 的分钟）有写入的所有 (指标, 小时)；since=None 表示全部。
+    下次最早从 mark - OVERLAP 看起，更早的 rollup_dirty 行顺手删掉。
+    返回 (写入的行数, 本次的水位)，拿不到锁（别的进程在重算）时返回 None。
+    """
+    if not (await db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _REFRESH_LOCK})).scalar():
+        await db.rollback()
+        return None
+    mark = (await db.execute(text("SELECT now()"))).scalar()
+    (zone_sql, *daily), params = _refresh_sql(since is None)
+    if since is not None:
+        params["since_epoch"] = dirty_epoch(since)
+    res = await db.execute(text(zone_sql), params)
+    for sql in daily:
+        await db.execute(text(sql), params)
+    await db.execute(
+        text("DELETE FROM rollup_dirty WHERE epoch < :e"),
+        {"e": dirty_epoch(mark - timedelta(seconds=ROLLUP_REFRESH_OVERLAP_SEC))},
+    )
+    await db.commit()
+    return res.rowcount, mark
+
+
+# -------------------- 覆盖范围 --------------------
+# rollup_state.covered_since：metric_rollups 从这个整点起是完整的（之前的读数没累加进来，除非 rebuild 过）。
+# 'infinity' 表示不可信（ROLLUPS_ENABLED=0 期间的写入没有累加）。只查预聚合的接口据此决定要不要回退到原始读数。
+
+async def mark_coverage(db: AsyncSession):
+    """
+    启动时调用：第一次开启预聚合（或关掉后重新打开）时，覆盖从下一个整点算起（当前小时只累加了一部分）；
+    关着的时候把覆盖清成 'infinity'。已有的起点不动。
+    """
+    if ROLLUPS_ENABLED:
+        sql = (
+            "INSERT INTO rollup_state (id, covered_since) "
+            f"VALUES (1, date_bin('1 hour', now(), {BUCKET_ORIGIN}) + INTERVAL '1 hour') "
+            "ON CONFLICT (id) DO UPDATE SET covered_since = EXCLUDED.covered_since "
+            "WHERE rollup_state.covered_since = 'infinity'"
+        )
+    else:
+        sql = (
+            "INSERT INTO rollup_state (id, covered_since) VALUES (1, 'infinity') "
+            "ON CONFLICT (id) DO UPDATE SET covered_since = EXCLUDED.covered_since"
+        )
+    await db.execute(text(sql))
+    await db.commit()
+
+
+async def extend_coverage(db: AsyncSession, start: datetime | None, end: datetime, open_end: bool):
+    """
+    rebuild 完 [start, end) 之后：原来的起点落在这个区间里就往前推到 start（None = 最早的读数，记 '-infinity'）。
+    还没有起点、而且重建到了最后一条读数（open_end）时，直接从 start 算起。
+    """
+    params = {"start": start, "end": end}
+    await db.execute(text(
+        "UPDATE rollup_state SET covered_since = coalesce(CAST(:start AS timestamptz), '-infinity') "
+        "WHERE id = 1 AND covered_since <= :end "
+        "AND covered_since > coalesce(CAST(:start AS timestamptz), '-infinity')"
+    ), params)
+    if open_end:
+        await db.execute(text(
+            "INSERT INTO rollup_state (id, covered_since) "
+            "VALUES (1, coalesce(CAST(:start AS timestamptz), '-infinity')) ON CONFLICT (id) DO NOTHING"
+        ), params)
+    await db.commit()
+
+
+async def is_covered(db: AsyncSession, since: datetime) -> bool:
+    """since 起的 metric_rollups 是否完整。"""
+    return bool((await db.execute(
+        text("SELECT covered_since <= :since FROM rollup_state WHERE id = 1"), {"since": since},
+    )).scalar())
+
+
+class ZoneRollupRefresher:
+    """后台任务：每 ROLLUP_REFRESH_SEC 秒重算一次有变动的小时。启动时从 zone_rollups 的最新时间接着算。"""
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.watermark: datetime | None = None
+        self.runs = 0
+        self.last_rows = 0
+        self.last_seconds = 0.0
+        self.last_error: str | None = None
+
+    async def start(self, sessionmaker, interval: float = ROLLUP_REFRESH_SEC):
+        if not ROLLUPS_ENABLED or interval <= 0 or self.task is not None:
+            return
+        self.task = asyncio.create_task(self._run(sessionmaker, interval))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def refresh_once(self, db: AsyncSession):
+        if self.watermark is None:
+            self.watermark = (await db.execute(text("SELECT max(refreshed_at) FROM zone_rollups"))).scalar()
+            await db.rollback()
+        since = self.watermark and self.watermark - timedelta(seconds=ROLLUP_REFRESH_OVERLAP_SEC)
+        t0 = time.perf_counter()
+        out = await refresh_zones(db, since)
+        if out is not None:
+            self.last_rows, self.watermark = out
+            self.last_seconds = round(time.perf_counter() - t0, 3)
+            self.runs += 1
+
+    async def _run(self, sessionmaker, interval: float):
+        while True:
+            try:
+                async with sessionmaker() as db:
+                    await self.refresh_once(db)
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = repr(e)
+                print(f"[WARN] zone rollup refresh failed: {e!r}")
+            await asyncio.sleep(interval)
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.task is not None,
+            "watermark": self.watermark,
+            "runs": self.runs,
+            "last_rows": self.last_rows,
+            "last_seconds": self.last_seconds,
+            "last_error": self.last_error,
+        }
+
+
+zone_refresher = ZoneRollupRefresher()
+
+
+# -------------------- 重建 --------------------
+
+async def rebuild(start: datetime | None, end: datetime | None, chunk_days: float) -> dict:
+    """
+    从 sensor_readings 重建 [start, end) 的 metric_rollups（按整点对齐，分块各一个事务），再重算 zone_rollups / home_daily_rollups。
+    重建期间还在写入的读数由 ON CONFLICT 累加，不会丢；但同一块里正在 ingest 的行可能被算两次，
+    所以最好在没有写入的时间段跑。重建的区间接上已有的覆盖时，rollup_state 的起点往前推。
+    """
+    from .db import registry
+    maker = registry.sessionmaker("jobs")
+    t0 = time.perf_counter()
+    from_first, open_end = start is None, end is None
+    async with maker() as db:
+        if start is None or end is None:
+            lo, hi = (await db.execute(text("SELECT min(ts), max(ts) FROM sensor_readings"))).one()
+            if lo is None:
+                await registry.dispose()
+                return {"chunks": 0, "rows": 0, "zone_rows": 0, "seconds": 0.0}
+            start, end = start or lo, end or hi + BUCKET
+        mark = (await db.execute(text("SELECT now()"))).scalar()
+    start = start.replace(minute=0, second=0, microsecond=0)
+    if end != end.replace(minute=0, second=0, microsecond=0):
+        end = end.replace(minute=0, second=0, microsecond=0) + BUCKET
+    step = max(BUCKET, timedelta(days=chunk_days))
+
+    chunks = rows = 0
+    a = start
+    while a < end:
+        b = min(a + step, end)
+        async with maker() as db:
+            await db.execute(text("SET LOCAL synchronous_commit = OFF"))
+            await db.execute(text("DELETE FROM metric_rollups WHERE bucket >= :a AND bucket < :b"), {"a": a, "b": b})
+            await db.execute(text("DELETE FROM zone_rollups WHERE bucket >= :a AND bucket < :b"), {"a": a, "b": b})
+            await db.execute(text(
+                "DELETE FROM home_daily_rollups WHERE day >= :a AND day + INTERVAL '1 day' <= :b"
+            ), {"a": a, "b": b})
+            n = (await db.execute(text(
+                f"WITH {rollup_ctes('(SELECT sensor_id, ts, value FROM sensor_readings WHERE ts >= :a AND ts < :b) r')} "
+                "SELECT count(*) FROM _rh"
+            ), {"a": a, "b": b})).scalar()
+            await db.commit()
+        chunks += 1
+        rows += n
+        print(f"[rollups] {a.isoformat()} .. {b.isoformat()}: {n} home-hours", file=sys.stderr)
+        a = b
+
+    async with maker() as db:
+        out = await refresh_zones(db, mark)
+    async with maker() as db:
+        await extend_coverage(db, None if from_first else start, end, open_end)
+    await registry.dispose()
+    return {
+        "chunks": chunks, "rows": rows, "zone_rows": out[0] if out else None,
+        "seconds": round(time.perf_counter() - t0, 1),
+    }
+
+
+def _dt(s: str) -> datetime:
+    d = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    return d if d.tzinfo else d.replace(tzinfo=timezone.utc)
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="Maintain metric_rollups / zone_rollups / home_daily_rollups")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("rebuild", help="rebuild rollups from sensor_readings")
+    r.add_argument("--start", type=_dt, help="default: first reading")
+    r.add_argument("--end", type=_dt, help="default: last reading")
+    r.add_argument("--chunk-days", type=float, default=7)
+    sub.add_parser("refresh", help="recompute every zone_rollups / home_daily_rollups row from metric_rollups")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "rebuild":
+        out = asyncio.run(rebuild(args.start, args.end, args.chunk_days))
+    else:
+        async def _refresh():
+            from .db import registry
+            async with registry.sessionmaker("jobs")() as db:
+                res = await refresh_zones(db, None)
+            await registry.dispose()
+            return {"zone_rows": res[0] if res else None}
+        out = asyncio.run(_refresh())
+    print(json.dumps(out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import hmac
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import registry
+from ..deps import get_job_db
+from ..profiler import slow_queries
+from ..admission import ingest_admission, ingest_streams, read_admission
+from ..lora_udp import lora_listener
+from ..rollups import zone_refresher
+
+# 运维接口（池占用、慢查询、存储统计）默认关闭：设置 ADMIN_TOKEN 后凭
+# Authorization: Bearer <ADMIN_TOKEN> 访问；没设置时整组返回 404
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/pools")
+def pool_status():
+    # 各角色连接池的实时占用与累计等待/超时，用于按数据调整池大小
+    return {
+        "pools": registry.pool_status(),
+        "admission": {
+            "ingest": ingest_admission.status(), "read": read_admission.status(),
+            "ingest_stream": ingest_streams.status(),
+        },
+        "lora_udp": lora_listener.status(),
+        "zone_rollups": zone_refresher.status(),
+    }
+
+
+@router.get("/slow-queries")
+def slow_query_report(limit: int = Query(50, ge=1, le=500)):
+    # 需设置 SLOW_QUERY_MS>0 才会采集；top 按单次最大耗时排序，recent 为最近的慢语句
+    return slow_queries.snapshot(limit)
+
+
+@router.delete("/slow-queries", status_code=204)
+def slow_query_reset():
+    slow_queries.reset()
+
+
+@router.get("/storage")
+async def storage_report(sample: int = Query(100000, ge=1000, le=5000000), db: AsyncSession = Depends(get_job_db)):
+    # 对比规范化前后每行大小：attr_set_id 为空的是旧行（整份 attributes 存在行内）
+    sizes = (await db.execute(text("""
+        SELECT relname,
+               pg_total_relation_size(c.oid) AS total_bytes,
+               pg_relation_size(c.oid) AS heap_bytes,
+               c.reltuples::bigint AS est_rows
+        FROM pg_class c
+        WHERE relname IN ('sensor_readings', 'reading_attr_sets', 'box_frames') AND relkind = 'r'
+    """))).mappings().all()
+    per_row = (await db.execute(text("""
+        SELECT (attr_set_id IS NOT NULL) AS normalized,
+               count(*) AS rows,
+               avg(pg_column_size(r.*))::float AS avg_row_bytes,
+               avg(pg_column_size(attributes))::float AS avg_attr_bytes
+        FROM (SELECT * FROM sensor_readings ORDER BY ts DESC LIMIT :n) r
+        GROUP BY 1
+    """), {"n": sample})).mappings().all()
+    return {"relations": [dict(r) for r in sizes], "rows_sampled": [dict(r) for r in per_row]}
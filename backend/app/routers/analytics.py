@@ -1,35 +1,21 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import select, or_, func
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select, or_, func, text
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timedelta
-from ..models import SensorReading, Sensor
+from datetime import datetime, timedelta, timezone
+from ..models import SensorReading, Sensor, ReadingAttrSet
 from ..deps import get_db
+from ..serialization import encode_response, columnar_series, explicit_series
+from ..downsample import downsample, METHODS as DOWNSAMPLE_METHODS
+from ..frames import FRAME_STORAGE, FRAME_COLUMNS, frame_column, frame_series
+from ..thresholds import THRESHOLDS, ALIASES, canonical_metric
+from ..rollups import BUCKET, is_covered
+from ..sketches import parse_percentile, merge as merge_sketch, quantile as sketch_quantile
 
 router = APIRouter(prefix="/api/charts", tags=["charts"])
 
-THRESHOLDS = {
-    "co": {"unit": "ppm", "lines": [{"label": "WHO 1-h", "kind": "upper", "value": 30.0}]},
-    "co2": {"unit": "ppm", "lines": [{"label": "ASHRAE", "kind": "upper", "value": 1000.0}]},
-    "light_night": {"unit": "lux", "lines": [{"label": "IES", "kind": "lower", "value": 100.0}, {"label": "IES", "kind": "upper", "value": 200.0}]},
-    "no2": {"unit": "ppb", "lines": [{"label": "WHO 24-h", "kind": "upper", "value": 13.0}]},
-    "noise_night": {"unit": "dB(A)", "lines": [{"label": "WHO night 8h", "kind": "upper", "value": 30.0}]},
-    "o2": {"unit": "% vol", "lines": [{"label": "OSHA", "kind": "lower", "value": 19.5}]},
-    "pm25": {"unit": "µg/m³", "lines": [{"label": "WHO 24-h", "kind": "upper", "value": 15.0}]},
-    "rh": {"unit": "%", "lines": [{"label": "WHO/ASHRAE", "kind": "lower", "value": 30.0}, {"label": "WHO/ASHRAE", "kind": "upper", "value": 60.0}]},
-    "temp": {"unit": "°C", "lines": [{"label": "WHO", "kind": "lower", "value": 18.0}, {"label": "WHO", "kind": "upper", "value": 24.0}]},
-}
-
-ALIASES: dict[str, list[str]] = {
-    "temp": ["temp", "temperature"],
-    "rh": ["rh", "humidity"],
-    "pm25": ["pm25", "pm2_5", "pm2.5"],
-    "co2": ["co2"],
-    "co": ["co"],
-    "no2": ["no2"],
-    "o2": ["o2"],
-    "light_night": ["light_night", "light"],
-    "noise_night": ["noise_night", "noise"],
-}
+# 请求没带 max_points 时的默认点数上限（0 = 不降采样）
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "0"))
 
 def _parse_interval(s: str) -> timedelta:
     u = s[-1].lower()
@@ -51,27 +37,121 @@ def list_metrics():
         out.append({"metric": k, "unit": cfg["unit"], "thresholds": cfg["lines"]})
     return {"metrics": out}
 
-@router.post("/metric_timeseries")
-async def metric_timeseries(payload: dict, db: AsyncSession = Depends(get_db)):
-    serial = (
+def _payload_serial(payload: dict) -> str | None:
+    return (
         payload.get("serial_number")
         or payload.get("serial")
         or payload.get("sensor_serial")
         or payload.get("serial_id")
         or payload.get("sensor_box_id")  # 兼容旧前端，若还在传 box 字段，这里当作 serial 用
     )
-    if not serial:
-        return {"title": "Missing serial_number", "unit": "", "labels": [], "series": [{"name": "n/a", "data": []}], "thresholds": []}
 
-    metric = str(payload["metric"]).lower()
-    start_ts = datetime.fromisoformat(payload["start_ts"])
-    end_ts = datetime.fromisoformat(payload["end_ts"])
-    interval = _parse_interval(payload.get("interval", "5m"))
-    agg = payload.get("agg", "avg")
-    title = payload.get("title") or f"{metric.upper()} vs Time"
 
+def _percentile(vals: list[float], q: float) -> float:
+    # 与 percentile_cont 一致：线性插值
+    vals = sorted(vals)
+    pos = q * (len(vals) - 1)
+    i = int(pos)
+    if i + 1 >= len(vals):
+        return vals[-1]
+    return vals[i] + (vals[i + 1] - vals[i]) * (pos - i)
+
+
+def _aggregate(rows, interval: timedelta, agg: str) -> tuple[datetime | None, list[datetime], list[float]]:
+    """rows 为按 ts 升序的 (ts, value)；返回 (bucket 起点, labels, data)。agg 还可以是 pXX（如 p95）。"""
+    if not rows:
+        return None, [], []
+    q = parse_percentile(agg)
+    base = rows[0][0].replace(second=0, microsecond=0)
+    buckets: dict[datetime, list[float]] = {}
+    for ts, val in rows:
+        b = _bucket(ts, base, interval)
+        buckets.setdefault(b, []).append(val)
+
+    labels, data = [], []
+    for k in sorted(buckets.keys()):
+        vals = buckets[k]
+        if agg == "min": v = min(vals)
+        elif agg == "max": v = max(vals)
+        elif agg == "last": v = vals[-1]
+        elif agg == "sum": v = sum(vals)
+        elif q is not None: v = _percentile(vals, q)
+        else: v = sum(vals) / len(vals)
+        labels.append(k)  # datetime 交给编码器原生处理，不再逐个 isoformat()
+        data.append(v)
+    return base, labels, data
+
+
+def _downsample_opts(payload: dict) -> tuple[int, str]:
+    try:
+        max_points = int(payload.get("max_points") or CHART_MAX_POINTS)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="max_points must be an integer")
+    method = str(payload.get("downsample") or "lttb").lower()
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+    if max_points and max_points < 3:
+        raise HTTPException(status_code=400, detail="max_points must be >= 3")
+    return max_points, method
+
+
+def _reduce(labels: list, data: list, max_points: int, method: str, lines: list) -> tuple[list, list, dict | None]:
+    """超过 max_points 时降采样，返回 (labels, data, 降采样说明或 None)。"""
+    if not max_points or len(data) <= max_points:
+        return labels, data, None
+    n = len(data)
+    labels, data = downsample(labels, data, max_points, method, lines)
+    return labels, data, {"method": method, "points_in": n, "points_out": len(data)}
+
+
+def _percentile_opt(agg: str) -> float | None:
+    try:
+        return parse_percentile(agg)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _sketch_series(
+    db: AsyncSession, serial: str, metric: str, start_ts: datetime, end_ts: datetime, interval: timedelta, q: float,
+) -> tuple[datetime, list[datetime], list[float]] | None:
+    """
+    agg=pXX 且 interval 是整小时：合并 metric_rollups 里这一户的小时草图，不扫原始读数。
+    区间两端按整点取（起点向下取整）。interval 不是整小时、起点早于预聚合的覆盖范围（rollup_state）
+    或没有预聚合数据时返回 None，由调用方回退到原始读数。
+    """
+    if interval < BUCKET or interval % BUCKET:
+        return None
+    origin = start_ts.replace(minute=0, second=0, microsecond=0)
+    if not await is_covered(db, origin):
+        return None
     types = [t.lower() for t in ALIASES.get(metric, [metric])]
+    rows = (await db.execute(text("""
+        SELECT date_bin(CAST(:step AS interval), r.bucket, CAST(:origin AS timestamptz)) AS b, r.min_v, r.max_v, r.sketch
+        FROM metric_rollups r JOIN households h ON h.id = r.owner_id
+        WHERE h.serial_number = :serial AND r.metric = ANY(:types) AND r.bucket >= :origin AND r.bucket < :end
+        ORDER BY b
+    """), {"step": interval, "origin": origin, "serial": serial, "types": types, "end": end_ts})).all()
+    if not rows:
+        return None
+    labels, data = [], []
+    cur, sk, lo, hi = None, {}, None, None
+    for r in rows + [None]:
+        if r is None or r.b != cur:
+            if cur is not None:
+                v = sketch_quantile(sk, q, lo, hi)
+                if v is not None:
+                    labels.append(cur)
+                    data.append(v)
+            if r is None:
+                break
+            cur, sk, lo, hi = r.b, {}, r.min_v, r.max_v
+        merge_sketch(sk, r.sketch)
+        lo, hi = min(lo, r.min_v), max(hi, r.max_v)
+    return origin, labels, data
+
 
+async def _reading_rows(db: AsyncSession, serial: str, metric: str, start_ts: datetime, end_ts: datetime):
+    types = [t.lower() for t in ALIASES.get(metric, [metric])]
     stmt = (
         select(SensorReading.ts, SensorReading.value)
         .join(Sensor, Sensor.id == SensorReading.sensor_id)
@@ -82,32 +162,294 @@ async def metric_timeseries(payload: dict, db: AsyncSession = Depends(get_db)):
             or_(
                 Sensor.serial_number == serial,
                 SensorReading.attributes.op("->>")("serial_number") == serial,
+                SensorReading.attr_set_id.in_(
+                    select(ReadingAttrSet.id).where(ReadingAttrSet.data.op("->>")("serial_number") == serial)
+                ),
             ),
         )
         .order_by(SensorReading.ts.asc())
     )
     res = await db.execute(stmt)
-    rows = res.all()
+    return res.all()
+
+
+async def _metric_rows(db: AsyncSession, serial: str, metric: str, start_ts: datetime, end_ts: datetime):
+    # 开启整帧存储时优先读 box_frames；没有数据再回退到 sensor_readings
+    if FRAME_STORAGE and frame_column(metric) is not None:
+        col = FRAME_COLUMNS[metric]
+        rows = [(ts, v) for ts, v in await frame_series(db, serial, [col], start_ts, end_ts) if v is not None]
+        if rows:
+            return rows
+    return await _reading_rows(db, serial, metric, start_ts, end_ts)
+
+
+@router.post("/metric_timeseries")
+async def metric_timeseries(payload: dict, request: Request, db: AsyncSession = Depends(get_db)):
+    serial = _payload_serial(payload)
+    if not serial:
+        return {"title": "Missing serial_number", "unit": "", "labels": [], "series": [{"name": "n/a", "data": []}], "thresholds": []}
+
+    metric = str(payload["metric"]).lower()
+    start_ts = datetime.fromisoformat(payload["start_ts"])
+    end_ts = datetime.fromisoformat(payload["end_ts"])
+    interval = _parse_interval(payload.get("interval", "5m"))
+    agg = payload.get("agg", "avg")
+    title = payload.get("title") or f"{metric.upper()} vs Time"
+    columnar = payload.get("format") == "columnar"
+    max_points, method = _downsample_opts(payload)
+    q = _percentile_opt(agg)
+
+    sketched = await _sketch_series(db, serial, metric, start_ts, end_ts, interval, q) if q is not None else None
+    if sketched is not None:
+        base, labels, data = sketched
+    else:
+        rows = await _metric_rows(db, serial, metric, start_ts, end_ts)
+        base, labels, data = _aggregate(rows, interval, agg)
 
     cfg = THRESHOLDS.get(metric, {"unit": "", "lines": []})
-    if not rows:
-        return {"title": title, "unit": cfg["unit"], "labels": [], "series": [{"name": metric, "data": []}], "thresholds": cfg["lines"]}
+    labels, data, reduced = _reduce(labels, data, max_points, method, cfg["lines"])
+    extra = {"downsampled": reduced} if reduced else {}
 
-    base = rows[0][0].replace(second=0, microsecond=0)
-    buckets: dict[datetime, list[float]] = {}
-    for ts, val in rows:
-        b = _bucket(ts, base, interval)
-        buckets.setdefault(b, []).append(val)
+    if columnar and reduced:
+        # 降采样后不再等间隔：start_ms/step_ms 表达不了，改为逐点时间戳
+        col = explicit_series(labels, data)
+        return encode_response(request, {"title": title, "unit": cfg["unit"], "format": "columnar", "ts_ms": col["ts_ms"], "series": [{"name": metric, "values": col["values"]}], "thresholds": cfg["lines"], **extra})
+    if columnar:
+        col = columnar_series(labels, data, base or start_ts, interval)
+        return encode_response(request, {"title": title, "unit": cfg["unit"], "format": "columnar", "start_ms": col["start_ms"], "step_ms": col["step_ms"], "series": [{"name": metric, "values": col["values"]}], "thresholds": cfg["lines"]})
+    return encode_response(request, {"title": title, "unit": cfg["unit"], "labels": labels, "series": [{"name": metric, "data": data}], "thresholds": cfg["lines"], **extra})
 
-    labels, data = [], []
-    for k in sorted(buckets.keys()):
-        vals = buckets[k]
-        if agg == "min": v = min(vals)
-        elif agg == "max": v = max(vals)
-        elif agg == "last": v = vals[-1]
-        elif agg == "sum": v = sum(vals)
-        else: v = sum(vals) / len(vals)
-        labels.append(k.isoformat())
-        data.append(v)
 
-    return {"title": title, "unit": cfg["unit"], "labels": labels, "series": [{"name": metric, "data": data}], "thresholds": cfg["lines"]}
+@router.post("/multi_timeseries")
+async def multi_timeseries(payload: dict, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    一个盒子的多个指标（例如某疾病关联的全部 metrics）一次返回：
+      {"serial_number", "metrics": [...], "start_ts", "end_ts", "interval", "agg", "max_points"?, "downsample"?}
+    整帧存储开启时只做一次 box_frames 主键范围扫描。
+    """
+    serial = _payload_serial(payload)
+    if not serial:
+        raise HTTPException(status_code=400, detail="serial_number is required")
+    metrics = [str(m).lower() for m in (payload.get("metrics") or [])]
+    start_ts = datetime.fromisoformat(payload["start_ts"])
+    end_ts = datetime.fromisoformat(payload["end_ts"])
+    interval = _parse_interval(payload.get("interval", "5m"))
+    agg = payload.get("agg", "avg")
+    max_points, method = _downsample_opts(payload)
+    q = _percentile_opt(agg)
+
+    # agg=pXX：能从预聚合草图出的指标先出，剩下的再读原始数据
+    sketched: dict[str, tuple] = {}
+    if q is not None:
+        for m in metrics:
+            out = await _sketch_series(db, serial, m, start_ts, end_ts, interval, q)
+            if out is not None:
+                sketched[m] = out
+
+    per_metric: dict[str, list] = {}
+    frame_metrics = [m for m in metrics if m not in sketched and FRAME_STORAGE and frame_column(m) is not None]
+    if frame_metrics:
+        cols = [FRAME_COLUMNS[m] for m in frame_metrics]
+        wide = await frame_series(db, serial, cols, start_ts, end_ts)
+        for i, m in enumerate(frame_metrics, start=1):
+            rows = [(r[0], r[i]) for r in wide if r[i] is not None]
+            if rows:
+                per_metric[m] = rows
+    for m in metrics:
+        if m not in per_metric and m not in sketched:
+            per_metric[m] = await _reading_rows(db, serial, m, start_ts, end_ts)
+
+    series = []
+    for m in metrics:
+        cfg = THRESHOLDS.get(m, {"unit": "", "lines": []})
+        _, labels, data = sketched[m] if m in sketched else _aggregate(per_metric[m], interval, agg)
+        labels, data, reduced = _reduce(labels, data, max_points, method, cfg["lines"])
+        item = {"name": m, "unit": cfg["unit"], "labels": labels, "data": data, "thresholds": cfg["lines"]}
+        if reduced:
+            item["downsampled"] = reduced
+        series.append(item)
+    return encode_response(request, {"serial_number": serial, "series": series})
+
+
+# -------------------- zone / 全网（预聚合） --------------------
+
+DEFAULT_PERCENTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+def _zone_opts(payload: dict) -> tuple[str, datetime, datetime, list[str] | None]:
+    try:
+        metric = canonical_metric(str(payload["metric"]))
+        start_ts = datetime.fromisoformat(payload["start_ts"])
+        end_ts = datetime.fromisoformat(payload["end_ts"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="metric, start_ts and end_ts are required")
+    zones = payload.get("zones")
+    if zones is not None:
+        zones = [str(z).upper() for z in zones] or None
+    return metric, start_ts, end_ts, zones
+
+
+@router.post("/zone_timeseries")
+async def zone_timeseries(payload: dict, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    每个 zone 以及全网（"all"，只含所选 zones）的一个指标随时间变化，读 zone_rollups：
+      {"metric", "start_ts", "end_ts", "interval": "1h" 的整数倍, "zones"?: ["A", ...], "percentiles"?: ["p50", "p95"]}
+    mean 按读数加权；share_over[i] 是越过第 i 条阈值线的户·小时占比（户按该小时均值判断）。
+    percentiles 由各小时的草图合并得到（相对误差约 1%），全网的按所选 zones 合并。
+    最近 ROLLUP_REFRESH_SEC 秒内的写入可能还没算进来。
+    """
+    metric, start_ts, end_ts, zones = _zone_opts(payload)
+    try:
+        step = _parse_interval(payload.get("interval", "1h"))
+    except (ValueError, IndexError):
+        raise HTTPException(status_code=400, detail="bad interval")
+    if step < BUCKET or step % BUCKET:
+        raise HTTPException(status_code=400, detail="interval must be a whole number of hours")
+    cfg = THRESHOLDS.get(metric, {"unit": "", "lines": []})
+    nlines = len(cfg["lines"])
+    wanted = [str(p).lower() for p in (payload.get("percentiles") or [])]
+    qs = [_percentile_opt(p) for p in wanted]
+    if any(q is None for q in qs):
+        raise HTTPException(status_code=400, detail="percentiles must look like p50, p95, p99.9")
+
+    over_cols = "".join(f", sum(homes_over[{i + 1}]) AS over_{i}" for i in range(nlines))
+    zone_filter = " AND zone = ANY(:zones)" if zones else ""
+    origin = start_ts.replace(minute=0, second=0, microsecond=0)
+    rows = (await db.execute(text(f"""
+        SELECT GROUPING(zone) = 1 AS fleet, zone, b, sum(n) AS n, sum(sum_v) AS sum_v,
+               min(min_v) AS min_v, max(max_v) AS max_v, sum(homes) AS home_hours{over_cols}
+        FROM (SELECT zone, date_bin(CAST(:step AS interval), bucket, CAST(:origin AS timestamptz)) AS b, n, sum_v, min_v, max_v, homes, homes_over
+              FROM zone_rollups
+              WHERE metric = :metric AND bucket >= :start AND bucket < :end{zone_filter}) z
+        GROUP BY GROUPING SETS ((zone, b), (b))
+        ORDER BY fleet, zone, b
+    """), {
+        "step": step, "origin": origin, "metric": metric, "start": origin, "end": end_ts, **({"zones": zones} if zones else {}),
+    })).all()
+
+    labels = sorted({r.b for r in rows})
+    pos = {b: i for i, b in enumerate(labels)}
+    out: dict[str, dict] = {}
+    for r in rows:
+        key = "all" if r.fleet else r.zone
+        z = out.get(key)
+        if z is None:
+            z = out[key] = {
+                "zone": key, "mean": [None] * len(labels), "min": [None] * len(labels), "max": [None] * len(labels),
+                "home_hours": [0] * len(labels), "share_over": [[None] * len(labels) for _ in range(nlines)],
+            }
+        i = pos[r.b]
+        z["mean"][i] = r.sum_v / r.n if r.n else None
+        z["min"][i], z["max"][i], z["home_hours"][i] = r.min_v, r.max_v, int(r.home_hours)
+        for k in range(nlines):
+            over = getattr(r, f"over_{k}")
+            z["share_over"][k][i] = (over or 0) / r.home_hours if r.home_hours else None
+
+    if qs:
+        # (zone, 区间) -> [草图, min, max]；"all" 合并所选的全部 zone
+        merged: dict[tuple[str, datetime], list] = {}
+        sketch_rows = await db.execute(text(f"""
+            SELECT zone, date_bin(CAST(:step AS interval), bucket, CAST(:origin AS timestamptz)) AS b,
+                   min_v, max_v, sketch
+            FROM zone_rollups
+            WHERE metric = :metric AND bucket >= :start AND bucket < :end{zone_filter}
+        """), {"step": step, "origin": origin, "metric": metric, "start": origin, "end": end_ts,
+               **({"zones": zones} if zones else {})})
+        for r in sketch_rows:
+            for key in (r.zone, "all"):
+                acc = merged.get((key, r.b))
+                if acc is None:
+                    acc = merged[(key, r.b)] = [{}, r.min_v, r.max_v]
+                merge_sketch(acc[0], r.sketch)
+                acc[1], acc[2] = min(acc[1], r.min_v), max(acc[2], r.max_v)
+        for key, z in out.items():
+            z["percentiles"] = {p: [None] * len(labels) for p in wanted}
+            for b, i in pos.items():
+                acc = merged.get((key, b))
+                if acc is None:
+                    continue
+                for p, q in zip(wanted, qs):
+                    z["percentiles"][p][i] = sketch_quantile(acc[0], q, acc[1], acc[2])
+
+    return encode_response(request, {
+        "metric": metric, "unit": cfg["unit"], "interval": payload.get("interval", "1h"), "thresholds": cfg["lines"],
+        "labels": labels, "zones": list(out.values()),
+    })
+
+
+def _floor_day(t: datetime) -> datetime:
+    # home_daily_rollups 的天按 UTC 零点对齐
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc)
+    return t.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil_day(t: datetime) -> datetime:
+    d = _floor_day(t)
+    return d if d == t else d + timedelta(days=1)
+
+
+@router.post("/zone_distribution")
+async def zone_distribution(payload: dict, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    时间段内每户的均值在各 zone 和全网（"all"）上的分布：
+      {"metric", "start_ts", "end_ts", "zones"?, "percentiles"?: [0.5, 0.9, ...]}
+    返回户数、户均值的 mean/min/max/分位数，以及均值越过每条阈值线的户数占比。
+    整天的部分读 home_daily_rollups，两头不满一天的小时读 metric_rollups。
+    """
+    metric, start_ts, end_ts, zones = _zone_opts(payload)
+    try:
+        ps = [float(p) for p in (payload.get("percentiles") or DEFAULT_PERCENTILES)]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="percentiles must be numbers in [0, 1]")
+    if not all(0.0 <= p <= 1.0 for p in ps):
+        raise HTTPException(status_code=400, detail="percentiles must be numbers in [0, 1]")
+    cfg = THRESHOLDS.get(metric, {"unit": "", "lines": []})
+    types = [t.lower() for t in ALIASES.get(metric, [metric])]
+
+    over_cols = "".join(
+        f", count(*) FILTER (WHERE mean {'>' if ln['kind'] == 'upper' else '<'} CAST(:line_{i} AS float8)) AS over_{i}"
+        for i, ln in enumerate(cfg["lines"])
+    )
+    zone_filter = " AND zone = ANY(:zones)" if zones else ""
+    start = start_ts.replace(minute=0, second=0, microsecond=0)
+    d0, d1 = _ceil_day(start), _floor_day(end_ts)
+    if d0 >= d1:
+        d0 = d1 = end_ts
+    rows = (await db.execute(text(f"""
+        WITH parts AS (
+          SELECT zone, owner_id, n, sum_v
+          FROM home_daily_rollups
+          WHERE metric = :metric AND day >= :d0 AND day < :d1{zone_filter}
+          UNION ALL
+          SELECT zone, owner_id, n, sum_v
+          FROM metric_rollups
+          WHERE metric = ANY(:types)
+            AND ((bucket >= :start AND bucket < :d0) OR (bucket >= :d1 AND bucket < :end)){zone_filter}),
+        per_home AS (
+          SELECT zone, owner_id, sum(sum_v) / sum(n) AS mean
+          FROM parts
+          GROUP BY zone, owner_id)
+        SELECT GROUPING(zone) = 1 AS fleet, zone, count(*) AS homes, avg(mean) AS mean,
+               min(mean) AS min, max(mean) AS max,
+               percentile_cont(CAST(:ps AS float8[])) WITHIN GROUP (ORDER BY mean) AS pct{over_cols}
+        FROM per_home
+        GROUP BY GROUPING SETS ((zone), ())
+        ORDER BY fleet, zone
+    """), {
+        "metric": metric, "types": types, "start": start, "end": end_ts, "d0": d0, "d1": d1, "ps": ps,
+        **{f"line_{i}": float(ln["value"]) for i, ln in enumerate(cfg["lines"])},
+        **({"zones": zones} if zones else {}),
+    })).all()
+
+    out = []
+    for r in rows:
+        if not r.homes:
+            continue
+        out.append({
+            "zone": "all" if r.fleet else r.zone,
+            "homes": r.homes, "mean": r.mean, "min": r.min, "max": r.max,
+            "percentiles": dict(zip((f"p{round(p * 100, 2):g}" for p in ps), r.pct or [])),
+            "share_over": [getattr(r, f"over_{i}") / r.homes for i in range(len(cfg["lines"]))],
+        })
+    return encode_response(request, {"metric": metric, "unit": cfg["unit"], "thresholds": cfg["lines"], "zones": out})
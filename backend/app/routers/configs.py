@@ -0,0 +1,161 @@
+import asyncio
+from uuid import UUID
+from typing import Any
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config_hub import config_hub, NOTIFY_CHANNEL
+from ..db import registry
+from ..deps import get_db
+from ..models import Sensor, SensorConfig
+from ..schemas import ConfigCreate
+from ..serialization import encode_response, dumps_json
+
+router = APIRouter(prefix="/api/configs", tags=["configs"])
+
+MAX_WAIT_SEC = 30.0
+WS_RESYNC_SEC = 25.0
+
+# cursor 即 sensor_configs.id（全局单调）；revision 是单个传感器自己的版本号。
+# 写配置时持有 _WRITE_LOCK 直到提交，id 的分配顺序就是提交顺序：读到 id=X 时 X 之前的都已落定，
+# cursor 可以直接推进到读到的最大 id，不会漏掉晚提交的小 id。
+_WRITE_LOCK = 0x63666773
+
+
+def _config_dict(row: SensorConfig) -> dict:
+    return {
+        "sensor_id": row.sensor_id,
+        "revision": row.revision,
+        "cursor": row.id,
+        "data": row.data,
+        "created_at": row.created_at,
+    }
+
+
+async def _changes_since(db: AsyncSession, since: int, sensor_ids: list[UUID] | None, limit: int) -> dict:
+    """
+    since 之后的配置变更，按 id 分页：每页里同一传感器只留最新一版。
+    cursor 总是推进到本次扫过的位置——没被 sensor_ids 选中的变更也算扫过，否则客户端会一直被它唤醒；
+    truncated=True 表示还有下一页，拿返回的 cursor 接着拉。
+    """
+    high = (await db.execute(select(func.coalesce(func.max(SensorConfig.id), 0)))).scalar_one()
+    stmt = select(SensorConfig).where(SensorConfig.id > since, SensorConfig.id <= high)
+    if sensor_ids:
+        stmt = stmt.where(SensorConfig.sensor_id.in_(sensor_ids))
+    rows = (await db.execute(stmt.order_by(SensorConfig.id).limit(limit))).scalars().all()
+    truncated = len(rows) >= limit
+    cursor = rows[-1].id if truncated else max(since, high)
+    latest: dict[UUID, SensorConfig] = {}
+    for r in rows:
+        latest[r.sensor_id] = r
+    config_hub.publish(high)
+    out = {"cursor": cursor, "configs": [_config_dict(r) for r in latest.values()]}
+    if truncated:
+        out["truncated"] = True
+    return out
+
+
+@router.post("/sync")
+async def sync_configs(payload: dict[str, Any], request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    批量拉取 "revision R 之后变过的全部配置"：
+      {"since": 0, "sensor_ids": [...]?, "wait": 0..30, "limit": 5000}
+    wait>0 时为长轮询：没有变更就挂起直到有变更或超时，超时返回空 configs 和（可能已推进的）cursor。
+    """
+    since = int(payload.get("since") or 0)
+    wait = max(0.0, min(MAX_WAIT_SEC, float(payload.get("wait") or 0)))
+    limit = max(1, min(20000, int(payload.get("limit") or 5000)))
+    try:
+        sensor_ids = [UUID(str(x)) for x in (payload.get("sensor_ids") or [])] or None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bad sensor_ids")
+
+    out = await _changes_since(db, since, sensor_ids, limit)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    # 被别的传感器的变更唤醒时 cursor 前进、configs 为空，继续等到截止
+    while not out["configs"] and not out.get("truncated"):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        # 长轮询期间不要占着连接：先归还，被唤醒后再查
+        await db.rollback()
+        if not await config_hub.wait(out["cursor"], remaining):
+            break
+        out = await _changes_since(db, out["cursor"], sensor_ids, limit)
+    return encode_response(request, out)
+
+
+@router.websocket("/ws")
+async def config_feed(ws: WebSocket):
+    """
+    变更推送：/api/configs/ws?since=R&sensor_ids=a,b,c
+    连上后先推一次 since 之后的配置（积压多时分页连续推，每页带 truncated），
+    之后每有变更推一条 {"cursor", "configs"}；只涉及过滤外传感器的变更不推，只推进服务端的 cursor。
+    """
+    await ws.accept()
+    try:
+        since = int(ws.query_params.get("since") or 0)
+        raw_ids = [x for x in (ws.query_params.get("sensor_ids") or "").split(",") if x]
+        sensor_ids = [UUID(x) for x in raw_ids] or None
+    except ValueError:
+        await ws.close(code=1008)
+        return
+
+    async def _drain():
+        # 只用来感知客户端断开；客户端发来的消息忽略
+        while True:
+            await ws.receive_text()
+
+    maker = registry.sessionmaker("read")
+    reader = asyncio.create_task(_drain())
+    try:
+        while not reader.done():
+            async with maker() as db:
+                out = await _changes_since(db, since, sensor_ids, 5000)
+            if out["configs"]:
+                await ws.send_text(dumps_json(out).decode("utf-8"))
+            since = out["cursor"]
+            if out.get("truncated"):
+                continue  # 下一页
+            waiter = asyncio.create_task(config_hub.wait(since, WS_RESYNC_SEC))
+            await asyncio.wait({waiter, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+
+
+@router.get("/{sensor_id}")
+async def get_config(sensor_id: UUID, request: Request, db: AsyncSession = Depends(get_db)):
+    stmt = select(SensorConfig).where(SensorConfig.sensor_id == sensor_id).order_by(SensorConfig.id.desc()).limit(1)
+    row = (await db.execute(stmt)).scalars().first()
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Config not found")
+    return encode_response(request, _config_dict(row))
+
+
+@router.put("/{sensor_id}", status_code=status.HTTP_201_CREATED)
+async def put_config(sensor_id: UUID, payload: ConfigCreate, request: Request, db: AsyncSession = Depends(get_db)):
+    exists = (await db.execute(select(Sensor.id).where(Sensor.id == sensor_id))).scalar_one_or_none()
+    if not exists:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sensor not found")
+
+    # 串行化配置写入（见 _WRITE_LOCK），revision 的 max+1 也不会撞；配置变更很少，排队的代价可以忽略
+    await db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _WRITE_LOCK})
+    revision = payload.revision
+    if revision is None:
+        cur = select(func.coalesce(func.max(SensorConfig.revision), 0)).where(SensorConfig.sensor_id == sensor_id)
+        revision = int((await db.execute(cur)).scalar_one()) + 1
+
+    row = SensorConfig(sensor_id=sensor_id, revision=revision, data=payload.data)
+    db.add(row)
+    await db.flush()
+    # 事务提交时才会真正投递，其他 worker 的 LISTEN 由此唤醒
+    await db.execute(text("SELECT pg_notify(:ch, :payload)"), {"ch": NOTIFY_CHANNEL, "payload": str(row.id)})
+    await db.commit()
+    await db.refresh(row)
+    config_hub.publish(row.id)
+    return encode_response(request, _config_dict(row), status_code=status.HTTP_201_CREATED)
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, HTTPException, Request, status
+from ..db import registry
+from ..live_cache import sensor_directory, house_snapshot
+from ..serialization import encode_response
+
+router = APIRouter(prefix="/api/houses", tags=["houses"])
+
+
+@router.get("/{house_id}/latest")
+async def house_latest(house_id: str, request: Request):
+    """整户每个传感器的最新读数，一次调用、直接读内存缓存（不查库）。"""
+    sensors = sensor_directory.sensors_of(house_id)
+    if not sensors:
+        # 目录里没有（例如刚在别的 worker 开通）：回源查一次这户的传感器
+        async with registry.sessionmaker("read")() as db:
+            sensors = await sensor_directory.load_house(db, house_id)
+        if not sensors:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="House not found or has no sensors")
+    return encode_response(request, house_snapshot(house_id, sensors))
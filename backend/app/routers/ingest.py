@@ -1,35 +1,253 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
 from typing import Any, List, Union
-from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import insert, text
-from ..models import SensorReading
-from ..deps import get_db
+from ..db import registry
+from ..deps import get_ingest_db, get_job_db
+from ..metrics import INGEST_DUPLICATES, FRAMES_DECODED
+from ..live_cache import RecentKeys
+from ..frames import decode_frame, FRAME_BYTES
+from ..admission import ingest_admission, ingest_streams
+from ..serialization import dumps_json
+from ..executors import run_cpu, ExecutorBusy
+from ..ingest_pipeline import (
+    BadReading, server_clock, coerce_row, coerce_frame, coerce_frames, write_readings, backfill_readings, write_frames,
+    IngestBatcher,
+)
 
 router = APIRouter(tags=["ingest"])
 
-# 简单输入模型（也可直接用 dict）
-def _coerce_row(row: dict[str, Any]) -> dict[str, Any]:
+BACKFILL_MAX_ROWS = int(os.getenv("BACKFILL_MAX_ROWS", "200000"))
+# 超过这么多帧的 /ingest/frames 请求在进程池里解码，不占事件循环
+FRAME_OFFLOAD_MIN = int(os.getenv("INGEST_FRAME_OFFLOAD_MIN", "500"))
+STREAM_ACK_SEC = float(os.getenv("INGEST_STREAM_ACK_SEC", "1.0"))
+# 流式连接上未提交的条目超过这个数就暂停读 socket，让 TCP 窗口把压力传回网关
+STREAM_MAX_BACKLOG = int(os.getenv("INGEST_STREAM_MAX_BACKLOG", "20000"))
+
+_recent_batches = RecentKeys(int(os.getenv("INGEST_RECENT_BATCHES", "10000")))  # Idempotency-Key -> 响应
+
+
+def _coerce_all(rows: list, now: datetime) -> list[dict[str, Any]]:
     try:
-        sid = UUID(str(row["sensor_id"]))
-        val = float(row["value"])
-    except Exception:
-        raise HTTPException(status_code=400, detail="bad sensor_id or value")
-    attrs = row.get("attributes") or {}
-    if not isinstance(attrs, dict):
-        attrs = {}
-    return {"sensor_id": sid, "value": val, "attributes": attrs}
-
-@router.post("/ingest")
-async def ingest(payload: Union[dict, List[dict]], db: AsyncSession = Depends(get_db)):
+        return [coerce_row(r, now) for r in rows]
+    except BadReading as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _unpack(payload: Union[dict, List[dict]]) -> tuple[list, str | None]:
+    # 三种形状：单条 / 列表 / {"batch_id": ..., "readings": [...]}
+    if isinstance(payload, list):
+        return payload, None
+    if "readings" in payload and "sensor_id" not in payload:
+        if not isinstance(payload["readings"], list):
+            raise HTTPException(status_code=400, detail="readings must be a list")
+        return payload["readings"], payload.get("batch_id")
+    return [payload], None
+
+
+async def _backfill(db: AsyncSession, data: list[dict[str, Any]]) -> dict:
+    if len(data) > BACKFILL_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"at most {BACKFILL_MAX_ROWS} rows per backfill request")
+    return await backfill_readings(db, data)
+
+
+@router.post("/ingest", dependencies=[Depends(ingest_admission)])
+async def ingest(
+    payload: Union[dict, List[dict]],
+    mode: str = Query("live", pattern="^(live|backfill)$"),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_ingest_db),
+):
+    rows, batch_id = _unpack(payload)
+    batch_key = idempotency_key or batch_id
+    if batch_key and batch_key in _recent_batches:
+        INGEST_DUPLICATES.inc(len(rows), "batch")
+        return {**_recent_batches.get(batch_key), "replayed": True}
+
+    data = _coerce_all(rows, datetime.now(timezone.utc))
+    if mode == "backfill":
+        out = await _backfill(db, data)
+    else:
+        out = await write_readings(db, data)
+    if batch_key:
+        _recent_batches.add(batch_key, out)
+    return out
+
+
+@router.post("/ingest/backfill", dependencies=[Depends(ingest_admission)])
+async def ingest_backfill(
+    payload: Union[dict, List[dict]],
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_job_db),
+):
+    """
+    网关离线缓存 / 历史窗口的一次性回填：每条必须带设备时间 ts（ISO 或 epoch 秒 / 毫秒）。
+    走 jobs 连接池，不和实时 ingest 抢连接；重复的 (sensor_id, ts) 直接丢弃，可放心重试。
+    """
+    rows, batch_id = _unpack(payload)
+    batch_key = idempotency_key or batch_id
+    if batch_key and batch_key in _recent_batches:
+        return {**_recent_batches.get(batch_key), "replayed": True}
+    if any(r.get("ts") is None and not (r.get("attributes") or {}).get("ts") for r in rows if isinstance(r, dict)):
+        raise HTTPException(status_code=400, detail="backfill rows require ts")
+    out = await _backfill(db, _coerce_all(rows, datetime.now(timezone.utc)))
+    if batch_key:
+        _recent_batches.add(batch_key, out)
+    return out
+
+
+@router.post("/ingest/frames", dependencies=[Depends(ingest_admission)])
+async def ingest_frames(payload: Union[dict, List[dict]], db: AsyncSession = Depends(get_ingest_db)):
+    """
+    整帧写入 box_frames：每个元素是
+      {"serial_number", "ts"?, "payload_hex" | "payload_b64"}（22 字节 LoRaWAN 帧），
+    或已解码的 {"serial_number", "ts"?, "temp_c", "rh_pct", ...}。
+    """
     rows = payload if isinstance(payload, list) else [payload]
-    data = [_coerce_row(r) for r in rows]
+    try:
+        if len(rows) >= FRAME_OFFLOAD_MIN:
+            data, decoded = await run_cpu(coerce_frames, rows, label="decode_frames")
+            FRAMES_DECODED.inc(decoded, "http")
+        else:
+            data = [coerce_frame(r) for r in rows]
+    except BadReading as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="decoder busy", headers={"Retry-After": "1"})
+    return await write_frames(db, data)
 
-    # 写入只做一件事：插入。不要在这里 JOIN、查 sensor、做复杂逻辑
-    # 可选：降低持久化延迟（掉电可能丢最近几条）——提升吞吐
-    await db.execute(text("SET LOCAL synchronous_commit = OFF"))
 
-    stmt = insert(SensorReading).values(data)
-    await db.execute(stmt)
-    await db.commit()
-    return {"ok": True, "n": len(data)}
+# -------------------- 长连接流式写入（网关） --------------------
+
+def _feed_line(batcher: IngestBatcher, line: str | bytes, now: datetime, source: str) -> str | None:
+    """一行 JSON：带 sensor_id 的是单条读数，否则按整帧处理。返回错误信息或 None。"""
+    try:
+        obj = json.loads(line)
+        if not isinstance(obj, dict):
+            raise BadReading("expected a JSON object")
+        if "sensor_id" in obj:
+            batcher.add_reading(coerce_row(obj, now))
+        else:
+            batcher.add_frame(coerce_frame(obj, source))
+    except (ValueError, BadReading) as e:  # json.JSONDecodeError 是 ValueError
+        batcher.skip()
+        return str(e)
+    return None
+
+
+def _feed_frames(batcher: IngestBatcher, blob: bytes, now: datetime) -> str | None:
+    # 二进制消息：一个或多个首尾相接的 22 字节帧（serial 取帧内字段）
+    if not blob or len(blob) % FRAME_BYTES:
+        batcher.skip()
+        return f"binary message must be a multiple of {FRAME_BYTES} bytes"
+    for k in range(0, len(blob), FRAME_BYTES):
+        try:
+            batcher.add_frame(decode_frame(blob[k:k + FRAME_BYTES], server_clock.stamp(now)))
+        except (ValueError, TypeError) as e:
+            batcher.skip()
+            return f"bad frame: {e}"
+        FRAMES_DECODED.inc(1, "ws")
+    return None
+
+
+@router.websocket("/ingest/ws")
+async def ingest_ws(ws: WebSocket):
+    """
+    网关长连接：每条文本消息是一行或多行 NDJSON（读数或整帧），二进制消息是原始 22 字节帧。
+    服务端按条数 / 时间攒批写库，每 INGEST_STREAM_ACK_SEC 秒（或每次提交后）推一条
+    {"offset", "committed", "accepted", "dropped", "invalid"}；断线重连后从 committed 之后重发。
+    """
+    if not ingest_streams.try_acquire():
+        await ws.close(code=1013)  # Try Again Later
+        return
+    try:
+        await _ingest_ws(ws)
+    finally:
+        ingest_streams.release()
+
+
+async def _ingest_ws(ws: WebSocket):
+    await ws.accept()
+    batcher = IngestBatcher(registry.sessionmaker("ingest"))
+    batcher.start()
+    last_ack = [None]
+
+    async def _acker():
+        try:
+            while True:
+                await batcher.wait_committed(STREAM_ACK_SEC)
+                ack = batcher.ack()
+                if ack != last_ack[0]:
+                    last_ack[0] = ack
+                    await ws.send_text(dumps_json(ack).decode("utf-8"))
+                if batcher.error is not None:
+                    await ws.close(code=1011)
+                    return
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    acker = asyncio.create_task(_acker())
+    try:
+        while batcher.error is None:
+            while batcher.backlog >= STREAM_MAX_BACKLOG and batcher.error is None:
+                await batcher.wait_committed(STREAM_ACK_SEC)
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            now = datetime.now(timezone.utc)
+            if msg.get("bytes") is not None:
+                err = _feed_frames(batcher, msg["bytes"], now)
+                errors = [err] if err else []
+            else:
+                errors = [e for e in (
+                    _feed_line(batcher, line, now, "ws") for line in msg.get("text", "").splitlines() if line.strip()
+                ) if e]
+            if errors:
+                await ws.send_text(dumps_json({"offset": batcher.offset, "errors": errors[:10]}).decode("utf-8"))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        acker.cancel()
+        await batcher.close()
+
+
+@router.post("/ingest/stream", dependencies=[Depends(ingest_streams)])
+async def ingest_stream(request: Request):
+    """
+    分块上传的 NDJSON（Content-Type: application/x-ndjson）：边收边攒批写库，
+    不需要等整个请求体到齐。结束时返回汇总和已提交的 offset。
+    """
+    batcher = IngestBatcher(registry.sessionmaker("ingest"))
+    batcher.start()
+    errors: list[dict] = []
+    buf = b""
+    try:
+        async for chunk in request.stream():
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            now = datetime.now(timezone.utc)
+            for line in lines:
+                if not line.strip():
+                    continue
+                err = _feed_line(batcher, line, now, "http")
+                if err and len(errors) < 100:
+                    errors.append({"offset": batcher.offset, "error": err})
+            while batcher.backlog >= STREAM_MAX_BACKLOG and batcher.error is None:
+                await batcher.wait_committed(STREAM_ACK_SEC)
+            if batcher.error is not None:
+                break
+        if buf.strip() and batcher.error is None:
+            err = _feed_line(batcher, buf, datetime.now(timezone.utc), "http")
+            if err and len(errors) < 100:
+                errors.append({"offset": batcher.offset, "error": err})
+    finally:
+        await batcher.close()
+    out = batcher.ack()
+    out["ok"] = batcher.error is None
+    out["errors"] = errors
+    if batcher.error is not None:
+        raise HTTPException(status_code=503, detail=out, headers={"Retry-After": "1"})
+    return out
@@ -1,20 +1,41 @@
-from fastapi import APIRouter, Depends
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from datetime import datetime
-from ..models import SensorReading
+from ..models import SensorReading, ReadingAttrSet
 from ..deps import get_db
+from ..serialization import encode_response
+from ..frames import FRAME_STORAGE, frame_readings
+from ..attr_sets import merge_attributes
 
 router = APIRouter()
 
 @router.post("/api/readings/query")
-async def query_readings(payload: dict, db: AsyncSession = Depends(get_db)):
-    sensor_id = payload["sensor_id"]
+async def query_readings(payload: dict, request: Request, db: AsyncSession = Depends(get_db)):
+    try:
+        sensor_id = UUID(str(payload["sensor_id"]))
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="bad sensor_id")
     start_ts = payload.get("start_ts")
     end_ts = payload.get("end_ts")
     limit = int(payload.get("limit", 500))
 
-    stmt = select(SensorReading).where(SensorReading.sensor_id == sensor_id)
+    if FRAME_STORAGE:
+        rows = await frame_readings(
+            db, sensor_id,
+            datetime.fromisoformat(start_ts) if start_ts else None,
+            datetime.fromisoformat(end_ts) if end_ts else None,
+            limit,
+        )
+        if rows is not None:
+            return encode_response(request, rows)
+
+    # 静态属性（unit/box/serial_number）在 reading_attr_sets 里，按 attr_set_id 拼回去
+    stmt = select(
+        SensorReading.id, SensorReading.sensor_id, SensorReading.ts, SensorReading.value, SensorReading.attributes,
+        ReadingAttrSet.data.label("static_attrs"),
+    ).outerjoin(ReadingAttrSet, ReadingAttrSet.id == SensorReading.attr_set_id).where(SensorReading.sensor_id == sensor_id)
     if start_ts:
         stmt = stmt.where(SensorReading.ts >= datetime.fromisoformat(start_ts))
     if end_ts:
@@ -22,15 +43,16 @@ async def query_readings(payload: dict, db: AsyncSession = Depends(get_db)):
     stmt = stmt.order_by(desc(SensorReading.ts)).limit(limit)
 
     res = await db.execute(stmt)
-    rows = res.scalars().all()
+    rows = res.all()
 
-    return [
+    # 只取列、不构造 ORM 对象；UUID / datetime 由编码器原生序列化
+    return encode_response(request, [
         {
             "id": r.id,
-            "sensor_id": str(r.sensor_id),
-            "ts": r.ts.isoformat(),
+            "sensor_id": r.sensor_id,
+            "ts": r.ts,
             "value": r.value,
-            "attributes": r.attributes,
+            "attributes": merge_attributes(r.static_attrs, r.attributes),
         }
         for r in rows[::-1]
-    ]
+    ])
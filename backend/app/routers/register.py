@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Any
+from fastapi import APIRouter, Depends, HTTPException, status, Body
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.schemas import RegisterIn, RegisterOut
 from app.models import Household
 from app.utils import build_house_id
-from app.db import get_db
+from app.deps import get_db, get_job_db
+from app.household_import import import_households, summarize
+
+BULK_MAX_ROWS = 20000
 
 router = APIRouter(prefix="/api", tags=["registration"])
 
@@ -30,3 +34,12 @@ async def register(data: RegisterIn, db: AsyncSession = Depends(get_db)):
     print("INSERT", house_id)
     await db.commit()
     return RegisterOut(house_id=house_id)
+
+
+@router.post("/register/bulk")
+async def register_bulk(rows: list[dict[str, Any]] = Body(...), db: AsyncSession = Depends(get_job_db)):
+    """整区导入：逐行返回 created / invalid / duplicate_in_batch / conflict。"""
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"at most {BULK_MAX_ROWS} rows per request")
+    results = await import_households(db, rows)
+    return {"summary": summarize(results), "results": results}
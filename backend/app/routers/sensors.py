@@ -1,12 +1,21 @@
+import asyncio
+import base64
+import json
+import uuid
 from uuid import UUID
 from typing import Any, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Path, Request
+from sqlalchemy import select, func, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..deps import get_db
-from ..models import Sensor, Household
-from ..schemas import SensorCreate, SensorOut
-from datetime import datetime
+from ..models import Sensor, SensorReading, Household, sensor_search_expr
+from ..schemas import SensorCreate, SensorOut, BoxProvisionIn, BoxProvisionOut
+from ..serialization import encode_response
+from ..live_cache import sensor_directory, SensorInfo
+from ..executors import run_cpu, ExecutorBusy
+from datetime import datetime, timedelta, timezone
 import httpx
 
 try:
@@ -30,9 +39,71 @@ def to_sensor_out(row: Sensor) -> SensorOut:
     )
 
 
+def sensor_row_dict(row: Sensor) -> dict:
+    # 与 SensorOut 字段一致的普通 dict，热点列表接口用它绕过逐行 pydantic 校验
+    return {
+        "id": row.id,
+        "name": row.name,
+        "type": row.type,
+        "location": row.location,
+        "serial_number": row.serial_number,
+        "meta": row.meta or {},
+    }
+
+
+# house_id -> households.id；住户主键不会变，缓存后列表接口不再每次跑标量子查询
+_HOUSE_PK_CACHE: dict[str, int] = {}
+_HOUSE_PK_CACHE_MAX = 10000
+
+
+async def _house_pk(db: AsyncSession, house_id: str) -> int | None:
+    pk = _HOUSE_PK_CACHE.get(house_id)
+    if pk is None:
+        pk = (await db.execute(select(Household.id).where(Household.house_id == house_id))).scalar_one_or_none()
+        if pk is not None:
+            if len(_HOUSE_PK_CACHE) >= _HOUSE_PK_CACHE_MAX:
+                _HOUSE_PK_CACHE.clear()
+            _HOUSE_PK_CACHE[house_id] = pk
+    return pk
+
+
+def _encode_cursor(name: str, sid: UUID) -> str:
+    raw = json.dumps([name, str(sid)], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        name, sid = json.loads(raw)
+        return str(name), UUID(sid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="bad cursor")
+
+
+def _like_escape(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def _estimate_rows(db: AsyncSession, stmt) -> int | None:
+    # 用规划器的行数估计代替 COUNT(*)：只做规划、不扫表
+    # 编译好的 SQL 直接交给驱动（搜索词里的 ":word" 不会被当成绑定参数）；放在 SAVEPOINT 里，
+    # EXPLAIN 失败只回滚到保存点，不会把整个事务置为 aborted、连累后面的分页查询
+    try:
+        sql = str(stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+        async with db.begin_nested():
+            conn = await db.connection()
+            plan = (await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception:
+        return None
+
 
 @router.get("/", response_model=list[SensorOut])
 async def list_sensors(
+    request: Request,
     db: AsyncSession = Depends(get_db),
     sensor_type: str | None = None,
     q: str | None = None,
@@ -40,25 +111,45 @@ async def list_sensors(
     owner_id: int | None = Query(None),
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
 ):
+    """
+    q 在 name / type / location / serial 上做子串搜索（trigram 索引）。
+    按 (name, id) keyset 分页：下一页游标在 X-Next-Cursor；第一页额外给出 X-Total-Estimate（规划器估计）。
+    offset 仅为兼容旧调用保留，传了 cursor 时忽略。
+    """
     stmt = select(Sensor)
     if sensor_type:
         stmt = stmt.where(Sensor.type == sensor_type)
     if q:
-        stmt = stmt.where(Sensor.name.ilike(f"%{q}%"))
+        stmt = stmt.where(sensor_search_expr().like(f"%{_like_escape(q.lower())}%", escape="\\"))
 
     if owner_id is not None:
         stmt = stmt.where(Sensor.owner_id == owner_id)
     elif house_id:
-        sub = select(Household.id).where(Household.house_id == house_id).scalar_subquery()
-        stmt = stmt.where(Sensor.owner_id == sub)
+        pk = await _house_pk(db, house_id)
+        if pk is None:
+            return encode_response(request, [], headers={"X-Total-Estimate": "0"})
+        stmt = stmt.where(Sensor.owner_id == pk)
         # 如果你还想兼容“旧数据 owner_id 为空但 meta 里有 house_id”，可加上一行：
         # from sqlalchemy import or_, cast, String
-        # stmt = stmt.where(or_(Sensor.owner_id == sub, cast(Sensor.meta['house_id'], String) == house_id))
+        # stmt = stmt.where(or_(Sensor.owner_id == pk, cast(Sensor.meta['house_id'], String) == house_id))
 
-    stmt = stmt.order_by(Sensor.name.asc()).limit(limit).offset(offset)
-    rows = (await db.execute(stmt)).scalars().all()
-    return [to_sensor_out(r) for r in rows]
+    headers: dict[str, str] = {}
+    if cursor:
+        after_name, after_id = _decode_cursor(cursor)
+        page = stmt.where(tuple_(Sensor.name, Sensor.id) > tuple_(after_name, after_id))
+    else:
+        est = await _estimate_rows(db, stmt)
+        if est is not None:
+            headers["X-Total-Estimate"] = str(est)
+        page = stmt.offset(offset) if offset else stmt
+
+    page = page.order_by(Sensor.name.asc(), Sensor.id.asc()).limit(limit)
+    rows = (await db.execute(page)).scalars().all()
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = _encode_cursor(rows[-1].name, rows[-1].id)
+    return encode_response(request, [sensor_row_dict(r) for r in rows], headers=headers)
 
 
 
@@ -71,16 +162,20 @@ async def get_sensor(sensor_id: UUID, db: AsyncSession = Depends(get_db)):
     return to_sensor_out(obj)
 
 
-@router.post("/", response_model=SensorOut, status_code=status.HTTP_201_CREATED)
-async def create_sensor(
-    payload: SensorCreate,
-    db: AsyncSession = Depends(get_db),
-    owner_id: int | None = Query(None),
-    house_id: str | None = Query(None),
-    householder: str | None = Query(None),
-):
-    from ..models import Household
-    stmt = None
+async def _commit_sensor(db: AsyncSession):
+    # (serial_number, type) 唯一：并发开通 / 改 type 撞上已有传感器时给 409，而不是 500
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if "uq_sensors_serial_type" in str(e.orig):
+            raise HTTPException(status_code=409, detail="A sensor of this type already exists for this serial number")
+        raise
+
+
+async def _resolve_household(
+    db: AsyncSession, owner_id: int | None, house_id: str | None, householder: str | None
+) -> Household:
     if owner_id is not None:
         stmt = select(Household).where(Household.id == owner_id)
     elif house_id:
@@ -94,6 +189,18 @@ async def create_sensor(
     hh = res.scalars().first()
     if not hh:
         raise HTTPException(status_code=404, detail="Household not found")
+    return hh
+
+
+@router.post("/", response_model=SensorOut, status_code=status.HTTP_201_CREATED)
+async def create_sensor(
+    payload: SensorCreate,
+    db: AsyncSession = Depends(get_db),
+    owner_id: int | None = Query(None),
+    house_id: str | None = Query(None),
+    householder: str | None = Query(None),
+):
+    hh = await _resolve_household(db, owner_id, house_id, householder)
 
     data = payload.model_dump()
     serial = data.get("serial_number")
@@ -106,11 +213,69 @@ async def create_sensor(
         owner_id=hh.id,
     )
     db.add(obj)
-    await db.commit()
+    await _commit_sensor(db)
     await db.refresh(obj)
+    sensor_directory.upsert(SensorInfo(obj.id, obj.name, obj.type, obj.serial_number, hh.id, hh.house_id))
     return to_sensor_out(obj)
 
 
+@router.post("/provision", response_model=BoxProvisionOut)
+async def provision_box(payload: BoxProvisionIn, db: AsyncSession = Depends(get_db)):
+    """
+    一次开通整个盒子：住户只解析一次，所有传感器一条 INSERT ... ON CONFLICT DO NOTHING RETURNING。
+    以 (serial_number, type) 幂等：重复开通不会产生重复传感器，已有传感器原样返回（name/meta 等不覆盖，
+    避免冲掉远程改过的配置）。已有传感器没有住户时归到本次的住户；属于别的住户时 409，整批不开通。
+    """
+    hh = await _resolve_household(db, payload.owner_id, payload.house_id, payload.householder)
+
+    rows: dict[str, dict] = {}  # 同一请求里 type 重复时后者覆盖前者
+    for s in payload.sensors:
+        rows[s.type] = {
+            "id": uuid.uuid4(),
+            "name": s.name,
+            "type": s.type,
+            "location": s.location or payload.location,
+            "serial_number": payload.serial_number,
+            "meta": s.metadata or {},
+            "owner_id": hh.id,
+        }
+
+    cols = (Sensor.id, Sensor.name, Sensor.type, Sensor.location, Sensor.serial_number, Sensor.meta, Sensor.owner_id)
+    stmt = pg_insert(Sensor).values(list(rows.values())).on_conflict_do_nothing(
+        index_elements=[Sensor.serial_number, Sensor.type],
+    ).returning(*cols)
+    created = (await db.execute(stmt)).all()
+
+    # 没插进去的就是已有的（DO NOTHING 会等并发的开通提交，之后这里读得到）
+    missing = set(rows) - {r.type for r in created}
+    existing = []
+    if missing:
+        existing = (await db.execute(
+            select(*cols).where(Sensor.serial_number == payload.serial_number, Sensor.type.in_(missing))
+        )).all()
+        if any(r.owner_id not in (None, hh.id) for r in existing):
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Box is already provisioned to another household")
+        orphans = [r.id for r in existing if r.owner_id is None]
+        if orphans:
+            await db.execute(update(Sensor).where(Sensor.id.in_(orphans)).values(owner_id=hh.id))
+    await db.commit()
+
+    res = list(created) + list(existing)
+    for r in res:
+        sensor_directory.upsert(SensorInfo(r.id, r.name, r.type, r.serial_number, hh.id, hh.house_id))
+    return BoxProvisionOut(
+        owner_id=hh.id,
+        serial_number=payload.serial_number,
+        created=len(created),
+        existing=len(existing),
+        sensors=[
+            SensorOut(id=r.id, name=r.name, type=r.type, location=r.location, serial_number=r.serial_number, meta=r.meta or {})
+            for r in res
+        ],
+    )
+
+
 
 
 @router.patch("/{sensor_id}", response_model=SensorOut)
@@ -141,8 +306,12 @@ async def update_sensor(sensor_id: UUID, payload: dict[str, Any], db: AsyncSessi
         obj.meta = obj.meta or {}
         obj.meta["enabled"] = bool(payload["enabled"])
 
-    await db.commit()
+    await _commit_sensor(db)
     await db.refresh(obj)
+    old = sensor_directory.by_id.get(obj.id)
+    sensor_directory.upsert(SensorInfo(
+        obj.id, obj.name, obj.type, obj.serial_number, obj.owner_id, old.house_id if old else None
+    ))
     return to_sensor_out(obj)
 
 
@@ -154,9 +323,66 @@ async def delete_sensor(sensor_id: UUID, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sensor not found")
     await db.delete(obj)
     await db.commit()
+    sensor_directory.remove(sensor_id)
     return
 
 
+def _battery_origin(first_ts: datetime | None, start: datetime) -> datetime:
+    """
+    电池从哪一刻开始放电：该传感器第一条读数（还没有读数时是本次窗口的起点）所在那天的 UTC 零点，
+    再往前留出最长的预热期（seek 会把更晚的起点往前挪到预热开始处）。每次调用都落在同一个值上，
+    重叠的窗口算出来的 bat_mv 一致，不会因为窗口起点不同而重置电量。
+    """
+    t = (first_ts or start).astimezone(timezone.utc)
+    day = t.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(minutes=max(HomeEnvSim.SEEK_WARMUP_MIN.values()))
+
+
+def _window_start(now: datetime, hours: int, period_minutes: int) -> datetime:
+    # 截至当前的 hours 小时窗口，起点对齐到采样周期
+    period = timedelta(minutes=period_minutes)
+    return now - (now - datetime.fromtimestamp(0, timezone.utc)) % period - timedelta(hours=hours)
+
+
+def _simulate_batch(
+    sensor_id: str, start: datetime, hours: int, period_minutes: int, profile: str, seed: int,
+    battery_origin: datetime,
+) -> list[dict]:
+    """
+    在进程池里运行：生成从 start 起 hours 小时的窗口，转成带设备时间的回填批次。
+    RNG 按 (seed, sensor_id, 时间步) 取值，窗口对齐到采样周期，电池起点固定（_battery_origin）：
+    同一 seed 重跑得到相同读数（回填去重即可）。seek 的预热每个 (传感器, 天) 只跑一次，
+    检查点缓存在本进程里：同一天再次调用只重放窗口前不到一小时。
+    """
+    sim = HomeEnvSim(
+        profile=profile, period_minutes=period_minutes, seed=seed, home=sensor_id, battery_origin=battery_origin,
+    )
+    sim.seek(start)
+    window = sim.generate_window(start, hours=hours)
+
+    batch = []
+    for dt, esp in window:
+        value = None
+        ts = dt.astimezone(timezone.utc).isoformat()
+        attributes = {"ts": ts}
+
+        if isinstance(esp, (int, float)):
+            value = float(esp)
+        elif isinstance(esp, dict):
+            for k in ("value", "temperature", "temp", "humidity", "pm2_5", "co2"):
+                if k in esp and isinstance(esp[k], (int, float)):
+                    value = float(esp[k])
+                    break
+            attributes["raw"] = esp
+        else:
+            attributes["raw"] = str(esp)
+
+        if value is None:
+            continue
+        batch.append({"sensor_id": sensor_id, "ts": ts, "value": value, "attributes": attributes})
+    return batch
+
+
 @router.post("/{sensor_id}/simulate")
 async def simulate_sensor(
     sensor_id: UUID,
@@ -175,37 +401,32 @@ async def simulate_sensor(
     if not sensor:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sensor not found")
 
-    start = datetime.now().replace(second=0, microsecond=0)
-    sim = HomeEnvSim(profile=profile, period_minutes=period_minutes, seed=seed)
-    window = sim.generate_window(start, hours=hours)
+    first_ts = (await db.execute(
+        select(func.min(SensorReading.ts)).where(SensorReading.sensor_id == sensor.id)
+    )).scalar()
+    start = _window_start(datetime.now(timezone.utc), hours, period_minutes)
+    origin = _battery_origin(first_ts, start)
+
+    # 生成窗口是纯 CPU 计算（24h × 1min 会卡住事件循环），放到进程池里做
+    try:
+        batch = await run_cpu(
+            _simulate_batch, str(sensor.id), start, hours, period_minutes, profile, seed, origin,
+            label="simulate_window",
+        )
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="simulator busy", headers={"Retry-After": "5"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="simulation timed out")
 
     sent = 0
-    async with httpx.AsyncClient(timeout=5) as client:
-        for dt, esp in window:
-            value = None
-            attributes = {"ts": dt.isoformat()}
-
-            if isinstance(esp, (int, float)):
-                value = float(esp)
-            elif isinstance(esp, dict):
-                for k in ("value", "temperature", "temp", "humidity", "pm2_5", "co2"):
-                    if k in esp and isinstance(esp[k], (int, float)):
-                        value = float(esp[k])
-                        break
-                attributes["raw"] = esp
-            else:
-                attributes["raw"] = str(esp)
-
-            if value is None:
-                continue
-
-            payload = {"sensor_id": str(sensor.id), "value": value, "attributes": attributes}
+    if batch:
+        async with httpx.AsyncClient(timeout=30) as client:
             try:
-                r = await client.post(ingest_url, json=payload)
+                r = await client.post(ingest_url, params={"mode": "backfill"}, json=batch)
                 if r.status_code >= 300:
                     print(f"[WARN] ingest failed {r.status_code}: {r.text}")
                 else:
-                    sent += 1
+                    sent = len(batch)
             except httpx.RequestError as e:
                 print(f"[ERROR] HTTP error posting ingest: {e}")
 
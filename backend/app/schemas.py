@@ -10,6 +10,19 @@ class SensorCreate(BaseModel):
     metadata: Optional[dict[str, Any]] = Field(default=None, validation_alias=AliasChoices("metadata", "meta"))
 
 
+class BoxSensorIn(BaseModel):
+    name: str
+    type: str = Field(validation_alias=AliasChoices("type", "sensor_type"))
+    location: Optional[str] = None
+    metadata: Optional[dict[str, Any]] = Field(default=None, validation_alias=AliasChoices("metadata", "meta"))
+
+class BoxProvisionIn(BaseModel):
+    serial_number: str = Field(min_length=1, validation_alias=AliasChoices("serial_number", "serial", "sn"))
+    location: Optional[str] = None
+    house_id: Optional[str] = None
+    owner_id: Optional[int] = None
+    householder: Optional[str] = None
+    sensors: list[BoxSensorIn] = Field(min_length=1)
 
 class SensorUpdate(BaseModel):
     name: Optional[str] = None
@@ -27,6 +40,13 @@ class SensorOut(BaseModel):
     meta: Optional[dict] = None
     model_config = ConfigDict(from_attributes=True)
 
+class BoxProvisionOut(BaseModel):
+    owner_id: int
+    serial_number: str
+    created: int
+    existing: int
+    sensors: list[SensorOut]
+
 
 class ConfigCreate(BaseModel):
     data: dict
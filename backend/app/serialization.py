@@ -0,0 +1,106 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson  # noqa
+    HAVE_ORJSON = True
+except Exception:
+    HAVE_ORJSON = False
+
+try:
+    import msgpack  # noqa
+    HAVE_MSGPACK = True
+except Exception:
+    HAVE_MSGPACK = False
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+if HAVE_ORJSON:
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(o: Any) -> Any:
+    # orjson / msgpack 原生不支持的类型走这里（datetime/UUID 由 orjson 在 C 里直接处理）
+    if isinstance(o, datetime):
+        return o.isoformat()
+    if isinstance(o, UUID):
+        return str(o)
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    if hasattr(o, "model_dump"):
+        return o.model_dump(mode="json")
+    if hasattr(o, "tolist"):  # numpy 数组 / 标量
+        return o.tolist()
+    raise TypeError(f"Type is not serializable: {type(o).__name__}")
+
+
+def dumps_json(content: Any) -> bytes:
+    if HAVE_ORJSON:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_msgpack(content: Any) -> bytes:
+    # tz-aware datetime → msgpack Timestamp 扩展类型；naive datetime / UUID 交给 _default
+    return msgpack.packb(content, default=_default, use_bin_type=True, datetime=True)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return dumps_msgpack(content)
+
+
+def wants_msgpack(request: Request) -> bool:
+    if not HAVE_MSGPACK:
+        return False
+    accept = request.headers.get("accept", "")
+    return any(t in accept for t in MSGPACK_TYPES)
+
+
+def encode_response(request: Request, content: Any, status_code: int = 200, headers: dict | None = None) -> Response:
+    """
+    按 Accept 协商编码并直接返回 Response，跳过 FastAPI 的 jsonable_encoder。
+    热点接口（图表、读数、传感器列表）直接返回本函数的结果。
+    """
+    h = {"Vary": "Accept"}
+    if headers:
+        h.update(headers)
+    if wants_msgpack(request):
+        return MsgPackResponse(content, status_code=status_code, headers=h)
+    return FastJSONResponse(content, status_code=status_code, headers=h)
+
+
+def columnar_series(keys: list[datetime], values: list[float], start: datetime, step: timedelta) -> dict:
+    """
+    紧凑列式时间序列：{start_ms, step_ms, values}，缺失的 bucket 用 None 填充。
+    keys 必须是 start + n*step 对齐的 bucket 起点（升序）。
+    """
+    step_s = step.total_seconds()
+    if not keys:
+        return {"start_ms": int(start.timestamp() * 1000), "step_ms": int(step_s * 1000), "values": []}
+    n_total = int((keys[-1] - start).total_seconds() // step_s) + 1
+    out: list[float | None] = [None] * n_total
+    for k, v in zip(keys, values):
+        out[int((k - start).total_seconds() // step_s)] = v
+    return {"start_ms": int(start.timestamp() * 1000), "step_ms": int(step_s * 1000), "values": out}
+
+
+def explicit_series(keys: list[datetime], values: list[float]) -> dict:
+    """不等间隔（降采样后）的列式序列：{ts_ms, values}，时间戳逐点给出。"""
+    return {"ts_ms": [int(k.timestamp() * 1000) for k in keys], "values": values}
@@ -2,11 +2,16 @@
 # Realistic ESP "read" generator for at-risk homes with arbitrary time windows.
 # Profiles: "healthy", "intermittent", "chronic" (most at-risk).
 # Battery continuity across days is enforced (per-day drain rate).
+# With home=... the simulator uses a counter-based RNG keyed by (seed, home, timestep):
+# any window can then be generated independently via seek(), e.g. in parallel chunks.
+# seek() replays a warm-up once per (home, day) anchor and caches hourly checkpoints per process,
+# so repeated windows on the same day only replay up to an hour before the window.
 
 from __future__ import annotations
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-import math, random
+import hashlib, math, random
 
 # -------------------- Field schema (one source of truth) --------------------
 
@@ -79,6 +84,30 @@ def _occupancy_factor(hour: float, weekday: int, rng: random.Random, profile: st
     base += rng.uniform(-0.05, 0.05)
     return min(1.0, max(0.0, base))
 
+def _counter_rng(*key) -> random.Random:
+    """Deterministic RNG for one (seed, home, step) key; independent of call order."""
+    h = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+    return random.Random(int.from_bytes(h, "big"))
+
+def _local(dt: datetime) -> datetime:
+    return dt.astimezone() if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc).astimezone()
+
+def _initial_state(rng: random.Random) -> dict:
+    return {
+        "temp_c":    rng.uniform(14, 19),
+        "rh_pct":    rng.uniform(50, 65),
+        "co2_ppm":   rng.uniform(500, 900),
+        "o2_pct":    20.9,
+        "co_ppm":    rng.uniform(0.0, 2.0),
+        "pm25_ugm3": rng.uniform(5, 15),
+        "noise_dba": rng.uniform(35, 55),
+        "no2_ppb":   rng.uniform(8, 24),
+        "lux":       rng.uniform(50, 500),
+    }
+
+# seek() checkpoints, per process: (sim params, anchor) -> {steps after anchor: snapshot}, LRU by anchor
+_SEEK_CACHE: OrderedDict[tuple, dict[int, dict]] = OrderedDict()
+
 # -------------------- Event model --------------------
 
 class _Event:
@@ -117,6 +146,12 @@ class HomeEnvSim:
         "bat_mv":     5.0,
     }
 
+    # seek() warm-up: CO2 (the slowest channel) relaxes at ~0.45*vent_base per minute (vent_base in next_read);
+    # ~ln(1e4)/(0.45*vent_base) min leaves at most a few ppm of cold-start residue, usually none
+    SEEK_WARMUP_MIN = {"healthy": 3 * 1440, "intermittent": 5 * 1440, "chronic": 8 * 1440}
+    SEEK_CHECKPOINT_MIN = 60    # snapshot spacing along an anchored run
+    SEEK_CACHE_ANCHORS = 256    # anchors kept in _SEEK_CACHE (each holds <= 24 hourly snapshots)
+
     def __init__(
         self,
         profile: str = "intermittent",     # "healthy" | "intermittent" | "chronic"
@@ -125,24 +160,20 @@ class HomeEnvSim:
         serial: int | None = None,
         seed: int | None = None,
         daily_battery_drop_mv_mean: float = 100.0,  # ~100 mV/day example
+        home: int | str | None = None,      # set -> counter-based RNG keyed by (seed, home, step); enables seek()
+        battery_origin: datetime | None = None,  # when the battery was at start_bat_mv (counter mode)
     ):
         self.profile = profile.lower()
         self.period_minutes = int(period_minutes)
-        self.rng = random.Random(seed if seed is not None else random.randrange(1 << 30))
+        self.seed = seed if seed is not None else random.randrange(1 << 30)
+        self.home = home
+        self.rng = _counter_rng(self.seed, home, "init") if home is not None else random.Random(self.seed)
         self.serial = self.rng.randint(0, 65535) if serial is None else int(serial)
+        self.start_bat_mv = float(start_bat_mv)
+        self.battery_origin = _local(battery_origin) if battery_origin is not None else None
 
         # Internal state
-        self.state = {
-            "temp_c":    self.rng.uniform(14, 19),
-            "rh_pct":    self.rng.uniform(50, 65),
-            "co2_ppm":   self.rng.uniform(500, 900),
-            "o2_pct":    20.9,
-            "co_ppm":    self.rng.uniform(0.0, 2.0),
-            "pm25_ugm3": self.rng.uniform(5, 15),
-            "noise_dba": self.rng.uniform(35, 55),
-            "no2_ppb":   self.rng.uniform(8, 24),
-            "lux":       self.rng.uniform(50, 500),
-        }
+        self.state = _initial_state(self.rng)
 
         # Events & timing
         self.events: list[_Event] = []
@@ -161,7 +192,8 @@ class HomeEnvSim:
         key = (year, doy)
         if key != self._current_day:
             # New day's drain rate: N(mean, 10mV) clipped to [0.7, 1.3]×mean
-            jitter = self.rng.gauss(0, 10.0)
+            rng = _counter_rng(self.seed, self.home, "day", year, doy) if self.home is not None else self.rng
+            jitter = rng.gauss(0, 10.0)
             rate = max(0.7, min(1.3, (self._day_drop_mean + jitter) / self._day_drop_mean)) * self._day_drop_mean
             self._current_day_rate = rate  # mV/day
             self._current_day = key
@@ -255,12 +287,16 @@ class HomeEnvSim:
         Generate one ESP 'read' at the requested datetime (engineering units).
         Call with monotonically increasing dt (any start time / any 12h window).
         """
-        dt = dt.astimezone() if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc).astimezone()
+        dt = _local(dt)
         hour = dt.hour + dt.minute / 60.0
         weekday = dt.weekday()
+        if self.home is not None:
+            self.rng = _counter_rng(self.seed, self.home, self.step_of(dt))
 
         # Battery continuity across elapsed minutes
         if self.last_time is None:
+            if self.home is not None and self.battery_origin is None:
+                self.battery_origin = dt
             elapsed_min = 0.0
         else:
             elapsed_min = max(0.0, (dt - self.last_time).total_seconds() / 60.0)
@@ -398,6 +434,127 @@ class HomeEnvSim:
         if dv < -cap:  return prev - cap
         return target
 
+    # -------------------- checkpoint / seek --------------------
+
+    def step_of(self, dt: datetime) -> int:
+        """Absolute timestep index (period grid anchored at the Unix epoch)."""
+        return int(dt.timestamp() // 60) // self.period_minutes
+
+    def snapshot(self) -> dict:
+        """JSON-serialisable copy of all mutable state."""
+        return {
+            "serial": self.serial,
+            "state": dict(self.state),
+            "events": [[e.kind, e.remaining, e.duration0] for e in self.events],
+            "last_time": self.last_time.isoformat() if self.last_time else None,
+            "bat_mv": self.bat_mv,
+            "day": list(self._current_day) if self._current_day else None,
+            "day_rate": self._current_day_rate,
+            "battery_origin": self.battery_origin.isoformat() if self.battery_origin else None,
+            "rng": None if self.home is not None else [self.rng.getstate()[0], list(self.rng.getstate()[1]), self.rng.getstate()[2]],
+        }
+
+    def restore(self, snap: dict):
+        self.serial = int(snap["serial"])
+        self.state = dict(snap["state"])
+        self.events = []
+        for kind, remaining, duration0 in snap["events"]:
+            ev = _Event(kind, duration0)
+            ev.remaining = remaining
+            self.events.append(ev)
+        # back to the local zone: day boundaries in _advance_battery must match a continuous run
+        self.last_time = _local(datetime.fromisoformat(snap["last_time"])) if snap["last_time"] else None
+        self.bat_mv = float(snap["bat_mv"])
+        self._current_day = tuple(snap["day"]) if snap["day"] else None
+        self._current_day_rate = snap["day_rate"]
+        self.battery_origin = _local(datetime.fromisoformat(snap["battery_origin"])) if snap["battery_origin"] else None
+        if snap.get("rng") is not None:
+            v, internal, gauss_next = snap["rng"]
+            self.rng.setstate((v, tuple(internal), gauss_next))
+
+    def battery_at(self, when: datetime) -> float:
+        """Battery level at `when`, integrated analytically from battery_origin (O(days), no stepping)."""
+        when = _local(when)
+        origin = self.battery_origin or when
+        saved = (self.bat_mv, self.last_time, self._current_day, self._current_day_rate)
+        self.bat_mv, self.last_time = self.start_bat_mv, origin
+        self._advance_battery(max(0.0, (when - origin).total_seconds() / 60.0), when)
+        out = self.bat_mv
+        self.bat_mv, self.last_time, self._current_day, self._current_day_rate = saved
+        return out
+
+    def _seek_anchor(self, dt: datetime) -> datetime:
+        # first point of dt's timestep grid at or after the UTC midnight of dt's day
+        period = timedelta(minutes=self.period_minutes)
+        midnight = dt.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        return dt - ((dt - midnight) // period) * period
+
+    def seek_start(self, dt: datetime, warmup_minutes: float | None = None) -> datetime:
+        """Where the continuous run that seek(dt) reproduces starts: the day anchor minus the warm-up."""
+        if warmup_minutes is None:
+            warmup_minutes = self.SEEK_WARMUP_MIN.get(self.profile, self.SEEK_WARMUP_MIN["chronic"])
+        n = int(math.ceil(warmup_minutes / self.period_minutes))
+        return self._seek_anchor(_local(dt)) - timedelta(minutes=n * self.period_minutes)
+
+    def _warm_up(self, start: datetime, until: datetime):
+        # fresh filter state (same as construction), then run start..until on the same timestep grid
+        if self.battery_origin is None or self.battery_origin > start:
+            self.battery_origin = start
+        init = _counter_rng(self.seed, self.home, "init")
+        init.randint(0, 65535)  # serial draw, as in __init__
+        self.state = _initial_state(init)
+        self.events = []
+        self.bat_mv = self.battery_at(start)
+        self._current_day = None
+        self.last_time = start
+        t = start
+        while t < until:
+            self.next_read(t)
+            t += timedelta(minutes=self.period_minutes)
+
+    def seek(self, dt: datetime, warmup_minutes: float | None = None):
+        """
+        Jump to `dt` without simulating the history (counter mode only).
+        Output from dt on is exactly that of a continuous run started at seek_start(dt): a fresh
+        state warmed up (default SEEK_WARMUP_MIN[profile]) to the day anchor, then stepped to dt,
+        so it matches any earlier start up to a geometrically decaying residue.
+        The warm-up runs once per anchor; hourly snapshots along the run are cached per process
+        (_SEEK_CACHE), so later seeks on the same day replay at most SEEK_CHECKPOINT_MIN.
+        Battery is set analytically; for identical batteries pass the continuous run's start as
+        battery_origin. The next call should be next_read(dt).
+        """
+        if self.home is None:
+            raise ValueError("seek() needs the counter-based RNG: construct with home=...")
+        dt = _local(dt)
+        period = timedelta(minutes=self.period_minutes)
+        anchor = self._seek_anchor(dt)
+        start = self.seek_start(dt, warmup_minutes)
+        key = (
+            self.seed, self.home, self.serial, self.profile, self.period_minutes, self.start_bat_mv,
+            self._day_drop_mean, self.battery_origin.timestamp() if self.battery_origin else None,
+            start.timestamp(), anchor.timestamp(),
+        )
+        marks = _SEEK_CACHE.get(key)
+        if marks is None:
+            self._warm_up(start, anchor)
+            marks = _SEEK_CACHE[key] = {0: self.snapshot()}
+            while len(_SEEK_CACHE) > self.SEEK_CACHE_ANCHORS:
+                _SEEK_CACHE.popitem(last=False)
+        else:
+            _SEEK_CACHE.move_to_end(key)
+
+        target = (dt - anchor) // period
+        k = max(j for j in marks if j <= target)
+        self.restore(marks[k])
+        every = max(1, self.SEEK_CHECKPOINT_MIN // self.period_minutes)
+        t = anchor + k * period
+        while k < target:
+            self.next_read(t)
+            k += 1
+            t += period
+            if k % every == 0 and k not in marks:
+                marks[k] = self.snapshot()
+
     # Convenience for a 12h (or any) window
     def generate_window(self, start: datetime, hours: float = 12.0) -> list[tuple[datetime, dict]]:
         steps = int(round(hours * 60 / self.period_minutes))
@@ -0,0 +1,117 @@
+# app/sketches.py
+# DDSketch：可合并的分位数草图，跟 n / sum / min / max 一起存进 metric_rollups / zone_rollups。
+#   值 v > 0 落在桶 k = ceil(ln v / ln γ)，γ = (1+α)/(1-α)；负值对 |v| 同样分桶，|v| 很小的算作 0。
+#   每个桶只存计数，合并就是按桶相加，所以任意小时、任意一组传感器 / 户 / zone 都能合并后再取分位数，
+#   得到的分位数相对误差不超过 α（再用合并后的 min / max 夹一下）。
+# 存储：jsonb {"p<k>": count, "n<k>": count, "z": count}。桶在 SQL 里算（bucket_key_sql，ingest 的
+# upsert 里用），合并在 SQL 里用 ddsketch_merge()（ON CONFLICT），查询时在 Python 里合并、取分位数。
+# 改 RELATIVE_ACCURACY 之后旧草图不再可比，需要 python -m app.rollups rebuild。
+
+import json
+import math
+import re
+from typing import Any, Iterable
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LN_GAMMA = math.log(GAMMA)
+MIN_INDEXABLE = 1e-9  # |v| 小于它的计入 "z"
+
+# ON CONFLICT 里按桶相加（IMMUTABLE，两边都是几十个键的小 jsonb）
+MERGE_FUNCTION_DDL = """
+CREATE OR REPLACE FUNCTION ddsketch_merge(a jsonb, b jsonb) RETURNS jsonb
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT coalesce(jsonb_object_agg(k, c), '{}'::jsonb) FROM (
+    SELECT k, sum(v::bigint) AS c
+    FROM (SELECT * FROM jsonb_each_text(coalesce(a, '{}'::jsonb))
+          UNION ALL
+          SELECT * FROM jsonb_each_text(coalesce(b, '{}'::jsonb))) x(k, v)
+    GROUP BY k) y
+$$
+"""
+
+_PERCENTILE = re.compile(r"^p(\d{1,2}(?:\.\d+)?|100)$")
+
+
+def bucket_key_sql(v: str) -> str:
+    """SQL 表达式：值 -> 桶键；NaN / ±Infinity 返回 NULL（不计入草图）。"""
+    return (
+        f"CASE WHEN {v} = 'NaN' OR abs({v}) = 'Infinity' THEN NULL "
+        f"WHEN {v} > {MIN_INDEXABLE!r} THEN 'p' || ceil(ln({v}) / {LN_GAMMA!r})::bigint "
+        f"WHEN {v} < -{MIN_INDEXABLE!r} THEN 'n' || ceil(ln(-{v}) / {LN_GAMMA!r})::bigint "
+        "ELSE 'z' END"
+    )
+
+
+def bucket_key(v: float) -> str | None:
+    """bucket_key_sql 的 Python 版（在 Python 里建草图、测试用），两边必须一致。"""
+    if math.isnan(v) or math.isinf(v):
+        return None
+    if v > MIN_INDEXABLE:
+        return f"p{math.ceil(math.log(v) / LN_GAMMA)}"
+    if v < -MIN_INDEXABLE:
+        return f"n{math.ceil(math.log(-v) / LN_GAMMA)}"
+    return "z"
+
+
+def parse_percentile(agg: str | None) -> float | None:
+    """"p95" / "p99.9" -> 0.95 / 0.999；不是分位数聚合返回 None，格式不对抛 ValueError。"""
+    if not agg or not str(agg).lower().startswith("p"):
+        return None
+    m = _PERCENTILE.match(str(agg).lower())
+    if not m:
+        raise ValueError(f"bad percentile aggregate {agg!r} (use p0..p100, e.g. p95 or p99.9)")
+    return float(m.group(1)) / 100.0
+
+
+def as_sketch(raw: Any) -> dict[str, int]:
+    if raw is None:
+        return {}
+    if isinstance(raw, (str, bytes)):
+        raw = json.loads(raw)
+    return raw
+
+
+def merge(into: dict[str, int], other: Any) -> dict[str, int]:
+    for k, c in as_sketch(other).items():
+        into[k] = into.get(k, 0) + int(c)
+    return into
+
+
+def _value(k: int) -> float:
+    # 桶 (γ^(k-1), γ^k] 的代表值：到两端的相对误差都是 α
+    return 2.0 * GAMMA ** k / (GAMMA + 1.0)
+
+
+def quantile(sketch: dict[str, int], q: float, lo: float | None = None, hi: float | None = None) -> float | None:
+    """秩 q·(n-1) 所在桶的代表值，夹在 [lo, hi]（合并后的 min / max）之间。空草图返回 None。"""
+    neg: list[tuple[int, int]] = []
+    pos: list[tuple[int, int]] = []
+    zero = 0
+    for k, c in sketch.items():
+        if k == "z":
+            zero += int(c)
+        elif k[0] == "p":
+            pos.append((int(k[1:]), int(c)))
+        elif k[0] == "n":
+            neg.append((int(k[1:]), int(c)))
+    n = zero + sum(c for _, c in pos) + sum(c for _, c in neg)
+    if n == 0:
+        return None
+    rank = q * (n - 1)
+    ordered: Iterable[tuple[float, int]] = (
+        [(-_value(k), c) for k, c in sorted(neg, reverse=True)]
+        + [(0.0, zero)]
+        + [(_value(k), c) for k, c in sorted(pos)]
+    )
+    seen = 0
+    v = 0.0
+    for v, c in ordered:
+        seen += c
+        if seen > rank:
+            break
+    if lo is not None:
+        v = max(v, lo)
+    if hi is not None:
+        v = min(v, hi)
+    return v
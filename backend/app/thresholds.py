@@ -0,0 +1,35 @@
+# app/thresholds.py
+# 指标阈值线与传感器类型别名：图表（routers/analytics.py）和预聚合（rollups.py）共用。
+
+THRESHOLDS = {
+    "co": {"unit": "ppm", "lines": [{"label": "WHO 1-h", "kind": "upper", "value": 30.0}]},
+    "co2": {"unit": "ppm", "lines": [{"label": "ASHRAE", "kind": "upper", "value": 1000.0}]},
+    "light_night": {"unit": "lux", "lines": [{"label": "IES", "kind": "lower", "value": 100.0}, {"label": "IES", "kind": "upper", "value": 200.0}]},
+    "no2": {"unit": "ppb", "lines": [{"label": "WHO 24-h", "kind": "upper", "value": 13.0}]},
+    "noise_night": {"unit": "dB(A)", "lines": [{"label": "WHO night 8h", "kind": "upper", "value": 30.0}]},
+    "o2": {"unit": "% vol", "lines": [{"label": "OSHA", "kind": "lower", "value": 19.5}]},
+    "pm25": {"unit": "µg/m³", "lines": [{"label": "WHO 24-h", "kind": "upper", "value": 15.0}]},
+    "rh": {"unit": "%", "lines": [{"label": "WHO/ASHRAE", "kind": "lower", "value": 30.0}, {"label": "WHO/ASHRAE", "kind": "upper", "value": 60.0}]},
+    "temp": {"unit": "°C", "lines": [{"label": "WHO", "kind": "lower", "value": 18.0}, {"label": "WHO", "kind": "upper", "value": 24.0}]},
+}
+
+ALIASES: dict[str, list[str]] = {
+    "temp": ["temp", "temperature"],
+    "rh": ["rh", "humidity"],
+    "pm25": ["pm25", "pm2_5", "pm2.5"],
+    "co2": ["co2"],
+    "co": ["co"],
+    "no2": ["no2"],
+    "o2": ["o2"],
+    "light_night": ["light_night", "light"],
+    "noise_night": ["noise_night", "noise"],
+}
+
+# 传感器类型（小写）-> 指标键
+TYPE_TO_METRIC: dict[str, str] = {t: m for m, types in ALIASES.items() for t in types}
+
+
+def canonical_metric(name: str) -> str:
+    """指标键或传感器类型 -> 指标键；不认识的原样（小写）返回。"""
+    key = (name or "").strip().lower()
+    return key if key in ALIASES else TYPE_TO_METRIC.get(key, key)
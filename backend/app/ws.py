@@ -1,6 +1,7 @@
 import asyncio
 from typing import Set
 from fastapi import WebSocket
+from .metrics import WS_CLIENTS
 
 class Broadcaster:
     def __init__(self):
@@ -11,10 +12,12 @@ class Broadcaster:
         await ws.accept()
         async with self._lock:
             self.clients.add(ws)
+            WS_CLIENTS.set(len(self.clients))
 
     async def disconnect(self, ws: WebSocket):
         async with self._lock:
             self.clients.discard(ws)
+            WS_CLIENTS.set(len(self.clients))
 
     async def broadcast_json(self, payload: dict):
         stale = []
@@ -0,0 +1,7 @@
+# benchmarks/
+# 热点路径的基准测试：纯 CPU（校验 / 编解码 / 模拟器 / 聚合）+ 需要本地 Postgres 的端到端（/ingest、图表查询）。
+#   python -m benchmarks run                       # 跑全部，打印结果
+#   python -m benchmarks run -k codec --out new.json
+#   python -m benchmarks run --save main           # 存成 benchmarks/baselines/main.json
+#   python -m benchmarks compare benchmarks/baselines/main.json new.json
+# 见 core.py（计时 / 对比）、bench_cpu.py、bench_db.py。
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import fnmatch
+import os
+import sys
+from . import core
+from . import bench_cpu, bench_db  # noqa: F401  注册用例
+
+
+def _select(patterns: list[str] | None, skip_db: bool) -> list[core.Bench]:
+    out = []
+    for b in core.REGISTRY:
+        if skip_db and b.setup.__module__.endswith("bench_db"):
+            continue
+        if patterns and not any(p in b.name or fnmatch.fnmatch(b.name, p) for p in patterns):
+            continue
+        out.append(b)
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks", description="Hot-path benchmarks with JSON baselines")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="run benchmarks")
+    r.add_argument("-k", action="append", help="substring or glob of benchmark names (repeatable)")
+    r.add_argument("--no-db", action="store_true", help="skip the end-to-end benchmarks that need Postgres")
+    r.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    r.add_argument("--repeats", type=int, default=5)
+    r.add_argument("--out", help="write results JSON here")
+    r.add_argument("--save", metavar="NAME", help=f"write results to {os.path.relpath(core.BASELINE_DIR)}/NAME.json")
+    r.add_argument("--compare", metavar="BASELINE", help="compare with a baseline file or name when done")
+    r.add_argument("--threshold", type=float, default=0.10)
+
+    l = sub.add_parser("list", help="list benchmark names")
+    l.add_argument("-k", action="append")
+
+    c = sub.add_parser("compare", help="compare two result files (exit 1 on regressions)")
+    c.add_argument("baseline", help="file path or baseline name")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts as a regression")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "list":
+        for b in _select(args.k, False):
+            print(b.name)
+        return 0
+    if args.cmd == "compare":
+        return 1 if core.compare(core.load(args.baseline), core.load(args.new), args.threshold) else 0
+
+    selected = _select(args.k, args.no_db)
+    print(f"running {len(selected)} benchmarks (min_time={args.min_time}s, repeats={args.repeats})")
+    doc = asyncio.run(core.run(selected, args.min_time, args.repeats))
+    if args.out:
+        core.save(doc, args.out)
+    if args.save:
+        core.save(doc, os.path.join(core.BASELINE_DIR, f"{args.save}.json"))
+        print(f"saved baseline {args.save}")
+    if args.compare:
+        print()
+        return 1 if core.compare(core.load(args.compare), doc, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
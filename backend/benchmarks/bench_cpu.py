@@ -0,0 +1,181 @@
+# benchmarks/bench_cpu.py
+# 不需要数据库的热点：读数校验、LoRaWAN 编解码、模拟器单步、图表聚合、house_id。
+# 输入都用固定种子生成，保证每次跑的是同一份数据。
+
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from .core import bench
+
+BATCH_SIZES = (1, 100, 1000, 5000)
+_T0 = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def _raw_rows(n: int, ts_kind: str = "iso") -> list[dict]:
+    rng = random.Random(n)
+    sids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(9)]
+    rows = []
+    for k in range(n):
+        t = _T0 + timedelta(seconds=60 * k)
+        rows.append({
+            "sensor_id": sids[k % len(sids)],
+            "value": round(rng.uniform(0, 100), 2),
+            "ts": t.isoformat() if ts_kind == "iso" else t.timestamp() * 1000,
+            "attributes": {"unit": "ppm", "box": "box-1", "serial_number": "SN-1"},
+        })
+    return rows
+
+
+def _coerce_bench(n: int, ts_kind: str):
+    def setup():
+        from app.ingest_pipeline import coerce_row
+        rows = _raw_rows(n, ts_kind)
+        now = datetime.now(timezone.utc)
+        return lambda: [coerce_row(r, now) for r in rows]  # 与 routers/ingest._coerce_all 相同
+    return setup
+
+
+for _n in BATCH_SIZES:
+    bench(f"ingest.coerce_row.iso.{_n}", rows=_n)(_coerce_bench(_n, "iso"))
+bench("ingest.coerce_row.epoch_ms.1000", rows=1000)(_coerce_bench(1000, "epoch"))
+
+
+def _esp_reads(n: int) -> list[dict]:
+    from app.simulation.home_env_sim import HomeEnvSim
+    sim = HomeEnvSim(profile="chronic", period_minutes=5, seed=1, home=1)
+    return [r for _, r in sim.generate_window(_T0, hours=n * 5 / 60)]
+
+
+@bench("codec.encode_lorawan", rows=1000)
+def _encode():
+    from app.simulation.lorawan_encode import encode_lorawan
+    reads = _esp_reads(1000)
+    return lambda: [encode_lorawan(r) for r in reads]
+
+
+@bench("codec.decode_lorawan", rows=1000)
+def _decode():
+    from app.simulation.lorawan_encode import encode_lorawan
+    from app.simulation.lorawan_decode import decode_lorawan
+    frames = [encode_lorawan(r) for r in _esp_reads(1000)]
+    return lambda: [decode_lorawan(f) for f in frames]
+
+
+@bench("codec.decode_frame", rows=1000)
+def _decode_frame():
+    from app.simulation.lorawan_encode import encode_lorawan
+    from app.frames import decode_frame
+    frames = [encode_lorawan(r) for r in _esp_reads(1000)]
+    return lambda: [decode_frame(f, _T0) for f in frames]
+
+
+def _sim_bench(profile: str, counter: bool):
+    def setup():
+        from app.simulation.home_env_sim import HomeEnvSim
+        sim = HomeEnvSim(profile=profile, period_minutes=1, seed=1, home=1 if counter else None)
+        t = [_T0]
+        step = timedelta(minutes=1)
+
+        def one():
+            sim.next_read(t[0])
+            t[0] += step
+        return one
+    return setup
+
+
+for _p in ("healthy", "chronic"):
+    bench(f"sim.next_read.{_p}")(_sim_bench(_p, False))
+bench("sim.next_read.chronic.counter_rng")(_sim_bench("chronic", True))
+
+
+def _seek_bench(cold: bool):
+    def setup():
+        from app.simulation import home_env_sim as hes
+        sim = hes.HomeEnvSim(profile="chronic", period_minutes=5, seed=1, home=1, battery_origin=_T0)
+        target = _T0 + timedelta(days=200, hours=13)
+
+        def run():
+            if cold:
+                hes._SEEK_CACHE.clear()  # 预热 + 从锚点走到 target；不清就是同一天命中检查点的情形
+            sim.seek(target)
+        return run
+    return setup
+
+
+bench("sim.seek.chronic.cold")(_seek_bench(True))
+bench("sim.seek.chronic.cached")(_seek_bench(False))
+
+
+def _rows_for(days: float, period_min: int) -> list[tuple]:
+    rng = random.Random(7)
+    n = int(days * 1440 / period_min)
+    return [(_T0 + timedelta(minutes=period_min * k), rng.uniform(400, 2000)) for k in range(n)]
+
+
+def _aggregate_bench(days: float, period_min: int, interval: str, agg: str):
+    def setup():
+        from app.routers.analytics import _aggregate, _parse_interval
+        rows = _rows_for(days, period_min)
+        step = _parse_interval(interval)
+        return lambda: _aggregate(rows, step, agg)
+    return setup
+
+
+# metric_timeseries 的分桶聚合：一天 1 分钟粒度 -> 5m；一个月 5 分钟 -> 1h；一年 5 分钟 -> 5m（不降采样的最坏情况）
+for _days, _period, _iv in ((1, 1, "5m"), (30, 5, "1h"), (365, 5, "5m")):
+    _n = int(_days * 1440 / _period)
+    bench(f"charts.aggregate.{_days}d_{_period}m_to_{_iv}", rows=_n)(_aggregate_bench(_days, _period, _iv, "avg"))
+
+
+@bench("charts.bucket", rows=1000)
+def _bucket():
+    from app.routers.analytics import _bucket as bucket
+    rows = _rows_for(1000 / 1440, 1)
+    step = timedelta(minutes=5)
+    return lambda: [bucket(ts, _T0, step) for ts, _ in rows]
+
+
+@bench("utils.build_house_id", rows=1000)
+def _house_id():
+    from app.utils import build_house_id
+    rng = random.Random(3)
+    names = ["Aroha Te Whare", "John Doe", "Li", "Mary-Jane O'Neil", "  ", "Xavier Ng"]
+    args = [(rng.choice("NSWEC"), rng.choice(names), f"SN-2025{rng.randrange(10**6):06d}") for _ in range(1000)]
+    return lambda: [build_house_id(z, h, s) for z, h, s in args]
+
+
+def _downsample_bench(method: str):
+    def setup():
+        from app.downsample import downsample
+        rows = _rows_for(365, 5)
+        labels, data = [t for t, _ in rows], [v for _, v in rows]
+        lines = [{"kind": "upper", "value": 1000.0}]
+        return lambda: downsample(labels, data, 1000, method, lines)
+    return setup
+
+
+# 一年 5 分钟粒度（~105k 点）压到 1000 点
+for _m in ("lttb", "minmax"):
+    bench(f"charts.downsample.{_m}.365d_5m_to_1000", rows=int(365 * 1440 / 5))(_downsample_bench(_m))
+
+
+@bench("charts.sketch.merge_quantile.720h", rows=720)
+def _sketch():
+    # 30 天的小时草图合并成一个再取 p95（agg=p95、interval=30d 时每个区间的工作量）
+    import math
+    from app.sketches import LN_GAMMA, merge, quantile
+    rng = random.Random(1)
+    hours = []
+    for _ in range(720):
+        sk: dict[str, int] = {}
+        for _ in range(12):
+            k = f"p{math.ceil(math.log(rng.lognormvariate(6.5, 0.4)) / LN_GAMMA)}"
+            sk[k] = sk.get(k, 0) + 1
+        hours.append(sk)
+
+    def one():
+        acc: dict[str, int] = {}
+        for sk in hours:
+            merge(acc, sk)
+        return quantile(acc, 0.95)
+    return one
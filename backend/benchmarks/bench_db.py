@@ -0,0 +1,167 @@
+# benchmarks/bench_db.py
+# 端到端：进程内起整个 FastAPI 应用（含 lifespan），通过 httpx 的 ASGITransport 打请求，不经过网络。
+# 连的是 DATABASE_URL；连不上就全部跳过。
+#   /ingest：临时建一个 BENCH-INGEST 住户 + 9 个传感器，各种批大小写入，跑完连同读数一起删掉
+#   图表：需要先用 python -m app.datagen 灌数据；BENCH_SERIAL 指定盒子（默认 datagen 的第一户）
+
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from .core import bench, Skip, FINALIZERS
+
+BENCH_SERIAL = os.getenv("BENCH_SERIAL", "DG0000000")
+INGEST_BATCH_SIZES = (1, 100, 1000, 5000)
+INGEST_SERIAL = "BENCH-INGEST"
+INGEST_TYPES = ["temperature", "humidity", "co2", "o2", "co", "pm2_5", "sound_level", "no2", "light"]
+
+_ctx: dict = {}
+
+
+async def _client():
+    """整个应用只启动一次，所有 DB 用例共用；跑完由 FINALIZERS 关闭。"""
+    if "client" in _ctx:
+        return _ctx["client"]
+    if "error" in _ctx:
+        raise Skip(_ctx["error"])
+    import httpx
+    from sqlalchemy import text
+    from app.db import registry
+    try:
+        async with registry.engine("jobs").connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        _ctx["error"] = f"database unavailable: {e!r}"[:200]
+        raise Skip(_ctx["error"])
+
+    from app.main import app
+    lifespan = app.router.lifespan_context(app)
+    await lifespan.__aenter__()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    _ctx["client"] = client
+
+    async def _close():
+        await client.aclose()
+        await lifespan.__aexit__(None, None, None)
+        _ctx.clear()
+    FINALIZERS.append(_close)
+    return client
+
+
+# -------------------- /ingest --------------------
+
+async def _ingest_sensors() -> list[str]:
+    if "sensors" in _ctx:
+        return _ctx["sensors"]
+    from sqlalchemy import delete, select
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+    from app.db import registry
+    from app.models import Household, Sensor
+
+    async with registry.sessionmaker("jobs")() as db:
+        await db.execute(pg_insert(Household).values(
+            serial_number=INGEST_SERIAL, householder="Bench Ingest", phone="000", email="bench@example.com",
+            address="-", zone="C", house_id="CBINGE000",
+        ).on_conflict_do_nothing())
+        owner = (await db.execute(select(Household.id).where(Household.serial_number == INGEST_SERIAL))).scalar_one()
+        await db.execute(pg_insert(Sensor).values([
+            {"id": uuid.uuid4(), "name": t, "type": t, "serial_number": INGEST_SERIAL, "owner_id": owner, "meta": {}}
+            for t in INGEST_TYPES
+        ]).on_conflict_do_nothing())
+        ids = (await db.execute(select(Sensor.id).where(Sensor.serial_number == INGEST_SERIAL))).scalars().all()
+        await db.commit()
+    _ctx["sensors"] = [str(s) for s in ids]
+
+    async def _drop():
+        async with registry.sessionmaker("jobs")() as db:
+            await db.execute(delete(Sensor).where(Sensor.serial_number == INGEST_SERIAL))  # 读数 ON DELETE CASCADE
+            await db.execute(delete(Household).where(Household.serial_number == INGEST_SERIAL))
+            await db.commit()
+    FINALIZERS.insert(0, _drop)  # 在关闭应用之前执行
+    return _ctx["sensors"]
+
+
+def _ingest_bench(n: int, mode: str):
+    async def setup():
+        client = await _client()
+        sids = await _ingest_sensors()
+        # 每次调用一批新的 (sensor_id, ts)：从十年前开始按微秒递增，测的是写入而不是去重
+        t = [datetime.now(timezone.utc) - timedelta(days=3650) + timedelta(seconds=n)]
+        us = timedelta(microseconds=1)
+
+        async def one():
+            rows = []
+            for k in range(n):
+                t[0] += us
+                rows.append({"sensor_id": sids[k % len(sids)], "value": 21.5 + k % 7, "ts": t[0].isoformat()})
+            r = await client.post("/ingest", params={"mode": mode}, json=rows)
+            if r.status_code != 200:
+                raise RuntimeError(f"/ingest returned {r.status_code}: {r.text[:200]}")
+        return one
+    return setup
+
+
+for _n in INGEST_BATCH_SIZES:
+    bench(f"ingest.http.live.{_n}", rows=_n)(_ingest_bench(_n, "live"))
+bench("ingest.http.backfill.5000", rows=5000)(_ingest_bench(5000, "backfill"))
+
+
+# -------------------- 图表查询 --------------------
+
+async def _latest_ts() -> datetime:
+    if "latest" in _ctx:
+        return _ctx["latest"]
+    from sqlalchemy import select, func
+    from app.db import registry
+    from app.models import Sensor, SensorReading
+
+    async with registry.sessionmaker("read")() as db:
+        sid = (await db.execute(
+            select(Sensor.id).where(Sensor.serial_number == BENCH_SERIAL, Sensor.type == "co2")
+        )).scalar()
+        latest = None
+        if sid is not None:
+            latest = (await db.execute(select(func.max(SensorReading.ts)).where(SensorReading.sensor_id == sid))).scalar()
+    if latest is None:
+        raise Skip(f"no co2 readings for {BENCH_SERIAL}; seed with python -m app.datagen")
+    _ctx["latest"] = latest
+    return latest
+
+
+def _chart_bench(path: str, days: int, interval: str, extra: dict):
+    async def setup():
+        client = await _client()
+        end = await _latest_ts()
+        body = {
+            "serial_number": BENCH_SERIAL,
+            "start_ts": (end - timedelta(days=days)).isoformat(),
+            "end_ts": end.isoformat(),
+            "interval": interval,
+            "agg": "avg",
+            **extra,
+        }
+
+        async def one():
+            r = await client.post(path, json=body)
+            if r.status_code != 200:
+                raise RuntimeError(f"{path} returned {r.status_code}: {r.text[:200]}")
+        return one
+    return setup
+
+
+for _days, _iv in ((1, "5m"), (7, "1h"), (30, "1h"), (30, "5m"), (365, "1d")):
+    bench(f"charts.metric_timeseries.co2.{_days}d_{_iv}")(
+        _chart_bench("/api/charts/metric_timeseries", _days, _iv, {"metric": "co2"})
+    )
+bench("charts.metric_timeseries.co2.30d_5m_columnar")(
+    _chart_bench("/api/charts/metric_timeseries", 30, "5m", {"metric": "co2", "format": "columnar"})
+)
+bench("charts.multi_timeseries.5_metrics.7d_1h")(
+    _chart_bench("/api/charts/multi_timeseries", 7, "1h", {"metrics": ["temp", "rh", "co2", "pm25", "no2"]})
+)
+# zone / 全网：读预聚合（先 python -m app.rollups rebuild）
+bench("charts.zone_timeseries.co2.30d_1d")(
+    _chart_bench("/api/charts/zone_timeseries", 30, "1d", {"metric": "co2"})
+)
+bench("charts.zone_distribution.pm25.30d")(
+    _chart_bench("/api/charts/zone_distribution", 30, "1h", {"metric": "pm25"})
+)
@@ -0,0 +1,180 @@
+# benchmarks/core.py
+# 注册、计时、结果 JSON 与基线对比。
+#   @bench("codec.decode_lorawan", rows=1) 装饰一个 setup 函数（可以是 async），返回被测的 callable
+#   （sync 或 async）；也可以返回 (callable, cleanup)。setup 缺依赖 / 连不上库时抛 Skip。
+# 计时：先校准循环次数让单轮 >= min_time，再跑 repeats 轮，记录每轮 ns/op；对比看中位数。
+
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+class Skip(Exception):
+    pass
+
+
+@dataclass
+class Bench:
+    name: str
+    setup: object
+    rows: int = 1        # 每次调用处理的行数 / 条数，用来算 ns/row
+    group: str = ""
+
+
+REGISTRY: list[Bench] = []
+FINALIZERS: list = []    # 跑完所有用例后调用（共享的 app / 连接池在这里关掉）
+
+
+def bench(name: str, rows: int = 1):
+    def deco(setup):
+        REGISTRY.append(Bench(name, setup, rows, name.split(".", 1)[0]))
+        return setup
+    return deco
+
+
+async def _maybe_await(x):
+    return await x if inspect.isawaitable(x) else x
+
+
+async def _loop(fn, is_async: bool, n: int) -> float:
+    t0 = time.perf_counter_ns()
+    if is_async:
+        for _ in range(n):
+            await fn()
+    else:
+        for _ in range(n):
+            fn()
+    return time.perf_counter_ns() - t0
+
+
+async def measure(fn, min_time: float, repeats: int) -> dict:
+    is_async = inspect.iscoroutinefunction(fn)
+    await _loop(fn, is_async, 1)  # 预热（导入、缓存、连接）
+    n = 1
+    while True:
+        el = await _loop(fn, is_async, n)
+        if el >= min_time * 1e9 or n >= 1 << 24:
+            break
+        n = max(n * 2, int(n * min_time * 1e9 / max(el, 1) * 1.2))
+    samples = [await _loop(fn, is_async, n) / n for _ in range(repeats)]
+    return {
+        "loops": n,
+        "median_ns": statistics.median(samples),
+        "min_ns": min(samples),
+        "max_ns": max(samples),
+        "stdev_ns": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "host": platform.node(),
+    }
+
+
+async def run(selected: list[Bench], min_time: float, repeats: int, log=print) -> dict:
+    results: dict[str, dict] = {}
+    skipped: dict[str, str] = {}
+    for b in selected:
+        cleanup = None
+        try:
+            made = await _maybe_await(b.setup())
+            fn, cleanup = made if isinstance(made, tuple) else (made, None)
+            r = await measure(fn, min_time, repeats)
+        except (Skip, ImportError) as e:
+            skipped[b.name] = str(e) or type(e).__name__
+            log(f"  {b.name:<44} skipped: {skipped[b.name]}")
+            continue
+        finally:
+            if cleanup is not None:
+                await _maybe_await(cleanup())
+        r["rows"] = b.rows
+        r["ns_per_row"] = r["median_ns"] / b.rows
+        results[b.name] = r
+        log(f"  {b.name:<44} {fmt_ns(r['median_ns']):>10}/op  {fmt_ns(r['ns_per_row']):>10}/row  "
+            f"±{100 * r['stdev_ns'] / max(r['median_ns'], 1e-9):4.1f}%  ({r['loops']} loops)")
+    for fin in reversed(FINALIZERS):
+        await _maybe_await(fin())
+    FINALIZERS.clear()
+    return {"env": environment(), "min_time": min_time, "repeats": repeats, "results": results, "skipped": skipped}
+
+
+def fmt_ns(ns: float) -> str:
+    for unit, div in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if ns >= div:
+            return f"{ns / div:.2f}{unit}"
+    return f"{ns:.0f}ns"
+
+
+def save(doc: dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+
+
+def load(path: str) -> dict:
+    if not os.path.exists(path) and os.path.exists(os.path.join(BASELINE_DIR, path + ".json")):
+        path = os.path.join(BASELINE_DIR, path + ".json")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(base: dict, new: dict, threshold: float, out=sys.stdout) -> list[str]:
+    """
+    按中位数对比。回归判定：new/base > 1 + max(threshold, 基线自身的离散度)，
+    离散度 = (max - min) / median，避免把噪声大的用例误报成回归。返回回归的用例名。
+    """
+    regressions = []
+    be, ne = base.get("env", {}), new.get("env", {})
+    for key in ("host", "python", "machine", "cpu_count"):
+        if be.get(key) != ne.get(key):
+            print(f"warning: {key} differs (baseline {be.get(key)!r}, new {ne.get(key)!r})", file=out)
+    print(f"baseline {be.get('git')} @ {be.get('created_at')}  vs  new {ne.get('git')} @ {ne.get('created_at')}", file=out)
+    print(f"{'benchmark':<44} {'baseline':>10} {'new':>10} {'change':>8}", file=out)
+
+    b_res, n_res = base.get("results", {}), new.get("results", {})
+    for name in sorted(set(b_res) | set(n_res)):
+        b, n = b_res.get(name), n_res.get(name)
+        if b is None:
+            print(f"{name:<44} {'-':>10} {fmt_ns(n['median_ns']):>10} {'new':>8}", file=out)
+            continue
+        if n is None:
+            why = new.get("skipped", {}).get(name, "not run")
+            print(f"{name:<44} {fmt_ns(b['median_ns']):>10} {'-':>10} {'missing':>8}  ({why})", file=out)
+            continue
+        ratio = n["median_ns"] / max(b["median_ns"], 1e-9)
+        noise = (b["max_ns"] - b["min_ns"]) / max(b["median_ns"], 1e-9)
+        mark = ""
+        if ratio > 1 + max(threshold, noise):
+            mark = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - max(threshold, noise):
+            mark = "  faster"
+        print(f"{name:<44} {fmt_ns(b['median_ns']):>10} {fmt_ns(n['median_ns']):>10} {100 * (ratio - 1):+7.1f}%{mark}", file=out)
+    return regressions
@@ -0,0 +1,87 @@
+# test_downsample.py
+# 图表降采样（app/downsample.py）的单元测试：点数预算、超标尖峰保留，numpy 和纯 Python 两条路径都测。
+# cd backend && python -m pytest -q test_downsample.py
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import downsample as ds
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+UPPER = [{"label": "test", "kind": "upper", "value": 100.0}]
+LOWER = [{"label": "test", "kind": "lower", "value": -100.0}]
+
+
+def series(n: int, seed: int = 1, gap_every: int = 0):
+    rng = random.Random(seed)
+    labels, data, t = [], [], T0
+    for i in range(n):
+        # 可选的缺口：时间轴不均匀，minmax 的部分像素列会是空的
+        t += timedelta(minutes=60 if gap_every and i % gap_every == 0 else 1)
+        labels.append(t)
+        data.append(rng.gauss(0.0, 10.0))
+    return labels, data
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def have_numpy(request, monkeypatch):
+    if request.param and not ds.HAVE_NUMPY:
+        pytest.skip("numpy not installed")
+    monkeypatch.setattr(ds, "HAVE_NUMPY", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("method", ds.METHODS)
+@pytest.mark.parametrize("max_points", [3, 4, 5, 6, 7, 50, 999])
+@pytest.mark.parametrize("gap_every", [0, 37])
+def test_point_budget(have_numpy, method, max_points, gap_every):
+    labels, data = series(1000, gap_every=gap_every)
+    out_l, out_d = ds.downsample(labels, data, max_points, method, UPPER)
+    assert 2 <= len(out_d) <= max_points
+    assert len(out_l) == len(out_d)
+    # 首尾固定、时间有序、都是原序列里的点
+    assert out_l[0] == labels[0] and out_l[-1] == labels[-1]
+    assert out_l == sorted(out_l)
+    index = dict(zip(labels, data))
+    assert all(index[t] == v for t, v in zip(out_l, out_d))
+
+
+@pytest.mark.parametrize("method", ds.METHODS)
+def test_short_series_unchanged(have_numpy, method):
+    labels, data = series(10)
+    assert ds.downsample(labels, data, 10, method) == (labels, data)
+    assert ds.downsample(labels, data, 50, method) == (labels, data)
+
+
+@pytest.mark.parametrize("method", ds.METHODS)
+@pytest.mark.parametrize("max_points", [3, 4, 20, 200])
+@pytest.mark.parametrize("lines, spike", [(UPPER, 500.0), (LOWER, -500.0)])
+def test_spike_kept(have_numpy, method, max_points, lines, spike):
+    labels, data = series(5000, seed=3)
+    data[2345] = spike
+    _, out = ds.downsample(labels, data, max_points, method, lines)
+    assert spike in out
+
+
+def test_lttb_keeps_worst_exceedance_in_bucket():
+    if not ds.HAVE_NUMPY:
+        pytest.skip("numpy not installed")
+    # 10 个点压到 4 个：中间两个桶 [1, 5) 和 [5, 9)。第一个桶里全都越线，101 的三角形面积最大，
+    # 但越线最严重的是 150，必须留 150
+    labels = [T0 + timedelta(minutes=i) for i in range(10)]
+    data = [0.0, 101.0, 120.0, 110.0, 150.0, 0.0, 300.0, 300.0, 300.0, 0.0]
+    _, out = ds.downsample(labels, data, 4, "lttb", UPPER)
+    assert 150.0 in out and 101.0 not in out
+
+
+def test_minmax_keeps_envelope(have_numpy):
+    labels, data = series(3000, seed=4)
+    _, out = ds.downsample(labels, data, 100, "minmax")
+    assert max(data) in out and min(data) in out
+
+
+def test_unknown_method():
+    labels, data = series(10)
+    with pytest.raises(ValueError):
+        ds.downsample(labels, data, 5, "mean")
@@ -0,0 +1,88 @@
+# test_home_env_sim.py
+# 模拟器（app/simulation/home_env_sim.py）的单元测试：seek() 与连续运行逐值一致（冷启动 / 命中检查点缓存都一样），
+# snapshot / restore（经过 JSON）往返后输出不变。不需要数据库。
+# cd backend && python -m pytest -q test_home_env_sim.py
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.simulation import home_env_sim as hes
+from app.simulation.home_env_sim import HomeEnvSim
+
+PERIOD = 30  # 粗一点的周期让预热步数少，测试快
+T = datetime(2024, 3, 14, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    hes._SEEK_CACHE.clear()
+    yield
+    hes._SEEK_CACHE.clear()
+
+
+def make(profile="chronic", **kw):
+    return HomeEnvSim(profile=profile, period_minutes=PERIOD, seed=7, home="home-1", **kw)
+
+
+def continuous(profile, start, until):
+    sim = make(profile)
+    out, t = [], start
+    while t < until:
+        out.append((t, sim.next_read(t)))
+        t += timedelta(minutes=PERIOD)
+    return out
+
+
+@pytest.mark.parametrize("profile", ["healthy", "chronic"])
+@pytest.mark.parametrize("offset_h", [0, 9.5, 23.5])
+def test_seek_matches_continuous_run(profile, offset_h):
+    dt = T.replace(hour=0) + timedelta(hours=offset_h)
+    sim = make(profile)
+    sim.seek(dt)
+    got = sim.generate_window(dt, hours=6)
+    want = continuous(profile, sim.seek_start(dt), dt + timedelta(hours=6))
+    assert got == want[-len(got):]
+
+
+def test_seek_from_checkpoint_matches_cold_seek():
+    later = T + timedelta(hours=7, minutes=PERIOD)
+    first = make()
+    first.seek(T)
+    first.generate_window(T, hours=1)
+    # 同一天的第二次 seek 从缓存的检查点起步，结果与清空缓存后的冷启动完全一致
+    warm = make()
+    warm.seek(later)
+    assert len(hes._SEEK_CACHE) == 1
+    got = warm.generate_window(later, hours=3)
+    hes._SEEK_CACHE.clear()
+    cold = make()
+    cold.seek(later)
+    assert got == cold.generate_window(later, hours=3)
+
+
+def test_seek_cache_key_includes_params():
+    a, b = make(), make(daily_battery_drop_mv_mean=200.0)
+    a.seek(T)
+    b.seek(T)
+    assert len(hes._SEEK_CACHE) == 2
+    assert a.next_read(T)["bat_mv"] != b.next_read(T)["bat_mv"]
+
+
+def test_seek_needs_home():
+    with pytest.raises(ValueError):
+        HomeEnvSim(seed=1).seek(T)
+
+
+@pytest.mark.parametrize("home", ["home-1", None])
+def test_snapshot_restore_round_trip(home):
+    sim = HomeEnvSim(profile="chronic", period_minutes=5, seed=3, home=home)
+    t = T
+    for _ in range(500):  # 跨过午夜、带着进行中的事件
+        sim.next_read(t)
+        t += timedelta(minutes=5)
+    snap = json.loads(json.dumps(sim.snapshot()))
+    other = HomeEnvSim(profile="chronic", period_minutes=5, seed=3, home=home)
+    other.restore(snap)
+    assert other.snapshot() == snap
+    assert other.generate_window(t, hours=4) == sim.generate_window(t, hours=4)
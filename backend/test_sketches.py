@@ -0,0 +1,110 @@
+# test_sketches.py
+# DDSketch（app/sketches.py）的单元测试：相对误差上界、负值 / 零、合并的结合律。
+# cd backend && python -m pytest -q test_sketches.py
+import math
+import random
+
+import pytest
+
+from app.sketches import RELATIVE_ACCURACY, bucket_key, merge, parse_percentile, quantile
+
+QS = (0.0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0)
+
+
+def build(values) -> dict[str, int]:
+    sk: dict[str, int] = {}
+    for v in values:
+        k = bucket_key(v)
+        if k is not None:
+            sk[k] = sk.get(k, 0) + 1
+    return sk
+
+
+def exact(values, q):
+    # quantile() 取秩 q·(n-1) 所在的桶，对应排序后下标 floor(q·(n-1)) 的那个值
+    s = sorted(values)
+    return s[int(math.floor(q * (len(s) - 1)))]
+
+
+def assert_close(got, want):
+    assert abs(got - want) <= RELATIVE_ACCURACY * abs(want) + 1e-12, (got, want)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_relative_error_positive(seed):
+    rng = random.Random(seed)
+    values = [rng.lognormvariate(3.0, 1.5) for _ in range(5000)]
+    sk = build(values)
+    for q in QS:
+        assert_close(quantile(sk, q, min(values), max(values)), exact(values, q))
+
+
+def test_relative_error_mixed_signs_and_zero():
+    rng = random.Random(7)
+    values = [rng.gauss(0.0, 20.0) for _ in range(3000)] + [0.0] * 200 + [1e-12] * 50
+    sk = build(values)
+    assert sk["z"] == 250
+    for q in QS:
+        want = exact(values, q)
+        got = quantile(sk, q, min(values), max(values))
+        if abs(want) <= 1e-9:
+            assert got == 0.0
+        else:
+            assert_close(got, want)
+
+
+def test_all_negative():
+    values = [-float(i) for i in range(1, 1001)]
+    sk = build(values)
+    assert all(k.startswith("n") for k in sk)
+    for q in QS:
+        assert_close(quantile(sk, q, min(values), max(values)), exact(values, q))
+
+
+def test_non_finite_values_are_skipped():
+    assert bucket_key(float("nan")) is None
+    assert bucket_key(float("inf")) is None
+    assert bucket_key(float("-inf")) is None
+    assert build([1.0, float("nan"), float("inf")]) == build([1.0])
+
+
+def test_clamped_to_min_max_and_empty():
+    sk = build([10.0] * 5)
+    # 代表值是桶中点，单一取值时靠 min / max 夹回原值
+    assert quantile(sk, 0.5, 10.0, 10.0) == 10.0
+    assert quantile({}, 0.5) is None
+
+
+def test_merge_is_associative_and_commutative():
+    rng = random.Random(11)
+    parts = [[rng.uniform(-50, 500) for _ in range(rng.randint(1, 400))] for _ in range(3)]
+    a, b, c = (build(p) for p in parts)
+    left = merge(merge(dict(a), b), c)
+    right = merge(dict(a), merge(dict(b), c))
+    swapped = merge(merge(dict(c), a), b)
+    assert left == right == swapped == build(parts[0] + parts[1] + parts[2])
+
+
+def test_merged_quantiles_match_single_sketch():
+    rng = random.Random(5)
+    hours = [[rng.lognormvariate(1.0, 0.5) for _ in range(60)] for _ in range(24)]
+    merged: dict[str, int] = {}
+    for h in hours:
+        merge(merged, build(h))
+    values = [v for h in hours for v in h]
+    for q in QS:
+        assert_close(quantile(merged, q, min(values), max(values)), exact(values, q))
+
+
+def test_merge_accepts_json_text():
+    assert merge({"p1": 2}, '{"p1": 3, "z": 1}') == {"p1": 5, "z": 1}
+
+
+def test_parse_percentile():
+    assert parse_percentile("p95") == 0.95
+    assert parse_percentile("P99.9") == pytest.approx(0.999)
+    assert parse_percentile("p100") == 1.0
+    assert parse_percentile("avg") is None
+    assert parse_percentile(None) is None
+    with pytest.raises(ValueError):
+        parse_percentile("p999")
@@ -8,7 +8,7 @@ function formatISO(d: Date) {
   return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())}T${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`
 }
 
-type Agg = 'avg' | 'min' | 'max' | 'last' | 'sum'
+type Agg = 'avg' | 'min' | 'max' | 'last' | 'sum' | 'p50' | 'p95' | 'p99'
 type RangeOpt = '6h' | '12h' | '24h'
 
 // 本地找序列号的兜底逻辑：字段优先级 serial_number > meta.serial_number > meta.serial > meta.sn
@@ -22,6 +22,9 @@ function getSerial(s: Sensor): string {
   return ''
 }
 
+// 每条曲线最多取这么多点（后端 LTTB 降采样，阈值线以外的尖峰会保留）
+const MAX_POINTS = 1000
+
 // （可选）前端展示名映射；key 要与后端 /api/charts/metrics 对齐
 const LABELS: Record<string, string> = {
   temp: '温度',
@@ -154,6 +157,7 @@ export default function ChartsPanel({
         end_ts: formatISO(end),
         interval,
         agg,
+        max_points: MAX_POINTS,
         title: `${(LABELS[metric] ?? metric.toUpperCase())} (${interval}, ${agg})`,
       }
 
@@ -240,6 +244,9 @@ export default function ChartsPanel({
               <option value="max">max</option>
               <option value="last">last</option>
               <option value="sum">sum</option>
+              <option value="p50">p50</option>
+              <option value="p95">p95</option>
+              <option value="p99">p99</option>
             </select>
           </div>
 
@@ -0,0 +1,100 @@
+# fake_gateway.py
+# 本地假网关：用 Semtech UDP packet-forwarder 协议把模拟盒子的 22 字节帧推给后端（LORA_UDP_PORT）。
+#   python scripts/fake_gateway.py --port 1700 --boxes 50 --interval 5 --rounds 10
+# --mac 时把帧包进 LoRaWAN MAC 头（MHDR|FHDR|FPort|payload|MIC），测试服务端的剥头逻辑。
+# 服务端要能把设备对到已开通的盒子才会入库：第 i 个盒子的设备标识是 DevAddr 2600000i（--mac）或 u16 serial 1000+i，
+# 写进 LORA_DEVICE_MAP 文件（{"26000000": "SN-...", "1000": "SN-..."}）或该盒子传感器的 meta.lora_id。
+
+import argparse, base64, json, os, random, socket, struct, sys, time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from app.simulation.home_env_sim import HomeEnvSim  # noqa: E402
+from app.simulation.lorawan_encode import encode_lorawan  # noqa: E402
+
+PUSH_DATA, PUSH_ACK, PULL_DATA, PULL_ACK = 0x00, 0x01, 0x02, 0x04
+GATEWAY_EUI = bytes.fromhex("AA555A0000000001")
+
+
+def wrap_mac(payload: bytes, devaddr: int, fcnt: int) -> bytes:
+    # 未确认上行 MHDR=0x40；FCtrl=0（无 FOpts）；FPort=1；MIC 用随机 4 字节占位
+    return bytes([0x40]) + struct.pack("<IBH", devaddr, 0, fcnt & 0xFFFF) + bytes([1]) + payload + os.urandom(4)
+
+
+def push_packet(token: int, rxpk: list[dict]) -> bytes:
+    body = json.dumps({"rxpk": rxpk}).encode("utf-8")
+    return bytes([2]) + struct.pack(">H", token) + bytes([PUSH_DATA]) + GATEWAY_EUI + body
+
+
+def pull_packet(token: int) -> bytes:
+    return bytes([2]) + struct.pack(">H", token) + bytes([PULL_DATA]) + GATEWAY_EUI
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake Semtech UDP packet-forwarder")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=1700)
+    ap.add_argument("--boxes", type=int, default=10)
+    ap.add_argument("--interval", type=float, default=5.0, help="seconds between rounds")
+    ap.add_argument("--rounds", type=int, default=0, help="0 = run forever")
+    ap.add_argument("--per-packet", type=int, default=8, help="rxpk entries per PUSH_DATA")
+    ap.add_argument("--profile", default="intermittent")
+    ap.add_argument("--mac", action="store_true", help="wrap frames in a LoRaWAN MAC header")
+    args = ap.parse_args()
+
+    sims = [HomeEnvSim(profile=args.profile, period_minutes=1, serial=1000 + i, seed=i) for i in range(args.boxes)]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(1.0)
+    addr = (args.host, args.port)
+    token = random.randrange(1 << 16)
+    sent = acked = 0
+    rnd = 0
+
+    while args.rounds == 0 or rnd < args.rounds:
+        t0 = time.time()
+        token = (token + 1) & 0xFFFF
+        sock.sendto(pull_packet(token), addr)
+
+        now = datetime.now(timezone.utc)
+        rxpk = []
+        for i, sim in enumerate(sims):
+            frame = encode_lorawan(sim.next_read(now))
+            phy = wrap_mac(frame, 0x26000000 + i, rnd) if args.mac else frame
+            rxpk.append({
+                "time": now.isoformat().replace("+00:00", "Z"),
+                "tmst": int(time.monotonic() * 1e6) & 0xFFFFFFFF,
+                "freq": 868.1, "chan": 0, "rfch": 0, "stat": 1,
+                "modu": "LORA", "datr": "SF7BW125", "codr": "4/5",
+                "rssi": -random.randint(40, 110), "lsnr": round(random.uniform(-5, 10), 1),
+                "size": len(phy), "data": base64.b64encode(phy).decode("ascii"),
+            })
+
+        pending = set()
+        for k in range(0, len(rxpk), args.per_packet):
+            token = (token + 1) & 0xFFFF
+            sock.sendto(push_packet(token, rxpk[k:k + args.per_packet]), addr)
+            pending.add(token)
+            sent += len(rxpk[k:k + args.per_packet])
+
+        # 收 ACK（PUSH_ACK / PULL_ACK）
+        deadline = time.time() + 1.0
+        while pending and time.time() < deadline:
+            try:
+                data, _ = sock.recvfrom(64)
+            except socket.timeout:
+                break
+            if len(data) >= 4 and data[3] == PUSH_ACK:
+                tok = struct.unpack(">H", data[1:3])[0]
+                if tok in pending:
+                    pending.discard(tok)
+        acked_round = (len(rxpk) + args.per_packet - 1) // args.per_packet - len(pending)
+        acked += acked_round
+        print(time.strftime("[%H:%M:%S]"), f"round {rnd}: {len(rxpk)} uplinks, "
+              f"{acked_round} PUSH_ACK, {len(pending)} missing (total uplinks {sent})")
+
+        rnd += 1
+        time.sleep(max(0.0, args.interval - (time.time() - t0)))
+
+
+if __name__ == "__main__":
+    main()